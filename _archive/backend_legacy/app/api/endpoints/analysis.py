@@ -1,53 +1,36 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel, Field
-from typing import List, Optional, Literal
-import google.generativeai as genai
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from typing import List, Optional, Tuple
+import asyncio
 import os
 import json
 import logging
-from datetime import datetime
-from app.core.calculations import calculator, ChartData
+import time
+from datetime import date, datetime
+from app.core.calculations import get_calculator, ChartData
+from app.core.analysis_cache import analysis_cache, analysis_key, Computed
+from app.core.llm_gateway import get_llm_gateway
+from app.core.stage_graph import Stage, StageGraph, server_timing
+from app.core.json_stream import JSONStringFieldExtractor
+from app.core.daily_reads import lookup_daily_read
+from app.core.analysis import (
+    BioMetricProfile, DefragAnalysis, build_analysis_prompt, build_deterministic_analysis
+)
+from app.core.audio import AudioQueueFull, get_audio_jobs, audio_url
+from app.core.chart_store import bio_key, chart_summary
+from app.core.user_store import chart_from_record, get_user_records
+
+# A fallback served because the LLM failed is only reused briefly, so the next
+# refresh gets another chance at the full narrative
+FALLBACK_RETRY_TTL = 60
+
+BERLIN = (52.52, 13.40) # Default location when geocoding fails
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# --- Models ---
-class DailyLesson(BaseModel):
-    topic: str = Field(..., description="Title of the concept being explained")
-    content: str = Field(..., description="Educational content explaining the 'WHY'")
-    visual_symbol: Literal['SPIRAL', 'TUNNEL', 'LATTICE', 'WEB', 'MANDALA'] = Field(..., description="Abstract visualizer symbol")
-    knowledge_key: Optional[str] = Field(None, description="Key for deep dive content: FORM_CONSTANTS, INDIVIDUATION, MECHANICS, KAIROS")
-
-class RelationalGeometry(BaseModel):
-    architecture: str = Field(..., description="Structural description of relationship dynamic")
-    tension_node: str = Field(..., description="Specific source of stress")
-    resolution: str = Field(..., description="Structural advice to resolve tension")
-
-class DefragAnalysis(BaseModel):
-    system_status: Literal['OPTIMAL', 'RECALIBRATING', 'ANALYZING']
-    integrity_score: int = Field(..., ge=0, le=100)
-    headline: str = Field(..., description="Engaging, magazine-style title")
-    narrative: str = Field(..., description="Main analysis text")
-    daily_lesson: DailyLesson
-    protocol: str = Field(..., description="Actionable task")
-    relational_geometry: RelationalGeometry
-    relational_geometry: RelationalGeometry
-    audio_url: Optional[str] = None
-    forecast: List[dict] = [] # List of ForecastEvent
-
-
-class BioMetricProfile(BaseModel):
-    name: str
-    birthDate: str
-    birthTime: str
-    birthLocation: str # "City, Country" or "Lat,Lon" - for MVP we might need lat/lon or geocoding
-    # Optional inputs if user knows them, but we prefer calculation
-    designType: Optional[str] = None
-    enneagram: Optional[str] = None
-    # Hidden fields for geocoding fallback
-    latitude: Optional[float] = None
-    longitude: Optional[float] = None
-
 # --- Mock Data ---
 MOCK_ANALYSIS = {
     "system_status": 'ANALYZING',
@@ -67,200 +50,331 @@ MOCK_ANALYSIS = {
     }
 }
 
-# --- Dependencies ---
-def get_genai_model():
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        logger.warning("GOOGLE_API_KEY not found. Using mock mode.")
-        return None
-
-    genai.configure(api_key=api_key)
-    # Safety Settings to block harmful content
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    ]
-    return genai.GenerativeModel('gemini-2.0-flash', safety_settings=safety_settings)
-
 # --- Endpoints ---
+# Per-stage timeouts (seconds). The LLM stage sits above the gateway's own timeout.
+STORED_CHART_TIMEOUT = 2
+GEOCODE_TIMEOUT = 5
+CHART_TIMEOUT = 5
+LLM_STAGE_TIMEOUT = 25
+FORECAST_TIMEOUT = 5
+AUDIO_TIMEOUT = 10
+# Seconds to wait before retrying when the TTS queue is full
+AUDIO_BUSY_RETRY_AFTER = 5
+
 @router.post("/analyze", response_model=DefragAnalysis)
-async def generate_analysis(profile: BioMetricProfile):
-    model = get_genai_model()
+async def generate_analysis(profile: BioMetricProfile, response: Response):
+    r"""
+    Runs the analysis as a stage graph:
+
+        user_chart -> geocode -> chart -> llm ------> narrative -> audio
+                                      \-> forecast ----------------/
+
+    Forecast runs alongside the LLM and audio. Timings for every stage are
+    returned in the Server-Timing header.
+    Signed-in users are served today's read from the nightly job when there is
+    one, and otherwise their stored natal chart (geocode is then skipped).
+    """
+    read = await stored_read(profile)
+    if read is not None:
+        response.headers["Server-Timing"] = 'store;desc="hit"'
+        return read["analysis"]
 
     # 1. Perform Calculation (Real Math)
-    chart = None
+    resolved = await StageGraph(chart_stages(profile)).run()
+    chart = resolved["chart"].value
+
+    # Same profile, chart and day -> same analysis. Serve repeats from cache and
+    # let concurrent duplicates share one computation.
+    synthesized = {}
+
+    async def compute() -> Computed:
+        results = await StageGraph(synthesis_stages(profile, chart)).run()
+        synthesized.update(results)
+        if isinstance(results["audio"].exception, AudioQueueFull):
+            # Not cached: a retry once the queue drains gets the audio too
+            raise results["audio"].exception
+        data = dict(results["narrative"].value, forecast=results["forecast"].value, audio_url=results["audio"].value)
+        llm = results["llm"]
+        if llm.value is not None:
+            return Computed(data, llm_seconds=llm.seconds)
+        llm_failed = llm.status != "ok"
+        return Computed(data, ttl=FALLBACK_RETRY_TTL if llm_failed else None)
+
+    key = analysis_key(profile.name, profile.designType, profile.enneagram, chart)
     try:
-        # Determine Lat/Lon
-        lat, lon = 52.52, 13.40 # Berlin Default
-
-        if profile.latitude and profile.longitude:
-            lat, lon = profile.latitude, profile.longitude
-        elif profile.birthLocation:
-            lat, lon = calculator.get_lat_lon(profile.birthLocation)
+        data = await analysis_cache.get_or_compute(key, compute)
+    except AudioQueueFull:
+        raise HTTPException(status_code=503, detail="Audio queue is full, retry shortly",
+                            headers={"Retry-After": str(AUDIO_BUSY_RETRY_AFTER)})
+    if not synthesized:
+        refresh_audio(data)
+
+    timing = server_timing(resolved)
+    timing += ", " + (server_timing(synthesized) if synthesized else 'cache;desc="hit"')
+    response.headers["Server-Timing"] = timing
+    return data
 
-        # Parse Dates
-        try:
-            bd = datetime.strptime(f"{profile.birthDate} {profile.birthTime}", "%Y-%m-%d %H:%M")
-        except ValueError:
-             # Fallback for date parsing if generic string
-             bd = datetime.now()
+async def stored_read(profile: BioMetricProfile) -> Optional[dict]:
+    if not profile.userId:
+        return None
+    return await run_in_threadpool(lookup_daily_read, profile.userId, date.today().isoformat(), profile)
+
+@router.get("/analyze/cache/stats")
+async def get_analysis_cache_stats():
+    return analysis_cache.stats()
+
+# --- Streaming Variant ---
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/analyze/stream")
+async def stream_analysis(profile: BioMetricProfile):
+    """
+    Server-Sent Events variant of /analyze. The chart goes out as soon as it is
+    calculated, instead of after the full LLM round trip. Events:
+
+        chart      {"chart": {...}, "headline": "..."}    first, deterministic headline
+        narrative  {"delta": "..."}                       LLM narrative as it streams
+        narrative  {"text": "...", "replace": true}       full narrative (cache hit or deterministic fallback)
+        forecast   [ForecastEvent, ...]
+        audio      {"audio_url": ...}
+        analysis   DefragAnalysis                         last, validated
+    """
+    return StreamingResponse(
+        analysis_events(profile),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        chart = calculator.calculate(bd, lat, lon)
+async def stream_llm_analysis(profile: BioMetricProfile, chart: Optional[ChartData],
+                              queue: asyncio.Queue) -> Tuple[Optional[dict], float, bool]:
+    """
+    Streams the LLM analysis, pushing narrative deltas onto queue as they arrive.
+    Returns (parsed analysis or None, llm seconds, whether the LLM failed).
+    """
+    gateway = get_llm_gateway()
+    if not gateway or not chart:
+        return None, 0.0, False
+
+    started = time.perf_counter()
+    extractor = JSONStringFieldExtractor("narrative")
+    parts = []
+    try:
+        async for chunk in gateway.stream(build_analysis_prompt(profile, chart), route="analyze", json_mode=True):
+            parts.append(chunk)
+            delta = extractor.feed(chunk)
+            if delta:
+                await queue.put(("narrative", {"delta": delta}))
+        return json.loads("".join(parts)), time.perf_counter() - started, False
     except Exception as e:
-        logger.error(f"Calculation failed: {e}")
-
-    # 2. AI Synthesis (with Fallback)
-    if model and chart:
+        logger.error(f"AI streaming failed, falling back to deterministic: {e}")
+        return None, 0.0, True
+
+async def analysis_events(profile: BioMetricProfile):
+    read = await stored_read(profile)
+    if read is not None:
+        analysis = read["analysis"]
+        yield sse_event("chart", {"chart": read.get("chart"), "headline": analysis["headline"]})
+        yield sse_event("narrative", {"text": analysis["narrative"], "replace": True})
+        yield sse_event("forecast", analysis.get("forecast", []))
+        yield sse_event("audio", {"audio_url": analysis.get("audio_url")})
+        yield sse_event("analysis", analysis)
+        return
+
+    resolved = await StageGraph(chart_stages(profile)).run()
+    chart = resolved["chart"].value
+    deterministic = build_deterministic_analysis(chart)
+    yield sse_event("chart", {"chart": chart_summary(chart), "headline": deterministic["headline"]})
+
+    key = analysis_key(profile.name, profile.designType, profile.enneagram, chart)
+    cached = analysis_cache.get(key)
+    if cached is None:
+        # Someone (/analyze or another stream) is already computing it: share their result
+        inflight = analysis_cache.inflight(key)
+        if inflight is not None:
+            cached = await analysis_cache.join(inflight)
+    if cached is not None:
+        refresh_audio(cached)
+        yield sse_event("narrative", {"text": cached["narrative"], "replace": True})
+        yield sse_event("forecast", cached.get("forecast", []))
+        yield sse_event("audio", {"audio_url": cached.get("audio_url")})
+        yield sse_event("analysis", cached)
+        return
+
+    # Producers push events as they complete; None marks the computation as finished
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce_forecast():
         try:
-            today = datetime.now().strftime("%B %d, %Y")
-            chart_context = f"""
-            CALCULATED BIO-METRICS (EXACT):
-            - Sun: Gate {chart.sun.gate}.{chart.sun.line} ({chart.sun.zodiac_sign})
-            - Earth: Gate {chart.earth.gate}.{chart.earth.line} ({chart.earth.zodiac_sign})
-            - Moon: Gate {chart.moon.gate}.{chart.moon.line} ({chart.moon.zodiac_sign})
-            - Nodes: {chart.north_node.gate}.{chart.north_node.line} / {chart.south_node.gate}.{chart.south_node.line}
-            """
-
-            prompt = f"""
-            You are DEFRAG, an abstract 'Cognitive Operating System'.
-
-            PHILOSOPHICAL FOUNDATION:
-            Synthesize Bressloff/Cowan (Visual Form Constants) and Jungian Archetypes.
-
-            User Profile:
-            - Name: {profile.name}
-            - Type: {profile.designType or 'Unknown'}
-            - Enneagram: {profile.enneagram or 'Unknown'}
-            {chart_context}
-
-            Date: {today}
-
-            CRITICAL DIRECTIVES:
-            1. NO DIAGNOSIS. NO DOGMA.
-            2. TONE: "Cyber-Noir" meets "Radical Hope". Systems Architect.
-            3. USE: "Signal," "Noise," "Architecture," "Vector," "Bifurcation."
-            4. KNOWLEDGE KEY: Select one: 'FORM_CONSTANTS', 'INDIVIDUATION', 'MECHANICS', 'KAIROS'.
-
-            Output JSON structure (DefragAnalysis model):
-            {{
-                "system_status": "OPTIMAL",
-                "integrity_score": 85,
-                "headline": "Abstract Title",
-                "narrative": "Three paragraphs: Form Constant, Shadow, Recalibration.",
-                "daily_lesson": {{
-                    "topic": "Gate Theme",
-                    "content": "Why this matters.",
-                    "visual_symbol": "SPIRAL",
-                    "knowledge_key": "FORM_CONSTANTS"
-                }},
-                "protocol": "Actionable task.",
-                "relational_geometry": {{
-                    "architecture": "Connection style",
-                    "tension_node": "Stress point",
-                    "resolution": "Fix"
-                }}
-            }}
-            """
-
-            response = model.generate_content(prompt, generation_config=genai.types.GenerationConfig(response_mime_type="application/json"))
-            if response.text:
-                data = json.loads(response.text)
-                if 'narrative' in data:
-                     data['audio_url'] = generate_audio_overview(data['narrative'])
-
-                # Append Calculated Forecast (Hybrid Approach: AI Narrative + Math Forecast)
-                data['forecast'] = [event.dict() for event in calculator.get_forecast(chart)]
-                return data
+            value = await asyncio.wait_for(compute_forecast(chart), FORECAST_TIMEOUT)
         except Exception as e:
-            logger.error(f"AI Generation failed, falling back to deterministic: {e}")
-
-    # 3. Deterministic Fallback (Rule-Based AI)
-    # Uses the calculated chart to generate "Insight" even without the LLM
-
-    # Default values if chart calculation failed entirely
-    sun_gate = chart.sun.gate if chart else 1
-    sun_line = chart.sun.line if chart else 1
-    sun_sign = chart.sun.zodiac_sign if chart else "Entropy"
-
-    earth_gate = chart.earth.gate if chart else 2
-
-    moon_gate = chart.moon.gate if chart else 3
-    moon_sign = chart.moon.zodiac_sign if chart else "Flux"
-
-    venus_gate = chart.venus.gate if chart else 4
-    mars_gate = chart.mars.gate if chart else 5
-    north_node_gate = chart.north_node.gate if chart else 6
+            logger.error(f"Forecast failed: {e}")
+            value = []
+        await queue.put(("forecast", value))
+        return value
 
-    # Deterministic Narrative Construction
-    visual_symbols = ['SPIRAL', 'TUNNEL', 'LATTICE', 'WEB', 'MANDALA']
-    selected_symbol = visual_symbols[sun_gate % len(visual_symbols)]
-
-    narrative_text = (
-        f"Your Core Architecture is anchored in **Gate {sun_gate}** ({sun_sign}). In the Bressloff-Cowan model, this frequency generates a specific form constant in your cognitive field—a structure that organizes how you process 'Signal' versus 'Noise'.\n\n"
-        f"The shadow system currently manifests through **Gate {earth_gate}** (The Earth Vector). Unintegrated, this creates a 'Grounding Fault'—tension between the expanding light of the Sun ({sun_gate}) and the gravitational pull of the Earth.\n\n"
-        f"Your emotional heuristics are driven by **Gate {moon_gate}** ({moon_sign}). To recalibrate, shift your trajectory towards **Gate {north_node_gate}**. This is your vector of evolution. Align with Line {sun_line} to dissolve resistance."
-    )
-
-    data = {
-        "system_status": 'OPTIMAL' if chart else 'RECALIBRATING',
-        "integrity_score": (sun_gate + earth_gate + moon_gate) % 100,
-        "headline": f"The Geometry of Gate {sun_gate}",
-        "narrative": narrative_text,
-        "daily_lesson": {
-            "topic": f"Gate {sun_gate}: The Solar Vector",
-            "content": f"This gate in {sun_sign} concerns your primary output function. It is the 'What' of your life force. Optimizing this frequency reduces drag on your decision-making.",
-            "visual_symbol": selected_symbol,
-            "knowledge_key": "MECHANICS"
-        },
-        "protocol": f"Observe Gate {sun_gate} today. If you feel friction ({mars_gate}), it is likely the Moon ({moon_gate}) pulling focus. Re-center by grounding into Gate {earth_gate}.",
-        "relational_geometry": {
-            "architecture": f"Venussian Resonance {venus_gate}",
-            "tension_node": f"Martian Vector {mars_gate}",
-            "resolution": f"Solar Alignment {sun_gate}"
-        },
-        "audio_url": None,
-        "forecast": [event.dict() for event in calculator.get_forecast(chart)] if chart else []
-    }
+    async def produce_narrative():
+        data, llm_seconds, llm_failed = await stream_llm_analysis(profile, chart, queue)
+        try:
+            data = DefragAnalysis(**dict(data, audio_url=None, forecast=[])).model_dump() if data else None
+        except ValidationError as e:
+            logger.error(f"AI analysis failed validation, falling back to deterministic: {e}")
+            data, llm_seconds, llm_failed = None, 0.0, True
+        if data is None:
+            data = deterministic
+            await queue.put(("narrative", {"text": data["narrative"], "replace": True}))
+        try:
+            audio_url = await asyncio.wait_for(compute_audio(data.get("narrative")), AUDIO_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Audio failed: {e}")
+            audio_url = None
+        await queue.put(("audio", {"audio_url": audio_url}))
+        return dict(data, audio_url=audio_url), llm_seconds, llm_failed
 
-    # Try to generate audio even for deterministic content
-    # valid content is passed, so if API key exists, it should work (or return mock)
+    async def compute() -> Computed:
+        try:
+            forecast, (data, llm_seconds, llm_failed) = await asyncio.gather(produce_forecast(), produce_narrative())
+            analysis = DefragAnalysis(**dict(data, forecast=forecast)).model_dump()
+            return Computed(analysis, llm_seconds=llm_seconds, ttl=FALLBACK_RETRY_TTL if llm_failed else None)
+        finally:
+            await queue.put(None)
+
+    # Registered as in flight, so concurrent /analyze calls and streams for
+    # the same key wait for this one instead of calling the LLM again. It runs
+    # as its own task: a client disconnecting mid-stream doesn't cancel it.
+    task = analysis_cache.start(key, compute)
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        yield sse_event(*item)
+    analysis = (await asyncio.shield(task)).value
+    yield sse_event("analysis", analysis)
+
+def resolve_location(profile: BioMetricProfile) -> Tuple[float, float]:
+    # Determine Lat/Lon
+    if profile.latitude and profile.longitude:
+        return profile.latitude, profile.longitude
+    if profile.birthLocation:
+        return get_calculator().get_lat_lon(profile.birthLocation)
+    return BERLIN
+
+def parse_birth_datetime(profile: BioMetricProfile) -> datetime:
     try:
-        data['audio_url'] = generate_audio_overview(narrative_text)
-    except Exception:
-        pass # Keep as None if fails
+        return datetime.strptime(f"{profile.birthDate} {profile.birthTime}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        # Fallback for date parsing if generic string
+        return datetime.now()
+
+def load_stored_chart(profile: BioMetricProfile) -> Optional[ChartData]:
+    """
+    The chart stored on the user's document (backfilled if missing), provided
+    the posted birth data is the stored one.
+    """
+    record = get_user_records([profile.userId]).get(profile.userId)
+    if not record:
+        return None
+    bio = record.get("bioMetrics") or {}
+    posted = profile.model_dump()
+    if profile.latitude is None or profile.longitude is None:
+        # No coordinates posted: the stored ones were geocoded from the same location
+        posted.update(latitude=bio.get("latitude"), longitude=bio.get("longitude"))
+    if bio_key(bio) != bio_key(posted):
+        return None
+    return chart_from_record(record, backfill=True)
+
+def chart_stages(profile: BioMetricProfile) -> List[Stage]:
+    async def user_chart():
+        # Signed-in users have their chart on their user document: no geocoding
+        if not profile.userId:
+            return None
+        return await run_in_threadpool(load_stored_chart, profile)
+
+    async def geocode(user_chart):
+        if user_chart is not None:
+            return None
+        # Geocoding is a blocking network call
+        return await run_in_threadpool(resolve_location, profile)
+
+    async def chart(user_chart, geocode):
+        if user_chart is not None:
+            return user_chart
+        lat, lon = geocode
+        def calculate():
+            # The posted birth time is local to the birth place, as in app.core.chart_store
+            calculator = get_calculator()
+            return calculator.calculate(calculator.to_utc(parse_birth_datetime(profile), lat, lon)[0], lat, lon)
+        # The timezone lookup may load timezonefinder's polygon data
+        return await run_in_threadpool(calculate)
+
+    return [
+        Stage("user_chart", user_chart, timeout=STORED_CHART_TIMEOUT, fallback=None),
+        Stage("geocode", geocode, deps=["user_chart"], timeout=GEOCODE_TIMEOUT, fallback=BERLIN),
+        Stage("chart", chart, deps=["user_chart", "geocode"], timeout=CHART_TIMEOUT, fallback=None),
+    ]
 
-    return data
+def synthesis_stages(profile: BioMetricProfile, chart: Optional[ChartData]) -> List[Stage]:
+    async def llm():
+        # 2. AI Synthesis. The gateway raises immediately while its circuit is open,
+        # so a failing provider costs nothing before we fall back.
+        gateway = get_llm_gateway()
+        if not gateway or not chart:
+            return None
+        text = await gateway.generate(build_analysis_prompt(profile, chart), route="analyze", json_mode=True)
+        return json.loads(text) if text else None
+
+    async def narrative(llm):
+        # Hybrid Approach: AI Narrative when available, deterministic otherwise
+        return llm if llm is not None else build_deterministic_analysis(chart)
+
+    async def forecast():
+        return await compute_forecast(chart)
+
+    async def audio(narrative):
+        return await compute_audio(narrative.get("narrative"))
+
+    return [
+        Stage("llm", llm, timeout=LLM_STAGE_TIMEOUT, fallback=None),
+        Stage("narrative", narrative, deps=["llm"]),
+        Stage("forecast", forecast, timeout=FORECAST_TIMEOUT, fallback=[]),
+        Stage("audio", audio, deps=["narrative"], timeout=AUDIO_TIMEOUT, fallback=None),
+    ]
+
+async def compute_forecast(chart: Optional[ChartData]) -> List[dict]:
+    # Append Calculated Forecast (Math Forecast, independent of the LLM)
+    if not chart:
+        return []
+    events = await run_in_threadpool(get_calculator().get_forecast, chart)
+    return [event.model_dump() for event in events]
+
+async def compute_audio(text: Optional[str]) -> Optional[str]:
+    # Only hashes and enqueues, cheap enough to stay on the event loop
+    return generate_audio_overview(text) if text else None
+
+def refresh_audio(analysis: dict):
+    # A cached analysis keeps its audio_url; requeue the audio if it failed or went missing
+    jobs = get_audio_jobs()
+    if jobs and analysis.get("audio_url") and analysis.get("narrative"):
+        try:
+            jobs.refresh(analysis["narrative"])
+        except Exception as e:
+            logger.error(f"Audio refresh failed: {e}")
 
 # --- Audio Generation ---
 def generate_audio_overview(text: str) -> Optional[str]:
-    api_key = os.getenv("ELEVENLABS_API_KEY")
-    if not api_key:
+    """
+    URL of the narrative audio. Synthesis is queued, not awaited: the URL
+    answers 202 until the file is ready. None when no TTS provider is configured.
+    Raises AudioQueueFull when the TTS queue is saturated.
+    """
+    jobs = get_audio_jobs()
+    if not jobs:
         return None
 
     try:
-        client = ElevenLabs(api_key=api_key)
-        # Using a default "Cyber-Noir" style voice ID or a reliable pre-made one (e.g., 'Rachel' or similar for now)
-        # Ideally, this should be configurable. Using 'JBFqnCBsd6RMkjVDRZzb' (George) for a deep, authoritative tone,
-        # or '21m00Tcm4TlvDq8ikWAM' (Rachel) as fallback. Let's use a known stable ID.
-        # For now, we will return a mock URL if we can't actually save the file to a public bucket,
-        # but the request was "audio over", implying we want the data.
-        # Generating audio stream...
-
-        # Audio generation logic (Mocked for safety unless key is present to avoid errors in this turn)
-        # In a real deploy, we'd upload this to GCS/S3 and return the URL.
-        # For this implementation, let's assume we return a URL to a cloud function or similar,
-        # BUT since we don't have that, let's just log it and return a placeholder
-        # that the frontend can use to *request* the audio via a separate endpoint if needed,
-        # OR return a base64 string if short. Narrative is 3 paragraphs (~1 min), manageable as base64 but large JSON.
-
-        # Better approach: The frontend will call a specific audio endpoint or we link to it.
-        # However, to satisfy "Daily Read needs audio over", let's populate the field using a separate endpoint approach
-        # to keep the JSON light, or just return the URL if ElevenLabs hosts it (they don't persist long term).
-
-        return "https://elevenlabs.io/api/mock/audio/defrag_overview.mp3" # Placeholder for now unless we implement full storage
-
+        return audio_url(jobs.request(text))
+    except AudioQueueFull:
+        raise
     except Exception as e:
         logger.error(f"Audio generation failed: {e}")
         return None
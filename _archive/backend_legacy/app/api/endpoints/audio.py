@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+import logging
+from app.core.audio import get_audio_jobs, AUDIO_KEY_PATTERN
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Seconds a client should wait before polling a pending file again
+PENDING_RETRY_AFTER = 2
+
+def _jobs_for(key: str):
+    if not AUDIO_KEY_PATTERN.match(key):
+        raise HTTPException(status_code=404, detail="Unknown audio")
+    jobs = get_audio_jobs()
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Audio is not enabled")
+    return jobs
+
+@router.get("/{key}.mp3")
+async def get_audio(key: str):
+    """
+    Finished audio, with Range support (206 partial content) so players can
+    start before the download completes. 202 while synthesis is still running.
+    """
+    jobs = _jobs_for(key)
+    status = jobs.status(key)
+    if status == "pending":
+        return JSONResponse({"status": status}, status_code=202, headers={"Retry-After": str(PENDING_RETRY_AFTER)})
+    if status != "ready":
+        raise HTTPException(status_code=404, detail=f"Audio {status}")
+    return FileResponse(
+        jobs.store.file_for(key),
+        media_type="audio/mpeg",
+        # Content-addressed, so a given URL never changes
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@router.get("/{key}/status")
+async def get_audio_status(key: str):
+    return {"status": _jobs_for(key).status(key)}
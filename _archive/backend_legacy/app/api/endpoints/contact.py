@@ -1,6 +1,9 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr
 import logging
+import os
+from app.core.outbox import get_outbox, get_outbox_worker
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -10,24 +13,35 @@ class ContactRequest(BaseModel):
     email: EmailStr
     message: str
 
-# Configuration (In a real app, these would be env vars)
-ADMIN_EMAIL = "chadowen93@gmail.com"
+# Destination stays server-side, never exposed to the frontend
+ADMIN_EMAIL = os.getenv("CONTACT_ADMIN_EMAIL", "chadowen93@gmail.com")
 
-def send_email_task(contact: ContactRequest):
-    # This is a mock function. In production, integrate with SES, SendGrid, or SMTP.
-    # We are logging it as requested, ensuring the destination email is not exposed in the frontend.
-    logger.info(f"--- NEW CONTACT FORM SUBMISSION ---")
-    logger.info(f"FROM: {contact.name} <{contact.email}>")
-    logger.info(f"TO: {ADMIN_EMAIL}")
-    logger.info(f"MESSAGE: {contact.message}")
-    logger.info(f"-----------------------------------")
+def queue_contact_email(contact: ContactRequest) -> int:
+    # The name goes into the Subject header: CR/LF would make it unsendable
+    name = " ".join(contact.name.split())
+    message_id = get_outbox().enqueue(
+        recipient=ADMIN_EMAIL,
+        subject=f"Contact form: {name}",
+        body=f"FROM: {name} <{contact.email}>\n\n{contact.message}\n",
+        reply_to=contact.email
+    )
+    worker = get_outbox_worker()
+    if worker is not None:
+        worker.notify()
+    return message_id
 
 @router.post("/send")
-async def send_contact_email(contact: ContactRequest, background_tasks: BackgroundTasks):
+async def send_contact_email(contact: ContactRequest):
     try:
-        # Offload "sending" to background task to keep response fast
-        background_tasks.add_task(send_email_task, contact)
+        # Persisted to the outbox before we answer; the outbox worker delivers it
+        message_id = await run_in_threadpool(queue_contact_email, contact)
+        logger.info(f"Contact form submission from {contact.email} queued as {message_id}")
         return {"status": "success", "message": "Transmission received."}
     except Exception as e:
         logger.error(f"Contact form error: {e}")
         raise HTTPException(status_code=500, detail="Transmission failed.")
+
+@router.get("/outbox/stats")
+async def outbox_stats():
+    worker = get_outbox_worker()
+    return worker.stats() if worker is not None else dict(get_outbox().depth(), worker="stopped")
@@ -1,12 +1,20 @@
 
 from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+import asyncio
+import json
 import logging
 import random
+import re
 import time
-from app.core.mandala import render_mandala_card
+import zipfile
+from app.core.calculations import get_calculator
+from app.core.mandala import render_mandala_card, draw_mandala_card, get_render_pool, RENDER_WORKERS
+from app.core.zipstream import ZipStream
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -124,10 +132,26 @@ async def generate_mandala(input: MandalaGenerationInput):
 
 class MandalaCardInput(BaseModel):
     user_id: str
-    dt: datetime
+    dt: datetime # Local time at (lat, lon) unless it carries a UTC offset
     lat: float
     lon: float
 
+def natal_point(card: MandalaCardInput):
+    return get_calculator().to_utc(card.dt, card.lat, card.lon)[0], card.lat, card.lon
+
+def natal_charts(cards: List[MandalaCardInput]) -> list:
+    """
+    One chart per card, or the exception that card raised (see calculate_many).
+    """
+    points = []
+    for card in cards:
+        try:
+            points.append(natal_point(card))
+        except Exception as e:
+            points.append(e)
+    charts = iter(get_calculator().calculate_many([p for p in points if not isinstance(p, Exception)]))
+    return [p if isinstance(p, Exception) else next(charts) for p in points]
+
 @router.post("/card", responses={200: {"content": {"image/png": {}}}})
 async def get_mandala_card(input: MandalaCardInput):
     """
@@ -138,10 +162,11 @@ async def get_mandala_card(input: MandalaCardInput):
         logger.info(f"Rendering Mandala Card for {input.user_id}")
 
         # Call the core rendering logic
+        dt, lat, lon = natal_point(input)
         image_bytes = render_mandala_card({
-            "dt": input.dt,
-            "lat": input.lat,
-            "lon": input.lon,
+            "dt": dt,
+            "lat": lat,
+            "lon": lon,
             # In future: pass retrieved natal chart here if necessary for speed
         })
 
@@ -151,3 +176,84 @@ async def get_mandala_card(input: MandalaCardInput):
         logger.error(f"Card rendering failed: {e}")
         # Return 500 but log error
         raise HTTPException(status_code=500, detail=str(e))
+
+# --- Bulk Card Endpoint ---
+
+MAX_BATCH_CARDS = 500
+# Cards submitted to the pool at once. Keeps memory bounded to a few PNGs
+# regardless of batch size while still saturating every worker.
+MAX_IN_FLIGHT = RENDER_WORKERS * 2
+
+def _card_filename(index: int, user_id: str) -> str:
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)[:64]
+    return f"{index:04d}_{safe_id}.png"
+
+async def stream_cards_zip(inputs: List[MandalaCardInput]):
+    """
+    Yields a ZIP archive of rendered cards, one entry per card as soon as it
+    finishes rendering. Failed items are recorded in manifest.json, which is
+    written last.
+    """
+    zs = ZipStream()
+    manifest = []
+
+    # Charts are cheap compared to rendering; compute them in one pass off the event loop
+    charts = await run_in_threadpool(natal_charts, inputs)
+
+    pool = get_render_pool()
+    pending = {}
+    queue = iter(enumerate(zip(inputs, charts)))
+
+    def submit_next():
+        for index, (card, chart) in queue:
+            if isinstance(chart, Exception):
+                manifest.append({"index": index, "user_id": card.user_id, "status": "error", "error": f"Chart calculation failed: {chart}"})
+                continue
+            future = asyncio.wrap_future(pool.submit(draw_mandala_card, chart))
+            pending[future] = (index, card)
+            return
+
+    try:
+        for _ in range(MAX_IN_FLIGHT):
+            submit_next()
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                index, card = pending.pop(future)
+                try:
+                    png = future.result()
+                except Exception as e:
+                    logger.error(f"Card rendering failed for {card.user_id}: {e}")
+                    manifest.append({"index": index, "user_id": card.user_id, "status": "error", "error": f"Rendering failed: {e}"})
+                else:
+                    filename = _card_filename(index, card.user_id)
+                    manifest.append({"index": index, "user_id": card.user_id, "status": "ok", "file": filename})
+                    yield zs.add(filename, png)
+                submit_next()
+
+        manifest.sort(key=lambda entry: entry["index"])
+        yield zs.add("manifest.json", json.dumps({"count": len(inputs), "items": manifest}, indent=2).encode(), compress_type=zipfile.ZIP_DEFLATED)
+        yield zs.close()
+    finally:
+        # Client went away mid-stream: don't leave queued renders on the pool
+        for future in pending:
+            future.cancel()
+
+@router.post("/cards/batch", responses={200: {"content": {"application/zip": {}}}})
+async def get_mandala_cards_batch(inputs: List[MandalaCardInput]):
+    """
+    Renders many Mandala Cards in one request.
+    Streams a ZIP with one PNG per card plus a manifest.json of per-item results.
+    """
+    if not inputs:
+        raise HTTPException(status_code=400, detail="No cards requested")
+    if len(inputs) > MAX_BATCH_CARDS:
+        raise HTTPException(status_code=413, detail=f"Batch limited to {MAX_BATCH_CARDS} cards")
+
+    logger.info(f"Rendering {len(inputs)} Mandala Cards in batch")
+    return StreamingResponse(
+        stream_cards_zip(inputs),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=mandala_cards.zip"}
+    )
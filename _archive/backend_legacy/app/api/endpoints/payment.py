@@ -1,15 +1,30 @@
 
 from fastapi import APIRouter, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import stripe
+import json
+import logging
 import os
 from dotenv import load_dotenv
+from app.core.checkout import SESSION_EVENTS, get_checkout_service
+from app.core.lazy import LazyModule
 
 load_dotenv()
 
 router = APIRouter()
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+logger = logging.getLogger(__name__)
+
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Maximum age of a webhook signature, against replays
+STRIPE_WEBHOOK_TOLERANCE = int(os.getenv("STRIPE_WEBHOOK_TOLERANCE", 300))
+
+def configure_stripe(module):
+    module.api_key = STRIPE_SECRET_KEY
+
+# The SDK is imported on the first checkout or webhook
+stripe = LazyModule("stripe", on_load=configure_stripe)
 
 class CheckoutRequest(BaseModel):
     tier: str
@@ -19,7 +34,7 @@ class CheckoutRequest(BaseModel):
 
 @router.post("/checkout")
 async def create_checkout_session(data: CheckoutRequest):
-    if not stripe.api_key:
+    if not STRIPE_SECRET_KEY:
         return {"error": "Stripe configuration missing", "url": None}
 
     try:
@@ -39,7 +54,9 @@ async def create_checkout_session(data: CheckoutRequest):
             pass
 
         # Create Checkout Session
-        checkout_session = stripe.checkout.Session.create(
+        # The Stripe SDK is synchronous; keep it off the event loop
+        checkout_session = await run_in_threadpool(
+            stripe.checkout.Session.create,
             line_items=[
                 {
                     # Provide the exact Price ID (for example, pr_1234) of the product you want to sell
@@ -69,18 +86,43 @@ async def create_checkout_session(data: CheckoutRequest):
         # BUT only if explicitly allowed or in debug mode.
         return {"error": str(e)}
 
+@router.post("/webhook")
+async def stripe_webhook(request: Request):
+    """
+    Stripe event ingestion. Checkout session events are recorded in the
+    checkout store; redelivered events are acknowledged and ignored.
+    """
+    if not STRIPE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Stripe webhook secret missing")
+    payload = await request.body()
+    try:
+        stripe.WebhookSignature.verify_header(
+            payload.decode("utf-8"), request.headers.get("stripe-signature"), STRIPE_WEBHOOK_SECRET,
+            tolerance=STRIPE_WEBHOOK_TOLERANCE
+        )
+        event = json.loads(payload)
+    except (stripe.SignatureVerificationError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
+
+    if event.get("type") not in SESSION_EVENTS:
+        # Acknowledge, or Stripe keeps retrying events we don't handle
+        return {"received": True, "handled": False}
+    try:
+        applied = get_checkout_service().store.record_event(event)
+    except (KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    if not applied:
+        logger.info(f"Duplicate Stripe event {event.get('id')} ignored")
+    return {"received": True, "handled": True, "duplicate": not applied}
+
 @router.get("/checkout-status/{session_id}")
 async def get_checkout_status(session_id: str):
-    if not stripe.api_key:
-        return {"error": "Stripe configuration missing"}
-
+    # Served from the checkout store; Stripe is only asked about sessions no webhook has reported yet
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
-        return {
-            "status": session.status,
-            "payment_status": session.payment_status,
-            "customer_email": session.customer_details.email if session.customer_details else None,
-            "tier": session.metadata.get('tier')
-        }
-    except Exception as e:
+        return await get_checkout_service().get(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
         return {"error": str(e)}
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Response, Query, Header, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from typing import List, Optional
 import datetime
-from app.core.pass_generator import PassGenerator
-from app.core import knowledge_base
-import firebase_admin
-from firebase_admin import firestore
+import time
+from app.core.user_store import chart_from_record
+from app.core.llm_gateway import get_llm_gateway, LLMUnavailable
+from app.core.chat_context import build_chat_prompt, prompt_stats
+from app.core.chat_sessions import chat_sessions
+from app.core.retrieval import estimate_tokens, get_knowledge_index
+from app.core.timeline_store import get_timeline_store, TimelineQuery, MAX_PAGE_SIZE
+from app.core.write_behind import WriteBufferFull
+from app.core.recurrence import get_recurrence_engine
+from starlette.concurrency import run_in_threadpool
+from app.core.knowledge_serving import get_compiled_topics, etag_matches, TOPIC_CACHE_CONTROL, SEARCH_CACHE_CONTROL
+from app.core.firebase import firestore
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,7 +51,7 @@ class LogEventRequest(BaseModel):
     narrative: str
     location: Optional[str] = None
     media_url: Optional[str] = None
-    media_url: Optional[str] = None
+    labels: List[str] = []
     timestamp: Optional[str] = None
 
 class ChatRequest(BaseModel):
@@ -98,56 +106,106 @@ async def get_topology(user_id: str):
     return MOCK_TOPOLOGY
 
 @router.get("/timeline/{user_id}", response_model=List[TimelineEvent])
-async def get_timeline(user_id: str):
-    # In future, fetch from Firestore
-    return MOCK_TIMELINE
+async def get_timeline(user_id: str, response: Response,
+                       start: Optional[str] = None, end: Optional[str] = None,
+                       type: Optional[List[str]] = Query(None), label: Optional[str] = None,
+                       limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
+    """
+    Newest first, one page per call. start (inclusive) / end (exclusive) are
+    ISO timestamps. When more events exist, X-Next-Cursor holds the cursor for
+    the next page.
+    """
+    try:
+        query = TimelineQuery(start=start, end=end, types=type, label=label, limit=limit, cursor=cursor)
+        page = await run_in_threadpool(get_timeline_store().query, user_id, query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to read timeline: {e}")
+        # Mock timeline for offline dev
+        return MOCK_TIMELINE
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.events
+
+class KnowledgeSearchHit(BaseModel):
+    key: str
+    title: str
+    score: float
+
+# Declared before /knowledge/{topic_key}, which would otherwise capture "search"
+@router.get("/knowledge/search", response_model=List[KnowledgeSearchHit])
+async def search_knowledge(response: Response, q: str = Query(..., min_length=1, max_length=200),
+                           limit: int = Query(10, ge=1, le=50)):
+    hits = get_knowledge_index().search_topics(q, k=limit)
+    response.headers["Cache-Control"] = SEARCH_CACHE_CONTROL
+    return [KnowledgeSearchHit(key=h.topic, title=h.title, score=round(h.score, 4)) for h in hits]
 
 @router.get("/knowledge/{topic_key}", response_model=Optional[KnowledgeItem])
-async def get_knowledge(topic_key: str):
-    data = knowledge_base.get_topic(topic_key)
-    if not data:
+async def get_knowledge(topic_key: str, if_none_match: Optional[str] = Header(None)):
+    # Served from bytes compiled at startup, see app.core.knowledge_serving
+    compiled = get_compiled_topics().get(topic_key)
+    if not compiled:
         raise HTTPException(status_code=404, detail="Topic not found")
-    return data
+    headers = {"ETag": compiled.etag, "Cache-Control": TOPIC_CACHE_CONTROL}
+    if etag_matches(if_none_match, compiled.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=compiled.body, media_type="application/json", headers=headers)
+
+def store_scored_event(user_id: str, event: dict) -> dict:
+    # Scored against the user's recent window before it joins the timeline,
+    # and only added to the window once the store took it (WriteBufferFull
+    # means the client retries the same event)
+    engine = get_recurrence_engine()
+    scored = engine.score(user_id, event)
+    stored = get_timeline_store().add(user_id, scored)
+    engine.commit(user_id, scored)
+    return stored
 
 @router.post("/timeline/log")
 async def log_event(request: LogEventRequest):
     try:
-        db = firestore.client()
-        # Ensure subcollection 'timeline' exists for user
-        event_data = {
-            "userId": request.userId,
-            "type": request.type,
-            "narrative": request.narrative,
-            "location": request.location,
-            "media_url": request.media_url,
-            "timestamp": request.timestamp or datetime.datetime.utcnow().isoformat(),
-            "created_at": datetime.firestore.SERVER_TIMESTAMP
-        }
-
-        db.collection('users').document(request.userId).collection('timeline').add(event_data)
-
+        # Acknowledged once queued; the write-behind buffer commits it shortly after
+        event_data = await run_in_threadpool(store_scored_event, request.userId, request.model_dump())
         return {"status": "success", "event": event_data}
+    except WriteBufferFull:
+        raise HTTPException(status_code=503, detail="Timeline is busy, retry shortly", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Failed to log timeline event: {e}")
         # Mock success for offline dev
         return {"status": "success_mock", "event": request.dict()}
 
+def load_wallet_identity(user_id: str):
+    """
+    Returns (chart, name, birth_date) from the user's stored bioMetrics.
+    Any of them may be None; the pass then falls back to the generic artwork.
+    """
+    try:
+        db = firestore.client()
+        snapshot = db.collection('users').document(user_id).get()
+        if not snapshot.exists:
+            return None, None, None
+        user = dict(snapshot.to_dict(), id=user_id)
+        bio = user.get("bioMetrics") or {}
+        return chart_from_record(user, backfill=True), user.get("name"), bio.get("birthDate")
+    except Exception as e:
+        logger.warning(f"Wallet identity unavailable for {user_id}, using generic pass: {e}")
+        return None, None, None
+
 @router.post("/wallet/sign")
 async def sign_wallet(request: WalletSignRequest):
     try:
+        # Pulls in Pillow, numpy and cryptography: imported on the first pass, not at startup
+        from app.core.pass_generator import PassGenerator
         generator = PassGenerator()
-        # In a real implementation, we would also sign the pass with SSL certificates here
-        # For now, we return the bundle with the correct structure and artwork
-        pass_buffer = generator.generate_pass_bundle(request.userId)
-
-        return Response(
-            content=pass_buffer.getvalue(),
-            media_type="application/vnd.apple.pkpass",
-            headers={"Content-Disposition": "attachment; filename=defrag_artifact.pkpass"}
+        # Firestore read (and possibly a chart backfill), then rendering and
+        # signing: all blocking, so none of it runs on the event loop
+        chart, name, birth_date = await run_in_threadpool(load_wallet_identity, request.userId)
+        # Static artwork, per-chart strips and the signer are cached at module level,
+        # so a repeat request only builds pass.json, the manifest and the signature
+        pass_buffer = await run_in_threadpool(
+            generator.generate_pass_bundle, request.userId, chart=chart, name=name, birth_date=birth_date
         )
-    except Exception as e:
-        print(f"Wallet generation error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
 
         return Response(
             content=pass_buffer.getvalue(),
@@ -155,43 +213,117 @@ async def sign_wallet(request: WalletSignRequest):
             headers={"Content-Disposition": "attachment; filename=defrag_artifact.pkpass"}
         )
     except Exception as e:
-        print(f"Wallet generation error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Wallet generation failed for {request.userId}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Wallet pass generation failed")
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_agent(request: ChatRequest):
-    # Live Agent Interaction using Gemini 2.0 Flash
-    import google.generativeai as genai
-    import os
-
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+async def chat_agent(request: ChatRequest, response: Response):
+    # Live Agent Interaction through the shared LLM gateway
+    gateway = get_llm_gateway()
+    if not gateway:
         return ChatResponse(reply="[OFFLINE MODE] I cannot access the cognitive field (No API Key).")
 
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    # Construct Prompt with Knowledge Base Context: compacted client context plus
+    # the knowledge base snippets most relevant to the message, each within budget
+    chat_prompt = build_chat_prompt(request.message, request.context)
+    prompt_stats.record(chat_prompt)
+    response.headers["X-Prompt-Tokens"] = str(chat_prompt.tokens)
+    logger.info(f"Chat prompt: {chat_prompt.tokens} tokens (context {chat_prompt.context_tokens}, "
+                f"knowledge {chat_prompt.knowledge_tokens} from {chat_prompt.topics})")
+    prompt = chat_prompt.text
 
-    # Construct Prompt with Knowledge Base Context
-    # We can inject knowledge base summaries here if needed
+    try:
+        reply = await gateway.generate(prompt, route="chat")
+        return ChatResponse(reply=reply)
+    except LLMUnavailable as e:
+        logger.warning(f"Chat generation skipped: {e}")
+        return ChatResponse(reply="[SYSTEM BUSY] The cognitive field is saturated. Retry shortly.")
+    except Exception as e:
+        logger.error(f"Chat generation failed: {e}")
+        return ChatResponse(reply="[SYSTEM ERROR] Signal interrupted.")
 
-    prompt = f"""
-    You are the DEFRAG Live Agent, a sophisticated cognitive AI.
+@router.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    Stateful chat. The context is sent once; the session keeps it, the
+    retrieved knowledge and recent turns server-side, so each message only
+    carries new text. Replies stream token by token.
 
-    CONTEXT:
-    {request.context}
+    client: {"type": "start", "context": {...}, "sessionId": "..." (optional, resume)}
+            {"type": "context", "context": {...}}   replace the session context
+            {"type": "message", "text": "..."}
+    server: {"type": "session", "sessionId": "...", "resumed": bool}
+            {"type": "token", "text": "..."}         streamed reply
+            {"type": "done", "reply": "...", "promptTokens": n, "ms": t}
+            {"type": "error", "message": "..."}
+    """
+    await websocket.accept()
+    session = None
+    try:
+        while True:
+            try:
+                payload = await websocket.receive_json()
+            except (ValueError, KeyError):
+                # Not JSON, or a binary frame (no "text")
+                payload = None
+            if not isinstance(payload, dict):
+                await websocket.send_json({"type": "error", "message": "Expected a JSON object"})
+                continue
+            kind = payload.get("type")
 
-    USER QUERY:
-    {request.message}
+            if kind == "start":
+                session_id = payload.get("sessionId")
+                session = chat_sessions.get(session_id) if isinstance(session_id, str) and session_id else None
+                resumed = session is not None
+                if session is None:
+                    session = chat_sessions.create(payload.get("context"))
+                elif payload.get("context") is not None:
+                    session.set_context(payload["context"])
+                await websocket.send_json({"type": "session", "sessionId": session.id, "resumed": resumed})
+            elif kind == "context":
+                session = session or chat_sessions.create()
+                session.set_context(payload.get("context"))
+            elif kind == "message" and isinstance(payload.get("text"), str):
+                session = session or chat_sessions.create()
+                chat_sessions.touch(session)
+                await stream_session_reply(websocket, session, payload["text"])
+            else:
+                await websocket.send_json({"type": "error", "message": f"Unsupported message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
 
-    DIRECTIVES:
-    1. Answer concisely but with "Cyber-Noir" flair.
-    2. Reference Bressloff-Cowan (geometry) or Jung (archetypes) if relevant.
-    3. Be helpful but maintain the persona of an Operating System.
-    """
+async def stream_session_reply(websocket: WebSocket, session, text: str):
+    started = time.perf_counter()
+    prompt, message = session.build_prompt(text)
+    tokens = estimate_tokens(prompt)
 
-    try:
-        response = model.generate_content(prompt)
-        return ChatResponse(reply=response.text)
-    except Exception as e:
-        logger.error(f"Chat generation failed: {e}")
-        return ChatResponse(reply="[SYSTEM ERROR] Signal interrupted.")
+    gateway = get_llm_gateway()
+    if not gateway:
+        reply = "[OFFLINE MODE] I cannot access the cognitive field (No API Key)."
+    else:
+        parts = []
+        try:
+            async for chunk in gateway.stream(prompt, route="chat"):
+                parts.append(chunk)
+                await websocket.send_json({"type": "token", "text": chunk})
+            reply = "".join(parts)
+        except WebSocketDisconnect:
+            raise
+        except LLMUnavailable as e:
+            logger.warning(f"Chat generation skipped: {e}")
+            reply = "[SYSTEM BUSY] The cognitive field is saturated. Retry shortly."
+        except Exception as e:
+            logger.error(f"Chat generation failed: {e}")
+            reply = "[SYSTEM ERROR] Signal interrupted."
+        else:
+            # Failed turns stay out of the history
+            session.record_turn(message, reply)
+
+    await websocket.send_json({
+        "type": "done", "reply": reply, "promptTokens": tokens,
+        "ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+@router.get("/chat/stats")
+async def get_chat_stats():
+    return prompt_stats.stats()
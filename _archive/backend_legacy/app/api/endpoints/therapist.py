@@ -1,15 +1,50 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Header, Query
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import os
 import uuid
 import logging
-from typing import Optional
-import firebase_admin
-from firebase_admin import firestore
+from typing import Dict, List, Optional
+from app.core.firebase import auth, firestore
+from app.core.write_behind import Write, WriteBufferFull, get_write_behind
+from app.core.share_tokens import InvalidShareToken, ShareClaims, get_share_signer, get_revocations, verify_share_token
+from app.core.daily_reads import get_daily_store
+from app.core.share_sweeper import get_share_sweeper
+from app.core.timeline_store import get_timeline_store, TimelineQuery, MAX_PAGE_SIZE
+from app.core.user_store import chart_from_record, get_user_records
+from app.core.chart_store import chart_summary
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Dashboard reads run in parallel on their own pool: with one batched read for
+# profiles, two for analyses and one timeline query per client, 50 clients
+# fit in a single wave. The timeout is passed to each Firestore call, so a
+# slow read gives its pool thread back when it gives up.
+DASHBOARD_WORKERS = int(os.getenv("DASHBOARD_WORKERS", 64))
+DASHBOARD_FETCH_TIMEOUT = float(os.getenv("DASHBOARD_FETCH_TIMEOUT", 2.0))
+DASHBOARD_TIMELINE_LIMIT = 10
+# How long a revocation waits for a share still queued in the write-behind buffer
+REVOKE_FLUSH_TIMEOUT = float(os.getenv("REVOKE_FLUSH_TIMEOUT", 2.0))
+
+_dashboard_pool: Optional[ThreadPoolExecutor] = None
+
+def get_dashboard_pool() -> ThreadPoolExecutor:
+    global _dashboard_pool
+    if _dashboard_pool is None:
+        _dashboard_pool = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix="dashboard")
+    return _dashboard_pool
+
+def shutdown_dashboard_pool():
+    global _dashboard_pool
+    if _dashboard_pool is not None:
+        _dashboard_pool.shutdown(wait=False, cancel_futures=True)
+        _dashboard_pool = None
+
 # --- Models ---
 class ShareRequest(BaseModel):
     user_id: str
@@ -21,11 +56,67 @@ class ShareResponse(BaseModel):
     share_id: str
     expires_at: datetime
     share_link: str
+    token: Optional[str] = None
 
 class RevokeRequest(BaseModel):
     user_id: str
     share_id: str
 
+class ShareAccess(BaseModel):
+    share_id: str
+    user_id: str
+    access_type: str
+    expires_at: datetime
+
+class DashboardClient(BaseModel):
+    user_id: str
+    share_id: str
+    access_type: str
+    expires_at: datetime
+    name: Optional[str] = None
+    analysis: Optional[dict] = None
+    analysis_date: Optional[str] = None
+    chart: Optional[dict] = None
+    timeline: Optional[List[dict]] = None
+    errors: List[str] = [] # parts that failed or timed out
+
+class DashboardResponse(BaseModel):
+    therapist_email: str
+    clients: List[DashboardClient]
+    partial: bool
+
+def share_access(token: Optional[str] = Query(None), x_share_token: Optional[str] = Header(None)) -> ShareClaims:
+    """
+    Dependency for clinician endpoints: the verified claims of the share token
+    (X-Share-Token header or ?token=). No Firestore read.
+    """
+    token = x_share_token or token
+    if not token:
+        raise HTTPException(status_code=401, detail="Share token required")
+    try:
+        return verify_share_token(token)
+    except InvalidShareToken as e:
+        if e.reason == "revoked":
+            raise HTTPException(status_code=403, detail="Share revoked")
+        raise HTTPException(status_code=401, detail=f"Invalid share token ({e.reason})")
+
+def clinician_email(authorization: Optional[str] = Header(None)) -> str:
+    """
+    Dependency for the dashboard: the verified email of the signed-in
+    clinician, from a Firebase ID token (Authorization: Bearer <token>).
+    """
+    scheme, _, id_token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not id_token:
+        raise HTTPException(status_code=401, detail="Sign-in required")
+    try:
+        claims = auth.verify_id_token(id_token)
+    except Exception as e:
+        logger.info(f"Rejected clinician ID token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid sign-in")
+    if not claims.get("email") or not claims.get("email_verified"):
+        raise HTTPException(status_code=403, detail="A verified email is required")
+    return claims["email"]
+
 # --- Endpoints ---
 @router.post("/share", response_model=ShareResponse)
 async def create_share_link(request: ShareRequest):
@@ -44,18 +135,28 @@ async def create_share_link(request: ShareRequest):
             "revoked_at": None,
             "active": True
         }
+        expires_epoch = int(expires_at.replace(tzinfo=timezone.utc).timestamp())
+        # The link carries everything needed to check access later, signed
+        token = get_share_signer().issue(ShareClaims(share_id, request.user_id, request.access_type, expires_epoch))
 
         # Store in 'therapist_shares' collection
         # We can store safely at root or nested. Root is easier for 'getSharedDataForTherapist' query.
-        db.collection("therapist_shares").document(share_id).set(share_data)
-        db.collection("users").document(request.user_id).collection("shares").document(share_id).set(share_data) # Duplicate for easy user lookup
+        # Both copies are queued as one group, so they land in the same batch
+        get_write_behind().enqueue(db, [
+            Write(db.collection("therapist_shares").document(share_id), share_data),
+            Write(db.collection("users").document(request.user_id).collection("shares").document(share_id), share_data) # Duplicate for easy user lookup
+        ])
+        get_share_sweeper().schedule(share_id, request.user_id, expires_epoch)
 
         return ShareResponse(
             share_id=share_id,
             expires_at=expires_at,
-            share_link=f"https://defrag.app?token={share_id}"
+            share_link=f"https://defrag.app?token={token}",
+            token=token
         )
 
+    except WriteBufferFull:
+        raise HTTPException(status_code=503, detail="Sharing is busy, retry shortly", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Share creation failed: {e}")
         # MVP fallback if Firebase fails
@@ -65,25 +166,215 @@ async def create_share_link(request: ShareRequest):
             share_link="https://defrag.app/clinician/access/mock-share"
         )
 
+def load_share(db, share_id: str) -> Optional[Dict]:
+    """
+    The root copy of a share, or None if there is no such share.
+    """
+    ref = db.collection("therapist_shares").document(share_id)
+    doc = ref.get()
+    if not doc.exists:
+        # Created moments ago: its write may still be queued
+        get_write_behind().flush(timeout=REVOKE_FLUSH_TIMEOUT)
+        doc = ref.get()
+    return doc.to_dict() if doc.exists else None
+
 @router.post("/revoke")
 async def revoke_share(request: RevokeRequest):
     try:
         db = firestore.client()
+        share = await run_in_threadpool(load_share, db, request.share_id)
+        if share is None or share.get("user_id") != request.user_id:
+            raise HTTPException(status_code=404, detail="Share not found")
+        expires_at = share.get("expires_at")
+        # Takes effect on this instance right away; others pick it up on their next sync
+        get_revocations().add(request.share_id, _utc(expires_at).timestamp() if expires_at else None)
+        revoked_at = datetime.utcnow()
+        revocation = {"revoked_at": revoked_at, "active": False}
 
-        # Update root collection
-        db.collection("therapist_shares").document(request.share_id).update({
-            "revoked_at": datetime.utcnow(),
-            "active": False
-        })
+        # Root collection and user subcollection. Merged sets rather than
+        # updates: a batched update of a missing share would fail the batch.
+        # Both copies exist (checked above), so no stray documents are created
+        get_write_behind().enqueue(db, [
+            Write(db.collection("therapist_shares").document(request.share_id), revocation, merge=True),
+            Write(db.collection("users").document(request.user_id).collection("shares").document(request.share_id), revocation, merge=True)
+        ])
 
-        # Update user subcollection
-        db.collection("users").document(request.user_id).collection("shares").document(request.share_id).update({
-            "revoked_at": datetime.utcnow(),
-            "active": False
-        })
-
-        return {"status": "success", "revoked_at": datetime.utcnow()}
+        return {"status": "success", "revoked_at": revoked_at}
 
+    except HTTPException:
+        raise
+    except WriteBufferFull:
+        raise HTTPException(status_code=503, detail="Sharing is busy, retry shortly", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Revocation failed: {e}")
+        # Still honoured on this instance
+        get_revocations().add(request.share_id)
         return {"status": "mock_success"}
+
+@router.get("/sweeper/stats")
+async def sweeper_stats():
+    return get_share_sweeper().stats()
+
+@router.get("/access", response_model=ShareAccess)
+async def check_access(claims: ShareClaims = Depends(share_access)):
+    return ShareAccess(
+        share_id=claims.share_id,
+        user_id=claims.user_id,
+        access_type=claims.access_type,
+        expires_at=datetime.fromtimestamp(claims.expires_at, timezone.utc)
+    )
+
+
+# --- Dashboard ---
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def load_active_shares(therapist_email: str, timeout: Optional[float] = None) -> List[Dict]:
+    """
+    Unexpired, unrevoked shares to therapist_email, one per client (the
+    longest lasting). Served by the (therapist_email, active) index.
+    """
+    db = firestore.client()
+    docs = db.collection("therapist_shares") \
+        .where("therapist_email", "==", therapist_email).where("active", "==", True).stream(timeout=timeout)
+    now = datetime.now(timezone.utc)
+    revocations = get_revocations()
+    shares: Dict[str, Dict] = {}
+    for doc in docs:
+        share = dict(doc.to_dict(), share_id=doc.id)
+        expires_at = share.get("expires_at")
+        if not expires_at or _utc(expires_at) <= now or revocations.is_revoked(doc.id):
+            continue
+        current = shares.get(share["user_id"])
+        if current is None or _utc(current["expires_at"]) < _utc(expires_at):
+            shares[share["user_id"]] = share
+    return list(shares.values())
+
+def load_timeline(user_id: str, limit: int, timeout: Optional[float] = None) -> List[Dict]:
+    return get_timeline_store().query(user_id, TimelineQuery(limit=limit), timeout=timeout).events
+
+def load_chart(record: Dict) -> Optional[dict]:
+    return chart_summary(chart_from_record(record, backfill=True))
+
+async def _fetch(fn, *args, **kwargs):
+    """
+    Runs a blocking read on the dashboard pool. Reads bound themselves: pass
+    them timeout=DASHBOARD_FETCH_TIMEOUT rather than abandoning the thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_dashboard_pool(), functools.partial(fn, *args, **kwargs))
+
+async def _gather(fetches: Dict[str, "asyncio.Future"], timeout: Optional[float] = None) -> Dict[str, object]:
+    """
+    Awaits all fetches at once. Failed ones, and with a timeout those still
+    running when it expires, are logged and left out.
+    """
+    tasks = {key: asyncio.ensure_future(fetch) for key, fetch in fetches.items()}
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    out = {}
+    for key, task in tasks.items():
+        if task in pending:
+            logger.warning(f"Dashboard fetch {key} timed out")
+        elif task.exception() is not None:
+            error = task.exception()
+            logger.warning(f"Dashboard fetch {key} failed: {type(error).__name__}: {error}")
+        else:
+            out[key] = task.result()
+    return out
+
+def _latest_read(reads: Dict[str, Dict], uid: str) -> Optional[Dict]:
+    return reads.get("today", {}).get(uid) or reads.get("yesterday", {}).get(uid)
+
+async def _load_charts(reads: "asyncio.Future", timeout: float) -> Dict[str, Optional[dict]]:
+    """
+    Chart summaries for clients whose latest stored read carries none, as
+    soon as the profile and daily-read batches are in (not after the
+    timelines). Calculating one may geocode, so the phase is bounded by
+    timeout; clients still waiting are left out.
+    """
+    batches = await reads
+    if "profiles" not in batches:
+        return {}
+    needed = {uid: record for uid, record in batches["profiles"].items()
+              if not (_latest_read(batches, uid) or {}).get("chart")}
+    return await _gather({uid: _fetch(load_chart, record) for uid, record in needed.items()}, timeout)
+
+@router.get("/dashboard", response_model=DashboardResponse)
+async def therapist_dashboard(therapist_email: str = Depends(clinician_email),
+                              timeline_limit: int = Query(DASHBOARD_TIMELINE_LIMIT, ge=0, le=MAX_PAGE_SIZE)):
+    """
+    Every client sharing with the signed-in clinician's (verified) email:
+    latest daily analysis (today's, else yesterday's), chart summary and
+    newest timeline events. All reads go out in parallel; a part that fails
+    or times out is left empty and named in the client's errors, the rest is
+    still returned.
+    """
+    timeout = DASHBOARD_FETCH_TIMEOUT
+    try:
+        shares = await _fetch(load_active_shares, therapist_email, timeout=timeout)
+    except Exception as e:
+        logger.error(f"Dashboard shares unavailable for {therapist_email}: {e}")
+        raise HTTPException(status_code=503, detail="Shares unavailable, retry shortly", headers={"Retry-After": "1"})
+
+    if not shares:
+        return DashboardResponse(therapist_email=therapist_email, clients=[], partial=False)
+
+    user_ids = [share["user_id"] for share in shares]
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    store = get_daily_store()
+    batches = asyncio.ensure_future(_gather({
+        "profiles": _fetch(get_user_records, user_ids, timeout=timeout),
+        "today": _fetch(store.get_many, user_ids, today.isoformat(), timeout=timeout),
+        "yesterday": _fetch(store.get_many, user_ids, yesterday.isoformat(), timeout=timeout)
+    }))
+    fetches = {"batches": batches, "charts": _load_charts(batches, timeout)}
+    if timeline_limit:
+        fetches.update({f"timeline:{uid}": _fetch(load_timeline, uid, timeline_limit, timeout=timeout) for uid in user_ids})
+    results = await _gather(fetches)
+    reads = results.get("batches", {})
+    charts = results.get("charts", {})
+
+    clients: List[DashboardClient] = []
+    for share in shares:
+        uid = share["user_id"]
+        client = DashboardClient(
+            user_id=uid, share_id=share["share_id"], access_type=share.get("access_type", "read_only"),
+            expires_at=share["expires_at"]
+        )
+        for day, key in ((today, "today"), (yesterday, "yesterday")):
+            read = reads.get(key, {}).get(uid)
+            if read:
+                client.analysis, client.analysis_date, client.chart = read.get("analysis"), day.isoformat(), read.get("chart")
+                break
+        else:
+            if "today" not in reads or "yesterday" not in reads:
+                client.errors.append("analysis")
+
+        record = reads.get("profiles", {}).get(uid)
+        if "profiles" not in reads:
+            client.errors.append("profile")
+        elif record:
+            client.name = record.get("name")
+            # Stored reads carry the chart summary; only users without one had it calculated
+            if client.chart is None:
+                if uid in charts:
+                    client.chart = charts[uid]
+                else:
+                    client.errors.append("chart")
+
+        if timeline_limit:
+            client.timeline = results.get(f"timeline:{uid}")
+            if client.timeline is None:
+                client.errors.append("timeline")
+        clients.append(client)
+
+    return DashboardResponse(
+        therapist_email=therapist_email,
+        clients=clients,
+        partial=any(client.errors for client in clients)
+    )
@@ -1,39 +1,21 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Query
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Optional
 import logging
-import firebase_admin
-from firebase_admin import firestore
+import os
+import tempfile
+from app.core.background_jobs import BackgroundJobs, JobTableFull
+from app.core.firebase import auth, firestore
+from app.core.user_records import UserInitRequest, attach_charts, build_user_data
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-class BioMetrics(BaseModel):
-    birthDate: str
-    birthTime: Optional[str] = None
-    birthLocation: str
-    humanDesignType: Optional[str] = None
-    enneagram: Optional[str] = None
-
-class Vector3(BaseModel):
-    x: float
-    y: float
-    z: float
-
-class LineageMember(BaseModel):
-    id: str
-    role: str
-    lifePath: Optional[int] = None
-    humanDesign: Optional[str] = None
-    vector: Optional[Vector3] = None
-
-class UserInitRequest(BaseModel):
-    userId: str
-    email: str
-    name: str
-    bioMetrics: BioMetrics
-    familyMembers: Optional[list[LineageMember]] = []
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 2))
+# Largest accepted import body
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 100 * 1024 * 1024))
+# Verified emails allowed to bulk import, besides accounts with the `admin` custom claim
+IMPORT_ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("IMPORT_ADMIN_EMAILS", "").split(",") if e.strip()}
 
 @router.post("/init")
 async def initialize_user(request: UserInitRequest):
@@ -41,15 +23,12 @@ async def initialize_user(request: UserInitRequest):
         db = firestore.client()
         user_ref = db.collection('users').document(request.userId)
 
-        user_data = {
-            "id": request.userId,
-            "email": request.email,
-            "name": request.name,
-            "bioMetrics": request.bioMetrics.dict(),
-            "familyMembers": [m.dict() for m in request.familyMembers] if request.familyMembers else [],
-            "tier": "ACCESS_SIGNAL", # Default tier
-            "initializedAt": datetime.utcnow()
-        }
+        bio = request.bioMetrics.model_dump()
+        members = [m.model_dump() for m in request.familyMembers] if request.familyMembers else []
+        # Geocoding is a blocking network call
+        chart = await run_in_threadpool(attach_charts, bio, members)
+
+        user_data = build_user_data(request, bio, members, chart)
 
         # Merge allowing partial updates if user exists
         user_ref.set(user_data, merge=True)
@@ -59,3 +38,103 @@ async def initialize_user(request: UserInitRequest):
         logger.error(f"Error initializing user: {e}")
         # For dev/demo, if Firestore fails, return mock success provided the request was valid
         return {"status": "success_mock", "user": request.dict()}
+
+def import_admin(authorization: Optional[str] = Header(None)) -> str:
+    """
+    Dependency for the bulk import: a Firebase ID token (Authorization:
+    Bearer <token>) of an admin, i.e. with the `admin` custom claim or a
+    verified email in IMPORT_ADMIN_EMAILS. Returns the caller's uid.
+    """
+    scheme, _, id_token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not id_token:
+        raise HTTPException(status_code=401, detail="Sign-in required")
+    try:
+        claims = auth.verify_id_token(id_token)
+    except Exception as e:
+        logger.info(f"Rejected import ID token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid sign-in")
+    email = (claims.get("email") or "").lower()
+    if claims.get("admin") is not True and not (claims.get("email_verified") and email in IMPORT_ADMIN_EMAILS):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return claims.get("uid") or email
+
+_import_jobs: Optional[BackgroundJobs] = None
+
+def get_import_jobs() -> BackgroundJobs:
+    global _import_jobs
+    if _import_jobs is None:
+        _import_jobs = BackgroundJobs(name="user-import")
+    return _import_jobs
+
+def set_import_jobs(jobs: Optional[BackgroundJobs]):
+    global _import_jobs
+    _import_jobs = jobs
+
+def shutdown_import_jobs():
+    global _import_jobs
+    if _import_jobs is not None:
+        _import_jobs.shutdown()
+    _import_jobs = None
+
+def import_file(path: str, fmt: str, progress) -> Dict:
+    from app.jobs.user_import import FirestoreUserWriter, run
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return run(f, fmt, FirestoreUserWriter(), workers=IMPORT_WORKERS, on_progress=progress)
+    finally:
+        os.remove(path)
+
+async def spool_body(request: Request, path: str, limit: int = IMPORT_MAX_BYTES):
+    """
+    Writes the request body to path as it arrives, off the event loop.
+    Raises 413 once it passes limit bytes.
+    """
+    received = 0
+    spool = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise HTTPException(status_code=413, detail=f"Import larger than {limit} bytes")
+            await run_in_threadpool(spool.write, chunk)
+    finally:
+        await run_in_threadpool(spool.close)
+
+@router.post("/import", status_code=202)
+async def import_users(request: Request, format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+                       admin: str = Depends(import_admin)):
+    """
+    Bulk variant of /init, for admins. The body is an NDJSON or CSV file (format
+    from ?format= or the Content-Type) of at most IMPORT_MAX_BYTES, spooled to
+    disk as it arrives and imported by app.jobs.user_import in the background.
+    Returns the job ID; poll /import/{job_id} for progress, then counts,
+    rows/sec and per-row errors.
+    """
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Import larger than {IMPORT_MAX_BYTES} bytes")
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        await spool_body(request, path)
+        job_id = get_import_jobs().submit(lambda progress: import_file(path, fmt, progress))
+    except JobTableFull as e:
+        os.remove(path)
+        raise HTTPException(status_code=503, detail=f"Too many imports in progress: {e}", headers={"Retry-After": "60"})
+    except BaseException:
+        os.remove(path)
+        raise
+    logger.info(f"User import {job_id} queued by {admin}")
+    return {"jobId": job_id, "status": "queued", "statusUrl": f"/api/users/import/{job_id}"}
+
+@router.get("/import/{job_id}")
+async def import_status(job_id: str, admin: str = Depends(import_admin)):
+    """
+    status (queued | running | done | failed), progress after each chunk,
+    and the import stats as result once done.
+    """
+    job = get_import_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired import job")
+    return job
@@ -0,0 +1,108 @@
+"""
+Analysis models and builders shared by /api/analyze and the nightly
+daily-read job (app.jobs.daily_reads): the request profile, the response
+model, the LLM prompt and the deterministic fallback.
+"""
+from datetime import datetime
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+from app.core.calculations import ChartData
+from app.core.narrative import render_analysis
+
+class DailyLesson(BaseModel):
+    topic: str = Field(..., description="Title of the concept being explained")
+    content: str = Field(..., description="Educational content explaining the 'WHY'")
+    visual_symbol: Literal['SPIRAL', 'TUNNEL', 'LATTICE', 'WEB', 'MANDALA'] = Field(..., description="Abstract visualizer symbol")
+    knowledge_key: Optional[str] = Field(None, description="Key for deep dive content: FORM_CONSTANTS, INDIVIDUATION, MECHANICS, KAIROS")
+
+class RelationalGeometry(BaseModel):
+    architecture: str = Field(..., description="Structural description of relationship dynamic")
+    tension_node: str = Field(..., description="Specific source of stress")
+    resolution: str = Field(..., description="Structural advice to resolve tension")
+
+class DefragAnalysis(BaseModel):
+    system_status: Literal['OPTIMAL', 'RECALIBRATING', 'ANALYZING']
+    integrity_score: int = Field(..., ge=0, le=100)
+    headline: str = Field(..., description="Engaging, magazine-style title")
+    narrative: str = Field(..., description="Main analysis text")
+    daily_lesson: DailyLesson
+    protocol: str = Field(..., description="Actionable task")
+    relational_geometry: RelationalGeometry
+    audio_url: Optional[str] = None
+    forecast: List[dict] = [] # List of ForecastEvent
+
+
+class BioMetricProfile(BaseModel):
+    # Set for signed-in users so today's precomputed read can be served
+    userId: Optional[str] = None
+    name: str
+    birthDate: str
+    birthTime: str
+    birthLocation: str # "City, Country" or "Lat,Lon" - for MVP we might need lat/lon or geocoding
+    # Optional inputs if user knows them, but we prefer calculation
+    designType: Optional[str] = None
+    enneagram: Optional[str] = None
+    # Hidden fields for geocoding fallback
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+def build_analysis_prompt(profile: BioMetricProfile, chart: ChartData) -> str:
+    today = datetime.now().strftime("%B %d, %Y")
+    chart_context = f"""
+    CALCULATED BIO-METRICS (EXACT):
+    - Sun: Gate {chart.sun.gate}.{chart.sun.line} ({chart.sun.zodiac_sign})
+    - Earth: Gate {chart.earth.gate}.{chart.earth.line} ({chart.earth.zodiac_sign})
+    - Moon: Gate {chart.moon.gate}.{chart.moon.line} ({chart.moon.zodiac_sign})
+    - Nodes: {chart.north_node.gate}.{chart.north_node.line} / {chart.south_node.gate}.{chart.south_node.line}
+    """
+
+    prompt = f"""
+    You are DEFRAG, an abstract 'Cognitive Operating System'.
+
+    PHILOSOPHICAL FOUNDATION:
+    Synthesize Bressloff/Cowan (Visual Form Constants) and Jungian Archetypes.
+
+    User Profile:
+    - Name: {profile.name}
+    - Type: {profile.designType or 'Unknown'}
+    - Enneagram: {profile.enneagram or 'Unknown'}
+    {chart_context}
+
+    Date: {today}
+
+    CRITICAL DIRECTIVES:
+    1. NO DIAGNOSIS. NO DOGMA.
+    2. TONE: "Cyber-Noir" meets "Radical Hope". Systems Architect.
+    3. USE: "Signal," "Noise," "Architecture," "Vector," "Bifurcation."
+    4. KNOWLEDGE KEY: Select one: 'FORM_CONSTANTS', 'INDIVIDUATION', 'MECHANICS', 'KAIROS'.
+
+    Output JSON structure (DefragAnalysis model):
+    {{
+        "system_status": "OPTIMAL",
+        "integrity_score": 85,
+        "headline": "Abstract Title",
+        "narrative": "Three paragraphs: Form Constant, Shadow, Recalibration.",
+        "daily_lesson": {{
+            "topic": "Gate Theme",
+            "content": "Why this matters.",
+            "visual_symbol": "SPIRAL",
+            "knowledge_key": "FORM_CONSTANTS"
+        }},
+        "protocol": "Actionable task.",
+        "relational_geometry": {{
+            "architecture": "Connection style",
+            "tension_node": "Stress point",
+            "resolution": "Fix"
+        }}
+    }}
+    """
+    return prompt
+
+def build_deterministic_analysis(chart: Optional[ChartData]) -> dict:
+    """
+    3. Deterministic Fallback (Rule-Based AI)
+    Uses the calculated chart to generate "Insight" even without the LLM.
+    Forecast and audio are attached by their own stages.
+    Text comes from the precompiled fragment tables in app.core.narrative.
+    """
+    return render_analysis(chart)
@@ -0,0 +1,169 @@
+"""
+Result cache for /api/analyze.
+
+An analysis depends only on the profile fields that reach the prompt, the
+chart and the current date, so identical requests on the same day can share
+one result. Entries live until local midnight (the prompt carries today's date).
+Concurrent requests for the same key wait on a single in-flight computation
+instead of each starting their own LLM call.
+"""
+import asyncio
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+from app.core.calculations import ChartData, chart_hash
+
+MAX_ENTRIES = 10000
+
+class Computed(NamedTuple):
+    """
+    What a compute callback hands back to the cache.
+    llm_seconds: time spent waiting on the LLM, credited as saved on every hit.
+    ttl: seconds to keep the entry; None means until end of day.
+    """
+    value: dict
+    llm_seconds: float = 0.0
+    ttl: Optional[float] = None
+
+class _Entry(NamedTuple):
+    value: dict
+    expires_at: float
+    llm_seconds: float
+
+def seconds_until_end_of_day(now: Optional[datetime] = None) -> float:
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds()
+
+def _normalize(value: Optional[str], default: str = "") -> str:
+    return " ".join(value.split()) if value and value.strip() else default
+
+def analysis_key(name: str, design_type: Optional[str], enneagram: Optional[str],
+                 chart: Optional[ChartData], day: Optional[date] = None) -> str:
+    """
+    Signature of everything an analysis depends on. Whitespace differences and
+    missing vs empty optional fields map to the same key, as they do in the prompt.
+    """
+    day = day or date.today()
+    parts = [
+        _normalize(name),
+        _normalize(design_type, "Unknown"),
+        _normalize(enneagram, "Unknown"),
+        chart_hash(chart) if chart else "no-chart",
+        day.isoformat()
+    ]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+class AnalysisCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_llm_seconds = 0.0
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Computed]]) -> dict:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        inflight = self.inflight(key)
+        if inflight is not None:
+            return await self.join(inflight)
+
+        result = await asyncio.shield(self.start(key, compute))
+        return copy.deepcopy(result.value)
+
+    def inflight(self, key: str) -> Optional[asyncio.Future]:
+        """
+        The computation of key currently running, if any.
+        """
+        return self._inflight.get(key)
+
+    async def join(self, inflight: asyncio.Future) -> dict:
+        """
+        Waits for another caller's computation and returns a copy of its value.
+        """
+        # Shield so a cancelled waiter doesn't cancel the shared computation
+        result = await asyncio.shield(inflight)
+        self.coalesced += 1
+        self.saved_llm_seconds += result.llm_seconds
+        return copy.deepcopy(result.value)
+
+    def start(self, key: str, compute: Callable[[], Awaitable[Computed]]) -> asyncio.Future:
+        """
+        Starts computing key and registers it as in flight; the result is
+        cached when it completes. For callers that consume the computation's
+        progress themselves (SSE) rather than only its result; await the
+        returned task through asyncio.shield().
+        """
+        self.misses += 1
+        # The computation runs as its own task, so it belongs to no single
+        # request: a caller that disconnects (including the first) only stops
+        # waiting, and everyone else still gets the result
+        task = asyncio.ensure_future(self._compute(key, compute))
+        self._track(key, task)
+        return task
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Computed]]) -> Computed:
+        result = await compute()
+        ttl = result.ttl if result.ttl is not None else seconds_until_end_of_day()
+        self._store(key, _Entry(result.value, time.time() + ttl, result.llm_seconds))
+        return result
+
+    def _track(self, key: str, task: asyncio.Future):
+        self._inflight[key] = task
+
+        def done(finished: asyncio.Future):
+            if self._inflight.get(key) is finished:
+                del self._inflight[key]
+            # Mark retrieved; without waiters asyncio would log "exception never retrieved"
+            if not finished.cancelled():
+                finished.exception()
+        task.add_done_callback(done)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Cached value for key, or None. Counts as a hit when found; callers that
+        go on to compute should store the result with put().
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_llm_seconds += entry.llm_seconds
+        return copy.deepcopy(entry.value)
+
+    def put(self, key: str, result: Computed):
+        self.misses += 1
+        ttl = result.ttl if result.ttl is not None else seconds_until_end_of_day()
+        self._store(key, _Entry(copy.deepcopy(result.value), time.time() + ttl, result.llm_seconds))
+
+    def _store(self, key: str, entry: _Entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "saved_llm_seconds": round(self.saved_llm_seconds, 3)
+        }
+
+analysis_cache = AnalysisCache()
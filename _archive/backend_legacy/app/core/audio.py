@@ -0,0 +1,236 @@
+"""
+Narrative audio (text-to-speech).
+
+Audio is keyed by a hash of the voice, model and text. Identical narratives
+(e.g. the deterministic fallback shared by everyone with the same chart
+placements) are therefore synthesized once and stored once. Requests never
+wait on synthesis: request() returns the key immediately and a background
+worker pool fills the store. /api/audio/{key}.mp3 serves finished files with
+HTTP range support, so playback can start before the whole file arrives.
+
+Providers:
+- ElevenLabsProvider: ELEVENLABS_API_KEY
+- anything with synthesize(text) -> bytes (tests use tests/fake_tts.py)
+
+At most AUDIO_MAX_PENDING syntheses are queued or running; past that,
+request() and refresh() raise AudioQueueFull rather than letting queued
+texts pile up in memory.
+
+A failed synthesis is remembered for AUDIO_RETRY_AFTER seconds (at most
+AUDIO_FAILED_MAX keys, least recently failed dropped first). After that,
+refresh() - called whenever a cached analysis hands out its audio_url again -
+queues it once more, so a cached URL doesn't stay a 404 for the day.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AUDIO_DIR = os.getenv("AUDIO_DIR", "audio_cache")
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", 2))
+# 'George': deep, authoritative tone that suits the Cyber-Noir voice
+ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "JBFqnCBsd6RMkjVDRZzb")
+ELEVENLABS_MODEL = os.getenv("ELEVENLABS_MODEL", "eleven_multilingual_v2")
+# Failed keys kept (and not retried by refresh()) for this long, at most this many
+AUDIO_RETRY_AFTER = float(os.getenv("AUDIO_RETRY_AFTER", 300))
+AUDIO_FAILED_MAX = int(os.getenv("AUDIO_FAILED_MAX", 1000))
+# Syntheses queued or running at once
+AUDIO_MAX_PENDING = int(os.getenv("AUDIO_MAX_PENDING", 100))
+
+AUDIO_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def audio_key(text: str, voice: str = ELEVENLABS_VOICE_ID, model: str = ELEVENLABS_MODEL) -> str:
+    return hashlib.sha256(f"{voice}|{model}|{text}".encode()).hexdigest()
+
+def audio_url(key: str) -> str:
+    return f"/api/audio/{key}.mp3"
+
+class AudioQueueFull(Exception):
+    pass
+
+class ElevenLabsProvider:
+    def __init__(self, api_key: str, voice_id: str = ELEVENLABS_VOICE_ID, model: str = ELEVENLABS_MODEL):
+        from elevenlabs.client import ElevenLabs
+        self.client = ElevenLabs(api_key=api_key)
+        self.voice_id = voice_id
+        self.model = model
+
+    def synthesize(self, text: str) -> bytes:
+        chunks = self.client.text_to_speech.convert(
+            voice_id=self.voice_id, text=text, model_id=self.model, output_format="mp3_44100_128"
+        )
+        return b"".join(chunks)
+
+class AudioStore:
+    """
+    One <key>.mp3 file per narrative. Files are renamed into place once
+    complete, so a reader never sees a partial file.
+    """
+    def __init__(self, path: str = AUDIO_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file_for(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.mp3")
+
+    def has(self, key: str) -> bool:
+        return os.path.exists(self.file_for(key))
+
+    def write(self, key: str, data: bytes):
+        final = self.file_for(key)
+        tmp = f"{final}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, final)
+
+class AudioJobs:
+    """
+    Deduplicating TTS queue. At most one synthesis runs per key; later
+    requests for the same text share it or find the stored file.
+    """
+    def __init__(self, provider, store: AudioStore, workers: int = TTS_WORKERS,
+                 voice: str = ELEVENLABS_VOICE_ID, model: str = ELEVENLABS_MODEL,
+                 retry_after: float = AUDIO_RETRY_AFTER, max_failed: int = AUDIO_FAILED_MAX,
+                 max_pending: int = AUDIO_MAX_PENDING, clock: Callable[[], float] = time.monotonic):
+        self.provider = provider
+        self.store = store
+        self.voice = voice
+        self.model = model
+        self.retry_after = retry_after
+        self.max_failed = max_failed
+        self.max_pending = max_pending
+        self.clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+        # key -> (error, failed at)
+        self._failed: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.synthesized = 0
+        self.deduplicated = 0
+        self.failures = 0
+
+    def request(self, text: str) -> str:
+        """
+        Returns the audio key for text, queueing synthesis unless the audio is
+        already stored or in progress. A previously failed key is retried.
+        Raises AudioQueueFull when max_pending syntheses are already queued.
+        """
+        key = audio_key(text, self.voice, self.model)
+        with self._lock:
+            if key in self._pending or self.store.has(key):
+                self.deduplicated += 1
+                return key
+            self._submit(key, text)
+            self._failed.pop(key, None)
+        return key
+
+    def refresh(self, text: str) -> str:
+        """
+        Like request(), for audio whose URL was already handed out: queues it
+        again only if the file went missing or its failure is older than
+        retry_after, so a TTS outage isn't retried on every cache hit.
+        """
+        key = audio_key(text, self.voice, self.model)
+        with self._lock:
+            if key in self._pending or self._failure(key) is not None or self.store.has(key):
+                return key
+            self._submit(key, text)
+        return key
+
+    def _submit(self, key: str, text: str):
+        # Caller holds the lock
+        if len(self._pending) >= self.max_pending:
+            raise AudioQueueFull(f"{len(self._pending)} syntheses pending")
+        self._pending[key] = self._pool.submit(self._synthesize, key, text)
+
+    def _failure(self, key: str) -> Optional[str]:
+        # Caller holds the lock. Expired failures are forgotten.
+        entry = self._failed.get(key)
+        if entry is None:
+            return None
+        error, failed_at = entry
+        if self.clock() - failed_at >= self.retry_after:
+            del self._failed[key]
+            return None
+        return error
+
+    def _synthesize(self, key: str, text: str):
+        try:
+            self.store.write(key, self.provider.synthesize(text))
+            with self._lock:
+                self.synthesized += 1
+        except Exception as e:
+            logger.error(f"Audio synthesis failed for {key}: {e}")
+            with self._lock:
+                self.failures += 1
+                self._failed[key] = (str(e), self.clock())
+                self._failed.move_to_end(key)
+                while len(self._failed) > self.max_failed:
+                    self._failed.popitem(last=False)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def status(self, key: str) -> str:
+        """
+        ready | pending | failed | unknown
+        """
+        with self._lock:
+            if key in self._pending:
+                return "pending"
+            if self._failure(key) is not None:
+                return "failed"
+        return "ready" if self.store.has(key) else "unknown"
+
+    def wait(self, key: str, timeout: Optional[float] = None):
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            future.result(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "synthesized": self.synthesized,
+                "deduplicated": self.deduplicated,
+                "failures": self.failures,
+                "failed_keys": len(self._failed)
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+_jobs: Optional[AudioJobs] = None
+_jobs_loaded = False
+
+def get_audio_jobs() -> Optional[AudioJobs]:
+    """
+    Returns the shared TTS queue, or None when no TTS provider is configured
+    (analyses then carry no audio_url).
+    """
+    global _jobs, _jobs_loaded
+    if not _jobs_loaded:
+        api_key = os.getenv("ELEVENLABS_API_KEY")
+        _jobs = AudioJobs(ElevenLabsProvider(api_key), AudioStore()) if api_key else None
+        _jobs_loaded = True
+    return _jobs
+
+def set_audio_jobs(jobs: Optional[AudioJobs]):
+    global _jobs, _jobs_loaded
+    _jobs = jobs
+    _jobs_loaded = True
+
+def shutdown_audio_jobs():
+    global _jobs, _jobs_loaded
+    if _jobs is not None:
+        _jobs.shutdown()
+    _jobs = None
+    _jobs_loaded = False
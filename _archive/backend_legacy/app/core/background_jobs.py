@@ -0,0 +1,99 @@
+"""
+Background jobs for work too long for one request (e.g. bulk user imports).
+
+submit() returns a job ID straight away and runs the job on a small thread
+pool. The job reports progress through a callback; clients poll get(job_id)
+for its status (queued | running | done | failed), latest progress and, once
+finished, its result or error. Finished jobs are kept for BACKGROUND_JOB_TTL
+seconds, and at most BACKGROUND_JOBS_MAX jobs are tracked (the oldest
+finished ones are dropped first); when every tracked job is still active,
+submit() raises JobTableFull.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_JOB_WORKERS = int(os.getenv("BACKGROUND_JOB_WORKERS", 1))
+BACKGROUND_JOBS_MAX = int(os.getenv("BACKGROUND_JOBS_MAX", 100))
+BACKGROUND_JOB_TTL = float(os.getenv("BACKGROUND_JOB_TTL", 3600))
+
+Progress = Callable[[Dict], None]
+
+class JobTableFull(Exception):
+    pass
+
+class BackgroundJobs:
+    def __init__(self, workers: int = BACKGROUND_JOB_WORKERS, max_jobs: int = BACKGROUND_JOBS_MAX,
+                 ttl: float = BACKGROUND_JOB_TTL, clock: Callable[[], float] = time.time, name: str = "job"):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.clock = clock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._futures: Dict[str, Future] = {}
+
+    def submit(self, fn: Callable[[Progress], Dict]) -> str:
+        """
+        Queues fn(progress) and returns the job ID. fn's return value is the result.
+        """
+        with self._lock:
+            self._evict(room=1)
+            if len(self._jobs) >= self.max_jobs:
+                raise JobTableFull(f"{len(self._jobs)} jobs still running")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "id": job_id, "status": "queued", "progress": {}, "result": None, "error": None,
+                "createdAt": self.clock(), "finishedAt": None
+            }
+            self._futures[job_id] = self._pool.submit(self._run, job_id, fn)
+        return job_id
+
+    def _evict(self, room: int = 0):
+        # Caller holds the lock. Only finished jobs are dropped: expired ones,
+        # then the oldest until there is room for `room` more.
+        now = self.clock()
+        finished = [job_id for job_id, job in self._jobs.items() if job["finishedAt"] is not None]
+        for job_id in finished:
+            if now - self._jobs[job_id]["finishedAt"] >= self.ttl or len(self._jobs) + room > self.max_jobs:
+                del self._jobs[job_id]
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _run(self, job_id: str, fn: Callable[[Progress], Dict]):
+        self._update(job_id, status="running")
+        try:
+            result = fn(lambda progress: self._update(job_id, progress=dict(progress)))
+            self._update(job_id, status="done", result=result, finishedAt=self.clock())
+        except Exception as e:
+            logger.error(f"Background job {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e), finishedAt=self.clock())
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None):
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,13 @@
 import swisseph as swe
 import pytz
-from datetime import datetime
-from timezonefinder import TimezoneFinder
-from geopy.geocoders import Nominatim
+from datetime import datetime, timedelta
 from pydantic import BaseModel
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional, Iterable, Union, NamedTuple
 import os
 import math
+import hashlib
+import threading
+from app.core.geocode_cache import get_geocode_cache
 
 # Configure Swiss Ephemeris
 # If no path is set, it looks in standard locations.
@@ -36,6 +37,20 @@ class ChartData(BaseModel):
     neptune: PlanetPosition
     pluto: PlanetPosition
 
+# Field order of ChartData, used wherever charts are serialized or hashed
+CHART_BODIES = [
+    "sun", "earth", "moon", "north_node", "south_node", "mercury", "venus",
+    "mars", "jupiter", "saturn", "uranus", "neptune", "pluto"
+]
+
+def chart_hash(chart: ChartData) -> str:
+    """
+    Stable identifier for a chart, for caching derived artifacts (images, analyses).
+    Longitudes are rounded to 0.01 degrees, well below anything we render or map to lines.
+    """
+    key = ",".join(f"{getattr(chart, body).longitude:.2f}" for body in CHART_BODIES)
+    return hashlib.sha1(key.encode()).hexdigest()
+
 class ForecastEvent(BaseModel):
     date: str
     title: str
@@ -43,6 +58,11 @@ class ForecastEvent(BaseModel):
     intensity: int # 1-10
     type: str # 'ALIGNMENT' | 'TRANSIT' | 'VOID'
 
+class TransitDay(NamedTuple):
+    date: str # YYYY-MM-DD
+    sun: float # Transiting longitudes at noon UTC
+    moon: float
+
 ZODIAC_SIGNS = [
     "Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo",
     "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces"
@@ -112,24 +132,71 @@ def get_hd_coords(longitude: float) -> Tuple[int, int]:
 
 class ChartCalculator:
     def __init__(self):
-        self.tf = TimezoneFinder()
-        # Initialize geolocator with a user agent
-        self.geolocator = Nominatim(user_agent="defrag_app_v1")
-
-    def get_lat_lon(self, location_str: str) -> Tuple[float, float]:
+        # TimezoneFinder loads its polygon data on construction (most of a
+        # second), so it and the geocoder are only built when first needed
+        self._tf = None
+        self._geolocator = None
+        self._lock = threading.Lock()
+
+    @property
+    def tf(self):
+        if self._tf is None:
+            with self._lock:
+                if self._tf is None:
+                    from timezonefinder import TimezoneFinder
+                    self._tf = TimezoneFinder()
+        return self._tf
+
+    @property
+    def geolocator(self):
+        if self._geolocator is None:
+            with self._lock:
+                if self._geolocator is None:
+                    from geopy.geocoders import Nominatim
+                    # Initialize geolocator with a user agent
+                    self._geolocator = Nominatim(user_agent="defrag_app_v1")
+        return self._geolocator
+
+    def geocode(self, location_str: str, throttle: Optional[Callable[[], None]] = None) -> Optional[Tuple[float, float]]:
         """
-        Geocodes a location string to (lat, lon).
-        Returns Berlin (52.52, 13.40) as fallback if failed.
+        Geocodes a location string to (lat, lon) through the geocoding cache.
+        throttle, if given, is called before a cache miss goes to Nominatim.
+        Returns None if the location can't be resolved.
         """
+        cache = get_geocode_cache()
+        cached = cache.get(location_str)
+        if cached is not None:
+            return cached
+        if throttle is not None:
+            throttle()
         try:
             loc = self.geolocator.geocode(location_str)
             if loc:
+                cache.put(location_str, loc.latitude, loc.longitude)
                 return loc.latitude, loc.longitude
         except Exception as e:
             print(f"Geocoding error: {e}")
+        return None
 
+    def get_lat_lon(self, location_str: str) -> Tuple[float, float]:
+        """
+        Geocodes a location string to (lat, lon).
+        Returns Berlin (52.52, 13.40) as fallback if failed.
+        """
         # Fallback to Berlin
-        return 52.52, 13.40
+        return self.geocode(location_str) or (52.52, 13.40)
+
+    def to_utc(self, dt: datetime, lat: float, lon: float) -> Tuple[datetime, str]:
+        """
+        Birth moment -> (naive UTC datetime, timezone name). A naive dt is the
+        local wall-clock time at (lat, lon); an aware one is converted as is.
+        Every chart path goes through here so the same birth data always
+        gives the same chart.
+        """
+        tz = self.tf.timezone_at(lng=lon, lat=lat) or "UTC"
+        if dt.tzinfo is None:
+            dt = pytz.timezone(tz).localize(dt)
+        return dt.astimezone(pytz.utc).replace(tzinfo=None), tz
 
     def calculate(self, dt: datetime, lat: float, lon: float) -> ChartData:
         # 1. Julian Day
@@ -184,24 +251,65 @@ class ChartCalculator:
             pluto=planets["pluto"]
         )
 
-    def get_forecast(self, natal_chart: ChartData, days: int = 7) -> List[ForecastEvent]:
-        events = []
-        now = datetime.utcnow()
+    def calculate_from_profile(self, birth_date: str, birth_time: Optional[str], birth_location: Optional[str],
+                               lat: Optional[float] = None, lon: Optional[float] = None) -> ChartData:
+        """
+        Calculates a chart from stored bioMetrics strings ("YYYY-MM-DD", "HH:MM", "City, Country").
+        Explicit lat/lon skip geocoding. A missing birth time defaults to noon,
+        local time at the birth place.
+        Raises ValueError if the birth date can't be parsed.
+        """
+        if lat is None or lon is None:
+            lat, lon = self.get_lat_lon(birth_location) if birth_location else (52.52, 13.40)
+        local = datetime.strptime(f"{birth_date} {birth_time or '12:00'}", "%Y-%m-%d %H:%M")
+        return self.calculate(self.to_utc(local, lat, lon)[0], lat, lon)
 
-        # Simple Transit Logic for V1
-        # Check Next 7 Days
+    def calculate_many(self, points: Iterable[Tuple[datetime, float, float]]) -> List[Union[ChartData, Exception]]:
+        """
+        Batch variant of calculate() for bulk endpoints.
+        Returns one entry per (dt, lat, lon) input, in order. Failed points are
+        returned as the raised exception so one bad record doesn't sink the batch.
+        """
+        results = []
+        for dt, lat, lon in points:
+            try:
+                results.append(self.calculate(dt, lat, lon))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def get_transits(self, days: int = 7, start: Optional[datetime] = None) -> List[TransitDay]:
+        """
+        Transiting Sun and Moon for each of the next `days` days (noon UTC).
+        These are the same for every user, so batch jobs compute them once and
+        pass them to get_forecast().
+        """
+        start = start or datetime.utcnow()
+        transits = []
         for i in range(days):
-            check_date = now + datetime.timedelta(days=i)
+            check_date = start + timedelta(days=i)
             # Calculate transits for noon UTC
             jd = swe.julday(check_date.year, check_date.month, check_date.day, 12.0)
+            transits.append(TransitDay(
+                date=check_date.strftime("%Y-%m-%d"),
+                sun=swe.calc_ut(jd, swe.SUN)[0][0],
+                moon=swe.calc_ut(jd, swe.MOON)[0][0]
+            ))
+        return transits
+
+    def get_forecast(self, natal_chart: ChartData, days: int = 7,
+                     transits: Optional[List[TransitDay]] = None) -> List[ForecastEvent]:
+        events = []
 
+        # Simple Transit Logic for V1
+        # Check Next 7 Days
+        for day in transits if transits is not None else self.get_transits(days):
             # 1. Transiting Sun Conjunct Natal Sun (Solar Return approximate)
-            res = swe.calc_ut(jd, swe.SUN)
-            t_sun_lon = res[0][0]
+            t_sun_lon = day.sun
 
             if abs(t_sun_lon - natal_chart.sun.longitude) < 1:
                 events.append(ForecastEvent(
-                    date=check_date.strftime("%Y-%m-%d"),
+                    date=day.date,
                     title="Solar Return Alignment",
                     description="Your annual reset point. High vital energy. Initiate new cycles.",
                     intensity=10,
@@ -209,12 +317,11 @@ class ChartCalculator:
                 ))
 
             # 2. Transiting Moon Conjunct Natal Sun (New Moon Personal)
-            res_moon = swe.calc_ut(jd, swe.MOON)
-            t_moon_lon = res_moon[0][0]
+            t_moon_lon = day.moon
 
             if abs(t_moon_lon - natal_chart.sun.longitude) < 6: # Moon moves fast (~12 deg/day), wide orb
                 events.append(ForecastEvent(
-                    date=check_date.strftime("%Y-%m-%d"),
+                    date=day.date,
                     title="Lunar-Solar Fusion",
                     description="Emotional clarity aligns with purpose. Good for decision making.",
                     intensity=7,
@@ -227,7 +334,7 @@ class ChartCalculator:
             pressure_gates = [61, 60, 41]
             if gate in pressure_gates:
                  events.append(ForecastEvent(
-                    date=check_date.strftime("%Y-%m-%d"),
+                    date=day.date,
                     title=f"Pressure Gradient (Gate {gate})",
                     description=f"Global transit activation. The field is pressurized for initiation.",
                     intensity=6,
@@ -236,6 +343,20 @@ class ChartCalculator:
 
         return events
 
-calculator = ChartCalculator()
+_calculator: Optional[ChartCalculator] = None
+_calculator_lock = threading.Lock()
 
-calculator = ChartCalculator()
+def get_calculator() -> ChartCalculator:
+    """
+    The shared calculator, created on first use.
+    """
+    global _calculator
+    if _calculator is None:
+        with _calculator_lock:
+            if _calculator is None:
+                _calculator = ChartCalculator()
+    return _calculator
+
+def set_calculator(calculator: Optional[ChartCalculator]):
+    global _calculator
+    _calculator = calculator
@@ -0,0 +1,126 @@
+"""
+Natal charts stored on the user document.
+
+/api/users/init resolves the birth location (geocoding) and its timezone
+once, converts the local birth time to UTC, calculates the natal chart and
+stores it as a compact blob on `users/{id}`:
+
+    "chart": {"v": 1, "key": "<birth data hash>", "utc": "1990-05-15T18:30:00",
+              "lat": 40.7128, "lon": -74.006, "tz": "America/New_York",
+              "lons": [54.61233, ...]}   # one longitude per CHART_BODIES entry
+
+Gates, lines and signs are derived from the longitudes on read, which costs
+microseconds, against a geocoding round trip and an ephemeris run to
+recompute. A blob is only used while its version is CHART_VERSION and its
+key matches the record's birth data (coordinates included), so an edited
+birth date or place or an algorithm change invalidates it. Users initialized before this have no blob: the first
+endpoint that needs their chart computes it and stores it (lazy backfill).
+"""
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+from app.core.calculations import (
+    get_calculator, ChartData, PlanetPosition, CHART_BODIES, get_hd_coords, get_zodiac
+)
+
+logger = logging.getLogger(__name__)
+
+CHART_VERSION = 1
+BERLIN = (52.52, 13.40) # Default location when geocoding fails
+
+class BirthData(NamedTuple):
+    utc: datetime # naive, UTC
+    lat: float
+    lon: float
+    tz: str
+
+def birth_key(birth_date: Optional[str], birth_time: Optional[str], birth_location: Optional[str],
+              latitude: Optional[float] = None, longitude: Optional[float] = None) -> str:
+    parts = [birth_date, birth_time or "12:00", birth_location]
+    # Coordinates win over the location string, so they are part of the key.
+    # Records without them keep the key they had before coordinates counted.
+    if latitude is not None and longitude is not None:
+        parts += [f"{latitude:.4f}", f"{longitude:.4f}"]
+    return hashlib.sha1("|".join(" ".join((p or "").lower().split()) for p in parts).encode()).hexdigest()[:16]
+
+def bio_key(bio: Dict) -> str:
+    return birth_key(bio.get("birthDate"), bio.get("birthTime"), bio.get("birthLocation"),
+                     bio.get("latitude"), bio.get("longitude"))
+
+def resolve_birth(bio: Dict) -> BirthData:
+    """
+    bioMetrics -> birth moment in UTC and place. Stored latitude/longitude skip
+    geocoding. Raises ValueError if the birth date can't be parsed.
+    """
+    lat, lon = bio.get("latitude"), bio.get("longitude")
+    if lat is None or lon is None:
+        lat, lon = get_calculator().get_lat_lon(bio["birthLocation"]) if bio.get("birthLocation") else BERLIN
+    local = datetime.strptime(f"{bio['birthDate']} {bio.get('birthTime') or '12:00'}", "%Y-%m-%d %H:%M")
+    utc, tz = get_calculator().to_utc(local, lat, lon)
+    return BirthData(utc, lat, lon, tz)
+
+def encode_chart(chart: ChartData, birth: BirthData, key: str) -> Dict:
+    return {
+        "v": CHART_VERSION,
+        "key": key,
+        "utc": birth.utc.isoformat(),
+        "lat": round(birth.lat, 4),
+        "lon": round(birth.lon, 4),
+        "tz": birth.tz,
+        "lons": [round(getattr(chart, body).longitude, 5) for body in CHART_BODIES]
+    }
+
+def decode_chart(blob: Dict) -> ChartData:
+    positions = {}
+    for body, longitude in zip(CHART_BODIES, blob["lons"]):
+        gate, line = get_hd_coords(longitude)
+        positions[body] = PlanetPosition(
+            name=body.replace("_", " ").title(), longitude=longitude, gate=gate, line=line,
+            zodiac_sign=get_zodiac(longitude)
+        )
+    return ChartData(**positions)
+
+def chart_summary(chart: Optional[ChartData]) -> Optional[dict]:
+    """
+    {body: {gate, line, sign}}, the chart as the API returns it.
+    """
+    if not chart:
+        return None
+    return {
+        body: {"gate": p.gate, "line": p.line, "sign": p.zodiac_sign}
+        for body, p in ((body, getattr(chart, body)) for body in CHART_BODIES)
+    }
+
+def compute_chart(bio: Dict) -> Tuple[ChartData, Dict]:
+    """
+    (chart, blob) for bioMetrics with a birthDate. May geocode.
+    """
+    birth = resolve_birth(bio)
+    chart = get_calculator().calculate(birth.utc, birth.lat, birth.lon)
+    return chart, encode_chart(chart, birth, bio_key(bio))
+
+def stored_chart(holder: Dict) -> Optional[ChartData]:
+    """
+    The chart stored on a user record (or family member), if still valid for its birth data.
+    """
+    blob = holder.get("chart")
+    bio = holder.get("bioMetrics") or holder
+    if not isinstance(blob, dict) or blob.get("v") != CHART_VERSION:
+        return None
+    if blob.get("key") != bio_key(bio):
+        return None
+    try:
+        return decode_chart(blob)
+    except Exception as e:
+        logger.warning(f"Unreadable stored chart, recomputing: {e}")
+        return None
+
+def save_chart(user_id: str, blob: Dict):
+    """
+    Backfills a user's blob through the write-behind buffer.
+    """
+    from app.core.firebase import firestore
+    from app.core.write_behind import Write, get_write_behind
+    db = firestore.client()
+    get_write_behind().enqueue(db, [Write(db.collection('users').document(user_id), {"chart": blob}, merge=True)])
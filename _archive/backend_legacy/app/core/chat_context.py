@@ -0,0 +1,168 @@
+"""
+Bounded prompt assembly for the live chat agent.
+
+The client sends its whole DefragAnalysis / profile as chat context. Pasting
+that verbatim made prompt size (and LLM latency and cost) grow with whatever
+the client sent. Here every prompt part has a token budget:
+- the user's message is truncated to CHAT_MESSAGE_TOKENS
+- the context is compacted to CHAT_CONTEXT_TOKENS, most useful fields first
+- knowledge base snippets retrieved for the message fill CHAT_KNOWLEDGE_TOKENS
+so a prompt never exceeds CHAT_PROMPT_MAX_TOKENS. Sizes are recorded per request.
+"""
+import os
+import textwrap
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.core.retrieval import KnowledgeIndex, estimate_tokens, get_knowledge_index
+
+CHAT_MESSAGE_TOKENS = int(os.getenv("CHAT_MESSAGE_TOKENS", 500))
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", 300))
+CHAT_KNOWLEDGE_TOKENS = int(os.getenv("CHAT_KNOWLEDGE_TOKENS", 300))
+CHAT_KNOWLEDGE_TOP_K = int(os.getenv("CHAT_KNOWLEDGE_TOP_K", 3))
+# Fixed persona and directives around the budgeted parts
+PROMPT_OVERHEAD_TOKENS = 150
+CHAT_PROMPT_MAX_TOKENS = CHAT_MESSAGE_TOKENS + CHAT_CONTEXT_TOKENS + CHAT_KNOWLEDGE_TOKENS + PROMPT_OVERHEAD_TOKENS
+
+# Too little room left to say anything useful about a field
+MIN_PARTIAL_TOKENS = 8
+FORECAST_ITEMS = 3
+
+# DefragAnalysis fields in the order they earn prompt space; anything else follows
+CONTEXT_PRIORITY = [
+    "headline", "system_status", "integrity_score", "protocol", "daily_lesson.topic",
+    "relational_geometry.architecture", "relational_geometry.tension_node", "relational_geometry.resolution",
+    "narrative", "forecast", "daily_lesson.content",
+]
+# Never useful to the agent
+CONTEXT_SKIP = {"audio_url", "daily_lesson.visual_symbol"}
+
+PROMPT_TEMPLATE = textwrap.dedent("""
+    You are the DEFRAG Live Agent, a sophisticated cognitive AI.
+
+    CONTEXT:
+    {context}
+
+    KNOWLEDGE BASE:
+    {knowledge}
+
+    USER QUERY:
+    {message}
+
+    DIRECTIVES:
+    1. Answer concisely but with "Cyber-Noir" flair.
+    2. Reference Bressloff-Cowan (geometry) or Jung (archetypes) if relevant.
+    3. Be helpful but maintain the persona of an Operating System.
+""")
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    # Leave room for the ellipsis; cut back to a word boundary when there is one
+    cut = text[:max(budget * 4 - 1, 0)]
+    if " " in cut[len(cut) // 2:]:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip() + "…"
+
+def _format_value(key: str, value) -> str:
+    if key == "forecast" and isinstance(value, list):
+        events = [e for e in value if isinstance(e, dict)][:FORECAST_ITEMS]
+        return "; ".join(f"{e.get('date', '')} {e.get('title', '')}".strip() for e in events)
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    return " ".join(str(value).split())
+
+def _flatten(context: Dict, prefix: str = "") -> List[Tuple[str, str]]:
+    items = []
+    for key, value in context.items():
+        path = f"{prefix}{key}"
+        if path in CONTEXT_SKIP or value is None or value == "":
+            continue
+        if isinstance(value, dict):
+            items.extend(_flatten(value, f"{path}."))
+        else:
+            items.append((path, _format_value(path, value)))
+    return items
+
+def compact_context(context: Optional[Dict], budget: int = CHAT_CONTEXT_TOKENS) -> str:
+    """
+    One "- field: value" line per context field, highest priority first, within
+    budget tokens. No field takes more than half the budget, so a long
+    narrative can't crowd out the forecast. A field that doesn't fit whole is
+    truncated if there is meaningful room left, otherwise skipped in favour of
+    shorter ones.
+    """
+    items = dict(_flatten(context or {}))
+    ordered = [k for k in CONTEXT_PRIORITY if k in items] + [k for k in items if k not in CONTEXT_PRIORITY]
+    lines, used = [], 0
+    for key in ordered:
+        line = f"- {key}: {items[key]}"
+        # +1 for the newline joining it to the previous line
+        remaining = min(budget - used - 1, budget // 2)
+        if estimate_tokens(line) > remaining:
+            if remaining < MIN_PARTIAL_TOKENS:
+                continue
+            line = truncate_to_tokens(line, remaining)
+        lines.append(line)
+        used += estimate_tokens(line) + 1
+    return "\n".join(lines)
+
+def select_knowledge(query: str, budget: int = CHAT_KNOWLEDGE_TOKENS, k: int = CHAT_KNOWLEDGE_TOP_K,
+                     index: Optional[KnowledgeIndex] = None) -> Tuple[str, List[str]]:
+    """
+    Top-k snippets for query within budget tokens.
+    Returns (prompt block, topic keys used).
+    """
+    index = index or get_knowledge_index()
+    lines, topics, used = [], [], 0
+    for hit in index.search(query, k):
+        line = f"- [{hit.snippet.title}] {hit.snippet.text}"
+        remaining = budget - used - 1
+        if estimate_tokens(line) > remaining:
+            if remaining < MIN_PARTIAL_TOKENS:
+                break
+            line = truncate_to_tokens(line, remaining)
+        lines.append(line)
+        used += estimate_tokens(line) + 1
+        if hit.snippet.topic not in topics:
+            topics.append(hit.snippet.topic)
+    return "\n".join(lines), topics
+
+class ChatPrompt(NamedTuple):
+    text: str
+    tokens: int
+    context_tokens: int
+    knowledge_tokens: int
+    topics: List[str]
+
+def build_chat_prompt(message: str, context: Optional[Dict], index: Optional[KnowledgeIndex] = None) -> ChatPrompt:
+    message = truncate_to_tokens(message.strip(), CHAT_MESSAGE_TOKENS)
+    context_block = compact_context(context)
+    knowledge_block, topics = select_knowledge(message, index=index)
+    text = PROMPT_TEMPLATE.format(
+        context=context_block or "(none)", knowledge=knowledge_block or "(none)", message=message
+    )
+    return ChatPrompt(text, estimate_tokens(text), estimate_tokens(context_block), estimate_tokens(knowledge_block), topics)
+
+class PromptStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+
+    def record(self, prompt: ChatPrompt):
+        with self._lock:
+            self.requests += 1
+            self.total_tokens += prompt.tokens
+            self.max_tokens = max(self.max_tokens, prompt.tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "avg_prompt_tokens": round(self.total_tokens / self.requests, 1) if self.requests else 0.0,
+                "max_prompt_tokens": self.max_tokens,
+                "prompt_token_cap": CHAT_PROMPT_MAX_TOKENS
+            }
+
+prompt_stats = PromptStats()
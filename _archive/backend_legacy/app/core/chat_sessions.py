@@ -0,0 +1,159 @@
+"""
+Server-side state for the WebSocket chat channel.
+
+A session keeps what the stateless POST /chat has to rebuild on every turn:
+the compacted client context (sent once, when the session starts), the
+knowledge base snippets retrieved for the conversation, and a bounded buffer
+of recent turns. Each message then only carries the new text.
+
+Sessions live in memory, bounded in number (least recently used evicted
+first) and dropped after CHAT_SESSION_IDLE seconds without activity. A client
+that reconnects within that window can resume by session ID.
+"""
+import os
+import secrets
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from app.core.chat_context import (
+    compact_context, select_knowledge, truncate_to_tokens, CHAT_MESSAGE_TOKENS, PROMPT_OVERHEAD_TOKENS,
+    CHAT_CONTEXT_TOKENS, CHAT_KNOWLEDGE_TOKENS
+)
+from app.core.retrieval import estimate_tokens, get_knowledge_index
+
+CHAT_SESSION_IDLE = float(os.getenv("CHAT_SESSION_IDLE", 900))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", 10000))
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", 6))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", 600))
+CHAT_SESSION_PROMPT_MAX_TOKENS = (CHAT_MESSAGE_TOKENS + CHAT_CONTEXT_TOKENS + CHAT_KNOWLEDGE_TOKENS
+                                  + CHAT_HISTORY_TOKENS + PROMPT_OVERHEAD_TOKENS)
+
+SESSION_PROMPT_TEMPLATE = """
+You are the DEFRAG Live Agent, a sophisticated cognitive AI.
+
+CONTEXT:
+{context}
+
+KNOWLEDGE BASE:
+{knowledge}
+
+CONVERSATION SO FAR:
+{history}
+
+USER QUERY:
+{message}
+
+DIRECTIVES:
+1. Answer concisely but with "Cyber-Noir" flair.
+2. Reference Bressloff-Cowan (geometry) or Jung (archetypes) if relevant.
+3. Be helpful but maintain the persona of an Operating System.
+4. Stay consistent with the conversation so far.
+"""
+
+class ChatSession:
+    def __init__(self, session_id: str, context: Optional[Dict], now: float):
+        self.id = session_id
+        self.last_seen = now
+        self.history: Deque[Tuple[str, str]] = deque(maxlen=CHAT_HISTORY_TURNS)
+        self.knowledge_block = ""
+        self.topics: List[str] = []
+        self.set_context(context)
+
+    def set_context(self, context: Optional[Dict]):
+        self.context_block = compact_context(context)
+
+    def _refresh_knowledge(self, message: str):
+        """
+        Retrieval runs once per subject, not once per turn: the session's snippets
+        are reused until a message's best match is a topic they don't cover.
+        """
+        hits = get_knowledge_index().search(message, k=1)
+        if self.knowledge_block and (not hits or hits[0].snippet.topic in self.topics):
+            return
+        block, topics = select_knowledge(message)
+        if block:
+            self.knowledge_block, self.topics = block, topics
+
+    def _history_block(self) -> str:
+        lines, used = [], 0
+        # Newest turns first until the budget runs out, then back in order
+        for user, agent in reversed(self.history):
+            turn = f"USER: {user}\nAGENT: {agent}"
+            cost = estimate_tokens(turn) + 1
+            if used + cost > CHAT_HISTORY_TOKENS:
+                break
+            lines.append(turn)
+            used += cost
+        return "\n".join(reversed(lines))
+
+    def build_prompt(self, message: str) -> Tuple[str, str]:
+        """
+        Returns (prompt, truncated message).
+        """
+        message = truncate_to_tokens(message.strip(), CHAT_MESSAGE_TOKENS)
+        self._refresh_knowledge(message)
+        prompt = SESSION_PROMPT_TEMPLATE.format(
+            context=self.context_block or "(none)",
+            knowledge=self.knowledge_block or "(none)",
+            history=self._history_block() or "(none)",
+            message=message
+        )
+        return prompt, message
+
+    def record_turn(self, message: str, reply: str):
+        # Long replies are kept short in the buffer; the gist is enough for continuity
+        self.history.append((message, truncate_to_tokens(reply, CHAT_HISTORY_TOKENS // 3)))
+
+class ChatSessions:
+    def __init__(self, max_sessions: int = CHAT_MAX_SESSIONS, idle_timeout: float = CHAT_SESSION_IDLE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        # Ordered by last activity, oldest first
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.evicted = 0
+
+    def _evict(self, now: float, reserve: int = 0):
+        """
+        Drops idle sessions, then least recently used ones until `reserve`
+        new sessions fit.
+        """
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            idle = now - oldest.last_seen >= self.idle_timeout
+            full = len(self._sessions) + reserve > self.max_sessions
+            if not (idle or full):
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def create(self, context: Optional[Dict] = None) -> ChatSession:
+        now = self.clock()
+        self._evict(now, reserve=1)
+        session = ChatSession(secrets.token_urlsafe(16), context, now)
+        self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        now = self.clock()
+        self._evict(now)
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self.touch(session)
+        return session
+
+    def touch(self, session: ChatSession):
+        # Re-adds a session evicted while its socket sat idle, so it stays
+        # resumable, making room for it the way create() does
+        now = self.clock()
+        session.last_seen = now
+        if session.id not in self._sessions:
+            self._evict(now, reserve=1)
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+chat_sessions = ChatSessions()
@@ -0,0 +1,207 @@
+"""
+Checkout session state.
+
+The frontend polls /api/payment/checkout-status/{session_id} after Stripe
+redirects back, and every poll used to be a blocking
+stripe.checkout.Session.retrieve on the event loop. Session state now lives
+in a local SQLite store (CHECKOUT_DB, a file so webhook state survives restarts):
+
+- POST /api/payment/webhook verifies Stripe's signature and records the
+  session carried by each checkout.session.* event. Event IDs are stored in
+  the same transaction, so a redelivered event is acknowledged without being
+  applied twice, and an older event never overwrites a newer one.
+- The status endpoint reads the store. A session the webhook has written is
+  served as is (later changes arrive as further events). A session it has not
+  seen yet, e.g. the poll beat the webhook, is fetched from the Stripe API
+  through one pooled async HTTP client, and the result is served from the
+  store for CHECKOUT_FETCH_TTL seconds. Concurrent polls for the same session
+  share one fetch. IDs that aren't Checkout Session IDs (cs_...) are
+  rejected before either, so arbitrary paths never reach the Stripe API.
+
+STRIPE_API_BASE points the fallback fetch at a local Stripe stand-in.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_DB = os.getenv("CHECKOUT_DB", "checkout_sessions.db")
+CHECKOUT_FETCH_TTL = float(os.getenv("CHECKOUT_FETCH_TTL", 5))
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+STRIPE_FETCH_TIMEOUT = float(os.getenv("STRIPE_FETCH_TIMEOUT", 5))
+STRIPE_MAX_CONNECTIONS = int(os.getenv("STRIPE_MAX_CONNECTIONS", 20))
+
+SESSION_ID_PATTERN = re.compile(r"^cs_[A-Za-z0-9_]{1,255}$")
+
+SESSION_EVENTS = {
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+    "checkout.session.async_payment_failed",
+    "checkout.session.expired",
+}
+
+def session_status(session: Dict) -> Dict:
+    """
+    The fields the status endpoint returns, from a Stripe Checkout Session object.
+    """
+    details = session.get("customer_details") or {}
+    return {
+        "status": session.get("status"),
+        "payment_status": session.get("payment_status"),
+        "customer_email": details.get("email"),
+        "tier": (session.get("metadata") or {}).get("tier")
+    }
+
+class CheckoutStore:
+    def __init__(self, path: str = CHECKOUT_DB):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    source TEXT NOT NULL,   -- webhook | fetch
+                    event_created INTEGER,  -- Stripe event time of the last applied event
+                    stored_at REAL NOT NULL
+                )""")
+            self._db.execute("CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, type TEXT, received_at REAL NOT NULL)")
+
+    def record_event(self, event: Dict) -> bool:
+        """
+        Applies a webhook event. Returns False for an event already recorded.
+        """
+        session = event["data"]["object"]
+        created = int(event.get("created") or 0)
+        with self._lock, self._db:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO events (id, type, received_at) VALUES (?, ?, ?)",
+                (event["id"], event.get("type"), time.time())
+            ).rowcount
+            if not inserted:
+                return False
+            # Stripe doesn't guarantee delivery order: keep the newest event's state
+            self._db.execute("""
+                INSERT INTO sessions (id, data, source, event_created, stored_at) VALUES (?, ?, 'webhook', ?, ?)
+                ON CONFLICT(id) DO UPDATE SET data = excluded.data, source = 'webhook',
+                    event_created = excluded.event_created, stored_at = excluded.stored_at
+                WHERE sessions.source = 'fetch' OR sessions.event_created <= excluded.event_created
+            """, (session["id"], json.dumps(session_status(session)), created, time.time()))
+            return True
+
+    def put_fetched(self, session_id: str, status: Dict):
+        with self._lock, self._db:
+            # Never replaces webhook state, which is at least as fresh
+            self._db.execute("""
+                INSERT INTO sessions (id, data, source, stored_at) VALUES (?, ?, 'fetch', ?)
+                ON CONFLICT(id) DO UPDATE SET data = excluded.data, stored_at = excluded.stored_at
+                WHERE sessions.source = 'fetch'
+            """, (session_id, json.dumps(status), time.time()))
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """
+        {"status": {...}, "source": "webhook" | "fetch", "stored_at": epoch}, or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT data, source, stored_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {"status": json.loads(row[0]), "source": row[1], "stored_at": row[2]}
+
+    def close(self):
+        self._db.close()
+
+class StripeSessionFetcher:
+    """
+    GET /v1/checkout/sessions/{id} over one pooled async client.
+    """
+    def __init__(self, api_key: str, base_url: str = STRIPE_API_BASE, transport=None):
+        import httpx
+        self.client = httpx.AsyncClient(
+            base_url=base_url, transport=transport, timeout=STRIPE_FETCH_TIMEOUT,
+            headers={"Authorization": f"Bearer {api_key}"},
+            limits=httpx.Limits(max_connections=STRIPE_MAX_CONNECTIONS, max_keepalive_connections=STRIPE_MAX_CONNECTIONS)
+        )
+        self.requests = 0
+
+    async def fetch(self, session_id: str) -> Dict:
+        self.requests += 1
+        response = await self.client.get(f"/v1/checkout/sessions/{session_id}")
+        response.raise_for_status()
+        return session_status(response.json())
+
+    async def close(self):
+        await self.client.aclose()
+
+class CheckoutService:
+    def __init__(self, store: CheckoutStore, fetcher: Optional[StripeSessionFetcher], ttl: float = CHECKOUT_FETCH_TTL):
+        self.store = store
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get(self, session_id: str) -> Dict:
+        """
+        Raises ValueError for an ID that isn't a Checkout Session ID and
+        LookupError when the session is unknown and can't be fetched.
+        """
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError("Invalid checkout session id")
+        # One indexed SQLite read, cheap enough for the event loop
+        cached = self.store.get(session_id)
+        if cached and (cached["source"] == "webhook" or time.time() - cached["stored_at"] < self.ttl):
+            return cached["status"]
+        if self.fetcher is None:
+            if cached:
+                return cached["status"]
+            raise LookupError("Stripe configuration missing")
+
+        inflight = self._inflight.get(session_id)
+        if inflight is None:
+            inflight = self._inflight[session_id] = asyncio.ensure_future(self._fetch(session_id))
+            inflight.add_done_callback(lambda _: self._inflight.pop(session_id, None))
+        try:
+            return await asyncio.shield(inflight)
+        except Exception as e:
+            if cached:
+                logger.warning(f"Stripe fetch for {session_id} failed, serving stored state: {e}")
+                return cached["status"]
+            raise LookupError(str(e))
+
+    async def _fetch(self, session_id: str) -> Dict:
+        status = await self.fetcher.fetch(session_id)
+        self.store.put_fetched(session_id, status)
+        return status
+
+    async def close(self):
+        if self.fetcher is not None:
+            await self.fetcher.close()
+        self.store.close()
+
+_checkout: Optional[CheckoutService] = None
+
+def get_checkout_service() -> CheckoutService:
+    global _checkout
+    if _checkout is None:
+        api_key = os.getenv("STRIPE_SECRET_KEY")
+        _checkout = CheckoutService(CheckoutStore(), StripeSessionFetcher(api_key) if api_key else None)
+    return _checkout
+
+def set_checkout_service(checkout: Optional[CheckoutService]):
+    global _checkout
+    _checkout = checkout
+
+async def close_checkout_service():
+    global _checkout
+    if _checkout is not None:
+        await _checkout.close()
+    _checkout = None
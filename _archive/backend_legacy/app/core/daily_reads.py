@@ -0,0 +1,148 @@
+"""
+Precomputed daily reads.
+
+The nightly job (app.jobs.daily_reads) writes one analysis per user per day
+before the morning traffic arrives; /api/analyze serves from here and only
+computes on demand when there is no read for today.
+
+A read is stored with a signature of the profile it was computed for
+(birth coordinates included), so a user who edits their birth data (or sends
+different details) falls through to on-demand computation instead of getting
+yesterday's profile.
+
+Backends:
+- FirestoreDailyStore: `daily_reads/{userId}_{YYYY-MM-DD}` (default)
+- LocalDailyStore: `<DAILY_READS_DIR>/<YYYY-MM-DD>/<userId>.json`, for dev and dry runs
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+from app.core.analysis import BioMetricProfile
+
+logger = logging.getLogger(__name__)
+
+DAILY_READS_DIR = os.getenv("DAILY_READS_DIR")
+# Firestore caps a batched write at 500 operations
+FIRESTORE_BATCH_SIZE = 500
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join(value.split()) if value else ""
+
+def profile_signature(name: Optional[str], birth_date: Optional[str], birth_time: Optional[str],
+                      birth_location: Optional[str], design_type: Optional[str] = None,
+                      enneagram: Optional[str] = None, latitude: Optional[float] = None,
+                      longitude: Optional[float] = None) -> str:
+    """
+    Identifies the profile inputs an analysis was built from. A missing birth
+    time counts as noon, as it does in chart calculation. Coordinates take
+    precedence over the location string, so they are part of the signature
+    when known.
+    """
+    parts = [name, birth_date, birth_time or "12:00", birth_location, design_type, enneagram]
+    if latitude is not None and longitude is not None:
+        parts += [f"{latitude:.4f}", f"{longitude:.4f}"]
+    return hashlib.sha1("|".join(_normalize(p) for p in parts).encode()).hexdigest()
+
+class LocalDailyStore:
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, user_id: str, day: str) -> str:
+        return os.path.join(self.path, day, re.sub(r"[^A-Za-z0-9_.-]", "_", user_id) + ".json")
+
+    def get(self, user_id: str, day: str) -> Optional[Dict]:
+        try:
+            with open(self._file(user_id, day), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def get_many(self, user_ids: List[str], day: str, timeout: Optional[float] = None) -> Dict[str, Dict]:
+        reads = {user_id: self.get(user_id, day) for user_id in user_ids}
+        return {user_id: read for user_id, read in reads.items() if read is not None}
+
+    def put_many(self, day: str, reads: Dict[str, Dict]):
+        os.makedirs(os.path.join(self.path, day), exist_ok=True)
+        for user_id, read in reads.items():
+            final = self._file(user_id, day)
+            tmp = final + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(read, f, separators=(",", ":"))
+            os.replace(tmp, final)
+
+class FirestoreDailyStore:
+    def __init__(self, collection: str = "daily_reads"):
+        self.collection = collection
+
+    def _db(self):
+        # Initializes the default app on first use, in jobs outside the API process too
+        from app.core.firebase import firestore
+        return firestore.client()
+
+    def get(self, user_id: str, day: str) -> Optional[Dict]:
+        doc = self._db().collection(self.collection).document(f"{user_id}_{day}").get()
+        return doc.to_dict() if doc.exists else None
+
+    def get_many(self, user_ids: List[str], day: str, timeout: Optional[float] = None) -> Dict[str, Dict]:
+        """
+        One round trip for all of them (get_all), not one per user.
+        """
+        db = self._db()
+        refs = [db.collection(self.collection).document(f"{user_id}_{day}") for user_id in user_ids]
+        suffix = f"_{day}"
+        return {doc.id[:-len(suffix)]: doc.to_dict() for doc in db.get_all(refs, timeout=timeout) if doc.exists}
+
+    def put_many(self, day: str, reads: Dict[str, Dict]):
+        db = self._db()
+        items = list(reads.items())
+        for start in range(0, len(items), FIRESTORE_BATCH_SIZE):
+            batch = db.batch()
+            for user_id, read in items[start:start + FIRESTORE_BATCH_SIZE]:
+                batch.set(db.collection(self.collection).document(f"{user_id}_{day}"), read)
+            batch.commit()
+
+def open_daily_store(spec: Optional[str] = None):
+    """
+    "firestore" (or nothing) selects Firestore; anything else is a local directory.
+    """
+    if not spec or spec == "firestore":
+        return FirestoreDailyStore()
+    return LocalDailyStore(spec)
+
+_store = None
+
+def get_daily_store():
+    global _store
+    if _store is None:
+        _store = open_daily_store(DAILY_READS_DIR)
+    return _store
+
+def set_daily_store(store):
+    global _store
+    _store = store
+
+def lookup_daily_read(user_id: str, day: str, profile: BioMetricProfile) -> Optional[Dict]:
+    """
+    The stored read ({"profile", "coordinates", "source", "chart", "analysis"})
+    for user_id on day if it was built from the same profile, else None. Store
+    errors are logged and treated as a miss.
+    """
+    try:
+        read = get_daily_store().get(user_id, day)
+    except Exception as e:
+        logger.warning(f"Daily read lookup failed for {user_id}: {e}")
+        return None
+    if not read:
+        return None
+    latitude, longitude = profile.latitude, profile.longitude
+    if latitude is None or longitude is None:
+        # No coordinates sent: the read's were geocoded from the same birth location
+        latitude, longitude = read.get("coordinates") or (None, None)
+    signature = profile_signature(profile.name, profile.birthDate, profile.birthTime, profile.birthLocation,
+                                  profile.designType, profile.enneagram, latitude, longitude)
+    if read.get("profile") != signature:
+        return None
+    return read
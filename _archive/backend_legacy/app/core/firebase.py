@@ -0,0 +1,31 @@
+"""
+Firebase Admin, initialized on first use.
+
+`firestore` and `auth` are firebase_admin.firestore and firebase_admin.auth
+behind LazyModules: the SDK is imported and the default app initialized the
+first time either is used, not when the API starts.
+"""
+import logging
+import threading
+from types import ModuleType
+from app.core.lazy import LazyModule
+
+logger = logging.getLogger(__name__)
+
+# firestore and auth load under separate locks; this one keeps their first
+# uses from initializing the default app twice
+_init_lock = threading.Lock()
+
+def init_firebase(_module: ModuleType = None):
+    import firebase_admin
+    try:
+        # Use explicit credential path or default to GOOGLE_APPLICATION_CREDENTIALS
+        with _init_lock:
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app()
+        logger.info("Firebase Admin initialized successfully")
+    except Exception as e:
+        logger.warning(f"Firebase Admin initialization failed: {e}")
+
+firestore = LazyModule("firebase_admin.firestore", on_load=init_firebase)
+auth = LazyModule("firebase_admin.auth", on_load=init_firebase)
@@ -0,0 +1,87 @@
+"""
+Geocoding cache.
+
+Birth locations repeat a lot ("Berlin", "New York, NY"), and every
+Nominatim lookup is a network round trip under a 1 request/second usage
+policy. Successful lookups are cached by normalized location string: in
+memory (an LRU of at most GEOCODE_MEMORY_MAX locations, so a large import
+doesn't grow the process) and, unbounded, in SQLite when GEOCODE_CACHE
+names a file, so bulk imports, jobs and restarts reuse earlier results.
+Failures are not cached.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+GEOCODE_CACHE = os.getenv("GEOCODE_CACHE")
+GEOCODE_MEMORY_MAX = int(os.getenv("GEOCODE_MEMORY_MAX", 10000))
+
+def location_key(location: str) -> str:
+    return " ".join(location.lower().replace(",", " , ").split())
+
+class GeocodeCache:
+    def __init__(self, path: Optional[str] = None, max_entries: int = GEOCODE_MEMORY_MAX):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL)")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, location: str) -> Optional[Tuple[float, float]]:
+        key = location_key(location)
+        with self._lock:
+            found = self._memory.get(key)
+            if found is not None:
+                self._memory.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT lat, lon FROM geocode WHERE key = ?", (key,)).fetchone()
+                if row:
+                    found = (row[0], row[1])
+                    self._remember(key, found)
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return found
+
+    def put(self, location: str, lat: float, lon: float):
+        key = location_key(location)
+        with self._lock:
+            self._remember(key, (lat, lon))
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("INSERT OR REPLACE INTO geocode (key, lat, lon) VALUES (?, ?, ?)", (key, lat, lon))
+
+    def _remember(self, key: str, coords: Tuple[float, float]):
+        # Caller holds the lock
+        self._memory[key] = coords
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._memory), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+_cache: Optional[GeocodeCache] = None
+
+def get_geocode_cache() -> GeocodeCache:
+    global _cache
+    if _cache is None:
+        _cache = GeocodeCache(GEOCODE_CACHE)
+    return _cache
+
+def set_geocode_cache(cache: Optional[GeocodeCache]):
+    global _cache
+    _cache = cache
@@ -0,0 +1,64 @@
+import json
+import re
+from typing import Optional
+
+class JSONStringFieldExtractor:
+    """
+    Pulls one string field out of a JSON document while it is still streaming.
+
+    feed() takes raw chunks of the document and returns the newly decoded
+    characters of the field's value, so a narrative can be shown while the LLM
+    is still writing the rest of the object. Escapes split across chunks are
+    held back until complete. The full document is still parsed normally once
+    the stream ends; this is only for early display.
+    """
+    def __init__(self, field: str):
+        self._opening = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._inside = False
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += chunk
+        if not self._inside:
+            match = self._opening.search(self._buffer)
+            if not match:
+                return ""
+            self._buffer = self._buffer[match.end():]
+            self._inside = True
+        return self._drain()
+
+    def _drain(self) -> str:
+        out = []
+        i = 0
+        buf = self._buffer
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i = len(buf)
+                break
+            if ch == "\\":
+                escape = self._escape_at(buf, i)
+                if escape is None:
+                    break  # incomplete escape, wait for more input
+                decoded, length = escape
+                out.append(decoded)
+                i += length
+                continue
+            out.append(ch)
+            i += 1
+        self._buffer = buf[i:]
+        return "".join(out)
+
+    @staticmethod
+    def _escape_at(buf: str, i: int) -> Optional[tuple]:
+        if i + 1 >= len(buf):
+            return None
+        if buf[i + 1] == "u":
+            if i + 6 > len(buf):
+                return None
+            return json.loads(f'"{buf[i:i + 6]}"'), 6
+        return json.loads(f'"{buf[i:i + 2]}"'), 2
@@ -0,0 +1,50 @@
+"""
+Precompiled knowledge base responses.
+
+Topics never change while the process runs, so each one is serialized to
+JSON bytes once, together with a strong ETag (hash of those bytes). Serving
+a topic is then a dict lookup: no model validation or re-serialization of
+the deep_dive text per request, and a matching If-None-Match costs a 304.
+"""
+import hashlib
+import json
+from typing import Dict, NamedTuple, Optional
+from app.core import knowledge_base
+
+# Topics only change with a deploy; let CDNs and browsers reuse them and
+# revalidate cheaply against the ETag afterwards
+TOPIC_CACHE_CONTROL = "public, max-age=3600, stale-while-revalidate=86400"
+SEARCH_CACHE_CONTROL = "public, max-age=300"
+
+class CompiledTopic(NamedTuple):
+    body: bytes
+    etag: str
+
+def compile_topic(topic: Dict) -> CompiledTopic:
+    # Same fields, in the same order, as the KnowledgeItem response model
+    item = {"title": topic["title"], "short_desc": topic["short_desc"], "deep_dive": topic["deep_dive"]}
+    body = json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode()
+    return CompiledTopic(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+def compile_topics(topics: Dict[str, Dict]) -> Dict[str, CompiledTopic]:
+    return {key: compile_topic(topic) for key, topic in topics.items()}
+
+_compiled: Optional[Dict[str, CompiledTopic]] = None
+
+def get_compiled_topics() -> Dict[str, CompiledTopic]:
+    global _compiled
+    if _compiled is None:
+        _compiled = compile_topics(knowledge_base.TOPICS)
+    return _compiled
+
+def set_compiled_topics(compiled: Optional[Dict[str, CompiledTopic]]):
+    global _compiled
+    _compiled = compiled
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as HTTP requires for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
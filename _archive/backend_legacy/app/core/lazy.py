@@ -0,0 +1,44 @@
+"""
+Deferred module imports.
+
+firebase_admin, stripe and friends cost tens to hundreds of milliseconds
+each to import, and most requests never touch them. A LazyModule stands in
+for such a module at import time and imports it on first attribute access,
+so the cost moves from process start to first use (or to the warm-up hook,
+see app.core.warmup). It behaves like the module otherwise, including under
+unittest.mock.patch of the name that holds it.
+"""
+import importlib
+import threading
+from types import ModuleType
+from typing import Callable, Optional
+
+class LazyModule:
+    def __init__(self, name: str, on_load: Optional[Callable[[ModuleType], None]] = None):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_on_load", on_load)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._on_load is not None:
+                        self._on_load(module)
+                    object.__setattr__(self, "_module", module)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr: str, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._name}' ({'loaded' if self.loaded else 'not loaded'})>"
@@ -0,0 +1,308 @@
+"""
+Shared LLM gateway.
+
+Every LLM call in the API goes through one long-lived gateway instead of
+configuring a client per request. The gateway:
+- calls the provider asynchronously, so the event loop keeps serving while a prompt is in flight
+- bounds concurrency globally and per route (analyze, chat, ...)
+- enforces a hard timeout per call
+- trips a circuit breaker after repeated failures, so callers skip straight to
+  their deterministic fallback until the provider recovers
+
+Providers:
+- GeminiProvider: Google Generative AI (GOOGLE_API_KEY)
+- HTTPProvider: plain JSON-over-HTTP (LLM_PROVIDER_URL), used for the local fake
+  LLM server in tests and for proxies
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 20))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+# "route=limit,route=limit"; routes not listed are only bound by the global limit
+LLM_ROUTE_LIMITS = os.getenv("LLM_ROUTE_LIMITS", "analyze=8,chat=8")
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+class LLMError(Exception):
+    """The provider failed or returned something unusable."""
+
+class LLMTimeout(LLMError):
+    """The provider did not answer within the timeout."""
+
+class LLMUnavailable(LLMError):
+    """The call was not attempted: circuit open or gateway saturated."""
+
+def parse_route_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for part in spec.split(","):
+        if "=" in part:
+            route, limit = part.split("=", 1)
+            limits[route.strip()] = int(limit)
+    return limits
+
+class GeminiProvider:
+    def __init__(self, api_key: str, model_name: str = LLM_MODEL):
+        import google.generativeai as genai
+        self._genai = genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name, safety_settings=SAFETY_SETTINGS)
+
+    async def generate(self, prompt: str, json_mode: bool = False) -> str:
+        config = self._genai.types.GenerationConfig(response_mime_type="application/json") if json_mode else None
+        response = await self.model.generate_content_async(prompt, generation_config=config)
+        return response.text
+
+    async def stream(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        config = self._genai.types.GenerationConfig(response_mime_type="application/json") if json_mode else None
+        response = await self.model.generate_content_async(prompt, generation_config=config, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    async def close(self):
+        pass
+
+class HTTPProvider:
+    """
+    POST {base_url}/generate with {"prompt": ..., "json_mode": bool}, expects {"text": ...}.
+    POST {base_url}/stream takes the same body and answers NDJSON, one {"text": chunk} per line.
+    One pooled client is reused for the gateway's lifetime.
+    """
+    def __init__(self, base_url: str, transport=None):
+        import httpx
+        self.client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=None)
+
+    async def generate(self, prompt: str, json_mode: bool = False) -> str:
+        response = await self.client.post("/generate", json={"prompt": prompt, "json_mode": json_mode})
+        response.raise_for_status()
+        return response.json()["text"]
+
+    async def stream(self, prompt: str, json_mode: bool = False) -> AsyncIterator[str]:
+        async with self.client.stream("POST", "/stream", json={"prompt": prompt, "json_mode": json_mode}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)["text"]
+
+    async def close(self):
+        await self.client.aclose()
+
+class CircuitBreaker:
+    """
+    Closed: calls flow. After `threshold` consecutive failures it opens and
+    rejects calls for `reset_timeout` seconds, then lets a single probe through
+    (half-open). A successful probe closes it; a failed one re-opens it.
+    """
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_timeout: float = LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def cancel_probe(self):
+        # The probe never reached the provider; let the next caller probe instead
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+class LLMGateway:
+    def __init__(self, provider, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 route_limits: Optional[Dict[str, int]] = None, timeout: float = LLM_TIMEOUT,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._routes = {route: asyncio.Semaphore(limit) for route, limit in (route_limits or {}).items()}
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, route: str, deadline: float):
+        """
+        Holds a route slot and a global slot for the duration of one call.
+        Raises LLMUnavailable if the circuit is open or no slot frees up before
+        the call's deadline (loop time).
+        On exit without a recorded outcome (saturated, cancelled, abandoned
+        stream) any half-open probe is handed back.
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailable("LLM circuit open")
+
+        loop = asyncio.get_running_loop()
+        acquired = []
+        outcome = {"recorded": False}
+        try:
+            try:
+                for sem in (self._routes.get(route), self._global):
+                    if sem is not None:
+                        await asyncio.wait_for(sem.acquire(), max(deadline - loop.time(), 0))
+                        acquired.append(sem)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise LLMUnavailable(f"LLM gateway saturated on route '{route}'")
+            self.calls += 1
+            yield outcome
+        finally:
+            for sem in acquired:
+                sem.release()
+            if not outcome["recorded"]:
+                self.breaker.cancel_probe()
+
+    def _record_failure(self, outcome: dict, error: BaseException, timeout: float) -> LLMError:
+        outcome["recorded"] = True
+        self.breaker.record_failure()
+        if isinstance(error, asyncio.TimeoutError):
+            self.timeouts += 1
+            return LLMTimeout(f"LLM call exceeded {timeout}s")
+        self.failures += 1
+        return LLMError(str(error))
+
+    async def generate(self, prompt: str, route: str = "default", json_mode: bool = False,
+                       timeout: Optional[float] = None) -> str:
+        """
+        Returns the completion text.
+        Raises LLMUnavailable without calling the provider if the circuit is open
+        or no slot frees up within the timeout; LLMTimeout / LLMError otherwise.
+        The timeout bounds the whole call, waiting for a slot included.
+        """
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with self._slot(route, deadline) as outcome:
+            try:
+                text = await asyncio.wait_for(self.provider.generate(prompt, json_mode=json_mode),
+                                              max(deadline - loop.time(), 0))
+            except Exception as e:
+                raise self._record_failure(outcome, e, timeout) from e
+            self.breaker.record_success()
+            outcome["recorded"] = True
+        return text
+
+    async def stream(self, prompt: str, route: str = "default", json_mode: bool = False,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Yields completion text chunks as the provider produces them.
+        The timeout bounds the whole stream (slot wait included), not each
+        chunk. Same errors as generate().
+        """
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with self._slot(route, deadline) as outcome:
+            chunks = self.provider.stream(prompt, json_mode=json_mode)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        break
+                    except Exception as e:
+                        raise self._record_failure(outcome, e, timeout) from e
+                    yield chunk
+                self.breaker.record_success()
+                outcome["recorded"] = True
+            finally:
+                await chunks.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected
+        }
+
+    async def close(self):
+        await self.provider.close()
+
+_gateway: Optional[LLMGateway] = None
+_gateway_loaded = False
+# The warm-up thread and the first request may both get here first
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> Optional[LLMGateway]:
+    """
+    Returns the shared gateway, or None when no provider is configured (mock mode).
+    """
+    global _gateway, _gateway_loaded
+    if _gateway_loaded:
+        return _gateway
+    with _gateway_lock:
+        if _gateway_loaded:
+            return _gateway
+        provider = None
+        if os.getenv("LLM_PROVIDER_URL"):
+            provider = HTTPProvider(os.getenv("LLM_PROVIDER_URL"))
+        elif os.getenv("GOOGLE_API_KEY"):
+            provider = GeminiProvider(os.getenv("GOOGLE_API_KEY"))
+        else:
+            logger.warning("No LLM provider configured (GOOGLE_API_KEY / LLM_PROVIDER_URL). Using mock mode.")
+        _gateway = LLMGateway(provider, route_limits=parse_route_limits(LLM_ROUTE_LIMITS)) if provider else None
+        _gateway_loaded = True
+        return _gateway
+
+def set_llm_gateway(gateway: Optional[LLMGateway]):
+    global _gateway, _gateway_loaded
+    with _gateway_lock:
+        _gateway = gateway
+        _gateway_loaded = True
+
+async def close_llm_gateway():
+    global _gateway, _gateway_loaded
+    with _gateway_lock:
+        gateway = _gateway
+        _gateway = None
+        _gateway_loaded = False
+    if gateway is not None:
+        await gateway.close()
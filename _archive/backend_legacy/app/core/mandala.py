@@ -1,9 +1,31 @@
 
 import io
-import matplotlib.pyplot as plt
-import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from app.core.calculations import calculator
+from typing import Optional
+from app.core.calculations import get_calculator, ChartData
+
+# Worker pool for card rendering. Matplotlib's pyplot state is not thread-safe,
+# so bulk rendering fans out across processes instead of threads.
+RENDER_WORKERS = int(os.getenv("MANDALA_RENDER_WORKERS", os.cpu_count() or 1))
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """
+    Returns the shared render pool, creating it on first use.
+    """
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    return _render_pool
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
 
 def render_mandala_card(user_input: dict, timestamp: datetime = None) -> bytes:
     """
@@ -22,7 +44,20 @@ def render_mandala_card(user_input: dict, timestamp: datetime = None) -> bytes:
     # Ideally, we fetch the stored chart data.
     # For this function, let's calculate fresh based on input.
 
-    natal_chart = calculator.calculate(user_input['dt'], user_input['lat'], user_input['lon'])
+    natal_chart = get_calculator().calculate(user_input['dt'], user_input['lat'], user_input['lon'])
+
+    return draw_mandala_card(natal_chart)
+
+def draw_mandala_card(natal_chart: ChartData) -> bytes:
+    """
+    Draws the card for an already calculated chart.
+    Kept separate from render_mandala_card so batch callers can compute charts
+    up front and ship only the drawing to the render pool.
+    """
+    # Imported here rather than at module level: pyplot alone takes half a
+    # second to import, and only the render path needs it
+    import matplotlib.pyplot as plt
+    import numpy as np
 
     # 2. Setup Figure
     # Aspect Ratio 3:4 (e.g. 1200x1600)
@@ -0,0 +1,138 @@
+"""
+Deterministic narrative engine.
+
+Renders the rule-based analysis used when the LLM is unavailable. Every text
+fragment that depends on a gate, line or sign is formatted once at import time
+into lookup tables (the shadow table is 64 x 64 gates); rendering an
+analysis is then a handful of dict lookups and string joins. Each fragment
+is a whole paragraph or sentence, so the narrative reads table by table in
+render_gates(). render_many() reuses the same tables for batch jobs.
+
+Output is byte-identical to the original f-string implementation; see
+tests/golden/deterministic_analysis.json.
+"""
+from typing import Iterable, List, NamedTuple, Optional
+from app.core.calculations import ChartData, ZODIAC_SIGNS
+
+GATES = range(1, 65)
+LINES = range(1, 7)
+VISUAL_SYMBOLS = ['SPIRAL', 'TUNNEL', 'LATTICE', 'WEB', 'MANDALA']
+
+# Stand-in signs when chart calculation failed entirely
+NO_CHART_SUN_SIGN = "Entropy"
+NO_CHART_MOON_SIGN = "Flux"
+
+class _Table(dict):
+    """
+    Precompiled fragments. Keys outside the precompiled range (which a valid
+    chart never produces) are built on first use and kept.
+    """
+    def __init__(self, build, keys):
+        super().__init__((key, build(*key) if isinstance(key, tuple) else build(key)) for key in keys)
+        self._build = build
+
+    def __missing__(self, key):
+        value = self[key] = self._build(*key) if isinstance(key, tuple) else self._build(key)
+        return value
+
+class SolarFragments(NamedTuple):
+    headline: str
+    lesson_topic: str
+    resolution: str
+    visual_symbol: str
+
+def _solar(gate: int) -> SolarFragments:
+    return SolarFragments(
+        headline=f"The Geometry of Gate {gate}",
+        lesson_topic=f"Gate {gate}: The Solar Vector",
+        resolution=f"Solar Alignment {gate}",
+        visual_symbol=VISUAL_SYMBOLS[gate % len(VISUAL_SYMBOLS)]
+    )
+
+# Narrative paragraphs: core (Sun), shadow (Earth), then emotion (Moon),
+# recalibration (North Node) and closing (Sun line) as one paragraph
+
+def _core(gate: int, sign: str) -> str:
+    return (
+        f"Your Core Architecture is anchored in **Gate {gate}** ({sign}). In the Bressloff-Cowan model, this frequency "
+        f"generates a specific form constant in your cognitive field—a structure that organizes how you process "
+        f"'Signal' versus 'Noise'."
+    )
+
+def _shadow(earth_gate: int, sun_gate: int) -> str:
+    return (
+        f"The shadow system currently manifests through **Gate {earth_gate}** (The Earth Vector). Unintegrated, this "
+        f"creates a 'Grounding Fault'—tension between the expanding light of the Sun ({sun_gate}) and the "
+        f"gravitational pull of the Earth."
+    )
+
+def _emotion(moon_gate: int, sign: str) -> str:
+    return f"Your emotional heuristics are driven by **Gate {moon_gate}** ({sign})."
+
+def _recalibrate(north_node_gate: int) -> str:
+    return f"To recalibrate, shift your trajectory towards **Gate {north_node_gate}**."
+
+def _closing(line: int) -> str:
+    return f"This is your vector of evolution. Align with Line {line} to dissolve resistance."
+
+def _lesson(sign: str) -> str:
+    return f"This gate in {sign} concerns your primary output function. It is the 'What' of your life force. Optimizing this frequency reduces drag on your decision-making."
+
+SIGNS = ZODIAC_SIGNS + [NO_CHART_SUN_SIGN, NO_CHART_MOON_SIGN]
+
+SOLAR = _Table(_solar, GATES)
+CORE = _Table(_core, [(g, s) for g in GATES for s in SIGNS])
+SHADOW = _Table(_shadow, [(e, s) for e in GATES for s in GATES])
+EMOTION = _Table(_emotion, [(g, s) for g in GATES for s in SIGNS])
+RECALIBRATE = _Table(_recalibrate, GATES)
+CLOSING = _Table(_closing, LINES)
+LESSON = _Table(_lesson, SIGNS)
+ARCHITECTURE = _Table(lambda g: f"Venussian Resonance {g}", GATES)
+TENSION = _Table(lambda g: f"Martian Vector {g}", GATES)
+NUMBER = _Table(str, GATES)
+
+def render_gates(sun_gate: int, sun_line: int, sun_sign: str, earth_gate: int, moon_gate: int,
+                 moon_sign: str, venus_gate: int, mars_gate: int, north_node_gate: int,
+                 status: str = 'OPTIMAL') -> dict:
+    solar = SOLAR[sun_gate]
+    sun, moon, earth, mars = NUMBER[sun_gate], NUMBER[moon_gate], NUMBER[earth_gate], NUMBER[mars_gate]
+    return {
+        "system_status": status,
+        "integrity_score": (sun_gate + earth_gate + moon_gate) % 100,
+        "headline": solar.headline,
+        "narrative": "\n\n".join((
+            CORE[sun_gate, sun_sign],
+            SHADOW[earth_gate, sun_gate],
+            " ".join((EMOTION[moon_gate, moon_sign], RECALIBRATE[north_node_gate], CLOSING[sun_line]))
+        )),
+        "daily_lesson": {
+            "topic": solar.lesson_topic,
+            "content": LESSON[sun_sign],
+            "visual_symbol": solar.visual_symbol,
+            "knowledge_key": "MECHANICS"
+        },
+        "protocol": "".join((
+            "Observe Gate ", sun, " today. If you feel friction (", mars, "), it is likely the Moon (", moon,
+            ") pulling focus. Re-center by grounding into Gate ", earth, "."
+        )),
+        "relational_geometry": {
+            "architecture": ARCHITECTURE[venus_gate],
+            "tension_node": TENSION[mars_gate],
+            "resolution": solar.resolution
+        },
+    }
+
+def render_analysis(chart: Optional[ChartData]) -> dict:
+    """
+    Deterministic analysis for chart, or the placeholder reading when the chart
+    could not be calculated. Forecast and audio are attached by the caller.
+    """
+    if not chart:
+        return render_gates(1, 1, NO_CHART_SUN_SIGN, 2, 3, NO_CHART_MOON_SIGN, 4, 5, 6, status='RECALIBRATING')
+    return render_gates(
+        chart.sun.gate, chart.sun.line, chart.sun.zodiac_sign, chart.earth.gate, chart.moon.gate,
+        chart.moon.zodiac_sign, chart.venus.gate, chart.mars.gate, chart.north_node.gate
+    )
+
+def render_many(charts: Iterable[Optional[ChartData]]) -> List[dict]:
+    return [render_analysis(chart) for chart in charts]
@@ -0,0 +1,422 @@
+"""
+Contact form outbox.
+
+/api/contact/send used to log the submission from a BackgroundTasks callback:
+nothing was delivered and nothing survived a restart. Submissions now go to a
+durable SQLite queue (CONTACT_OUTBOX_DB) before the request returns, and a
+worker thread delivers them over SMTP:
+
+- one SMTP connection is opened on demand and reused across messages and
+  batches, then closed after SMTP_IDLE_TIMEOUT seconds without mail
+- up to OUTBOX_BATCH_SIZE due messages are claimed per round: marked
+  'sending' with a lease of OUTBOX_LEASE seconds in one UPDATE, so several
+  workers (or processes) sharing the database never send the same message;
+  a worker that dies mid-batch leaves leases that expire and are reclaimed
+- a temporary failure (4xx reply, dropped connection) retries the message
+  with exponential backoff (OUTBOX_RETRY_BACKOFF, doubling, capped at
+  OUTBOX_MAX_BACKOFF); a permanent one (5xx), or OUTBOX_MAX_ATTEMPTS
+  failures, moves it to the dead letters, kept for inspection and requeue;
+  a message that can't even be built is dead-lettered on the first attempt
+- delivered messages are deleted from the queue
+
+stats() reports queue depth per state, the oldest pending message's age and
+delivery latency (enqueue to accepted by the SMTP server).
+"""
+import logging
+import os
+import smtplib
+import sqlite3
+import statistics
+import threading
+import time
+from collections import deque
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CONTACT_OUTBOX_DB = os.getenv("CONTACT_OUTBOX_DB", "contact_outbox.db")
+SMTP_HOST = os.getenv("SMTP_HOST")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_FROM = os.getenv("SMTP_FROM", "no-reply@defrag.app")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 10))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", 60))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 12))
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", 5))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", 3600))
+# Seconds a claimed batch is reserved for its worker; must outlast a batch's sends
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 900))
+# Latencies kept for the stats percentiles
+LATENCY_SAMPLES = 1000
+
+class Outbox:
+    """
+    The durable queue. States: pending -> sending (claimed) -> (deleted once
+    sent) | pending (retry) | dead.
+    """
+    def __init__(self, path: str = CONTACT_OUTBOX_DB):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+                # Survives a process crash; WAL keeps this cheap
+                self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    reply_to TEXT,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    lease_until REAL
+                )""")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(outbox)")]
+            if "lease_until" not in columns:
+                # Outboxes created before claiming
+                self._db.execute("ALTER TABLE outbox ADD COLUMN lease_until REAL")
+            self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, next_attempt_at)")
+
+    def enqueue(self, recipient: str, subject: str, body: str, reply_to: Optional[str] = None) -> int:
+        now = time.time()
+        with self._lock, self._db:
+            return self._db.execute(
+                "INSERT INTO outbox (recipient, reply_to, subject, body, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (recipient, reply_to, subject, body, now, now)
+            ).lastrowid
+
+    def claim(self, limit: int, now: float, lease: float = OUTBOX_LEASE) -> List[Dict]:
+        """
+        Claims up to `limit` due messages (pending, or sending with an expired
+        lease) for `lease` seconds. A single UPDATE, so concurrent claimers get
+        disjoint batches. The caller reports each one as delivered, failed or
+        released.
+        """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                """UPDATE outbox SET state = 'sending', lease_until = ? WHERE id IN (
+                       SELECT id FROM outbox
+                       WHERE (state = 'pending' AND next_attempt_at <= ?) OR (state = 'sending' AND lease_until <= ?)
+                       ORDER BY next_attempt_at, id LIMIT ?
+                   ) RETURNING *""",
+                (now + lease, now, now, limit)
+            )
+            columns = [c[0] for c in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        # RETURNING doesn't follow the subquery's order
+        return sorted(rows, key=lambda row: (row["next_attempt_at"], row["id"]))
+
+    def release(self, ids: List[int]):
+        """
+        Hands claimed messages back untried, due again right away.
+        """
+        if not ids:
+            return
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE outbox SET state = 'pending', lease_until = NULL WHERE id = ? AND state = 'sending'",
+                [(i,) for i in ids]
+            )
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(CASE state WHEN 'pending' THEN next_attempt_at ELSE lease_until END) "
+                "FROM outbox WHERE state IN ('pending', 'sending')"
+            ).fetchone()
+        return row[0]
+
+    def delivered(self, ids: List[int]):
+        if not ids:
+            return
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+    def failed(self, message: Dict, error: str, permanent: bool, now: float, backoff: float, max_backoff: float,
+               max_attempts: int) -> bool:
+        """
+        Schedules a retry, or dead-letters the message. Returns True if dead.
+        """
+        attempts = message["attempts"] + 1
+        dead = permanent or attempts >= max_attempts
+        retry_at = now + min(backoff * 2 ** (attempts - 1), max_backoff)
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET attempts = ?, last_error = ?, state = ?, next_attempt_at = ?, lease_until = NULL WHERE id = ?",
+                (attempts, error[:500], "dead" if dead else "pending", retry_at, message["id"])
+            )
+        return dead
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM outbox WHERE state = 'dead' ORDER BY id LIMIT ?", (limit,))
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def requeue_dead(self) -> int:
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE outbox SET state = 'pending', attempts = 0, next_attempt_at = ? WHERE state = 'dead'", (time.time(),)
+            ).rowcount
+
+    def depth(self) -> Dict:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+            oldest = self._db.execute("SELECT MIN(created_at) FROM outbox WHERE state = 'pending'").fetchone()[0]
+        return {
+            "pending": counts.get("pending", 0),
+            "sending": counts.get("sending", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_pending_seconds": round(time.time() - oldest, 3) if oldest else None
+        }
+
+    def close(self):
+        self._db.close()
+
+class SMTPUnavailable(Exception):
+    """The SMTP server couldn't be reached or dropped the connection."""
+
+class SMTPConnection:
+    """
+    One SMTP session, opened on first use and reused until it drops or idles out.
+    """
+    def __init__(self, host: str, port: int = SMTP_PORT, user: Optional[str] = SMTP_USER,
+                 password: Optional[str] = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS,
+                 timeout: float = SMTP_TIMEOUT, idle_timeout: float = SMTP_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._used_at = 0.0
+        self.opened = 0
+
+    def _open(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.starttls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.user:
+                smtp.login(self.user, self.password or "")
+        except Exception:
+            smtp.close()
+            raise
+        self.opened += 1
+        return smtp
+
+    def send(self, message: EmailMessage):
+        """
+        Raises SMTPUnavailable when no session could be had (including bad
+        credentials), or an smtplib error for a message the server refused.
+        """
+        if self._smtp is None:
+            try:
+                self._smtp = self._open()
+            except Exception as e:
+                raise SMTPUnavailable(f"{type(e).__name__}: {e}") from e
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected as e:
+            self.close()
+            raise SMTPUnavailable(f"{type(e).__name__}: {e}") from e
+        except smtplib.SMTPException:
+            # A refusal: smtplib has reset the session, which stays usable
+            self._used_at = time.monotonic()
+            raise
+        except OSError as e:
+            # Dropped connection: the next send opens a new one
+            self.close()
+            raise SMTPUnavailable(f"{type(e).__name__}: {e}") from e
+        self._used_at = time.monotonic()
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._used_at >= self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+def build_message(row: Dict, sender: str = SMTP_FROM) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = row["recipient"]
+    if row.get("reply_to"):
+        message["Reply-To"] = row["reply_to"]
+    message["Subject"] = row["subject"]
+    message.set_content(row["body"])
+    return message
+
+def is_permanent(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+class OutboxWorker:
+    def __init__(self, outbox: Outbox, connection: SMTPConnection, batch_size: int = OUTBOX_BATCH_SIZE,
+                 backoff: float = OUTBOX_RETRY_BACKOFF, max_backoff: float = OUTBOX_MAX_BACKOFF,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, clock: Callable[[], float] = time.time):
+        self.outbox = outbox
+        self.connection = connection
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    def notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _failed(self, row: Dict, error: Exception, permanent: bool):
+        if self.outbox.failed(row, f"{type(error).__name__}: {error}", permanent, self.clock(),
+                              self.backoff, self.max_backoff, self.max_attempts):
+            self.dead += 1
+            logger.error(f"Outbox message {row['id']} dead-lettered after {row['attempts'] + 1} attempts: {error}")
+        else:
+            self.retried += 1
+            logger.warning(f"Outbox message {row['id']} failed, will retry: {error}")
+
+    def deliver_batch(self) -> int:
+        """
+        Claims and delivers the due messages, at most batch_size. Returns how many were sent.
+        """
+        now = self.clock()
+        batch = self.outbox.claim(self.batch_size, now)
+        delivered = []
+        for position, row in enumerate(batch):
+            try:
+                message = build_message(row)
+            except Exception as e:
+                # Bad headers won't get better with retries
+                self._failed(row, e, permanent=True)
+                continue
+            try:
+                self.connection.send(message)
+            except Exception as e:
+                self._failed(row, e, is_permanent(e))
+                if isinstance(e, SMTPUnavailable):
+                    # The rest of the batch would fail the same way
+                    self.outbox.release([r["id"] for r in batch[position + 1:]])
+                    break
+                continue
+            delivered.append(row["id"])
+            self._latencies.append(self.clock() - row["created_at"])
+        self.outbox.delivered(delivered)
+        self.sent += len(delivered)
+        if delivered:
+            logger.info(f"Outbox delivered {len(delivered)} messages over one SMTP connection")
+        return len(delivered)
+
+    def _run(self):
+        while True:
+            try:
+                while self.deliver_batch() == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Outbox delivery round failed: {e}")
+            with self._cond:
+                if self._stopping:
+                    break
+                next_due = self.outbox.next_due()
+                delay = self.connection.idle_timeout if next_due is None else max(next_due - self.clock(), 0.05)
+                # Woken early by notify() when a message is enqueued
+                self._cond.wait(min(delay, self.connection.idle_timeout))
+                if self._stopping:
+                    break
+            self.connection.close_if_idle()
+        self.connection.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="contact-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        latencies = list(self._latencies)
+        stats = self.outbox.depth()
+        stats.update({
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead_lettered": self.dead,
+            "smtp_connections_opened": self.connection.opened,
+            "latency_seconds": {
+                "last": round(latencies[-1], 3),
+                "p50": round(statistics.median(latencies), 3),
+                "p95": round(sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                "max": round(max(latencies), 3)
+            } if latencies else None
+        })
+        return stats
+
+_outbox: Optional[Outbox] = None
+_worker: Optional[OutboxWorker] = None
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox()
+    return _outbox
+
+def set_outbox(outbox: Optional[Outbox]):
+    global _outbox
+    _outbox = outbox
+
+def get_outbox_worker() -> Optional[OutboxWorker]:
+    return _worker
+
+def set_outbox_worker(worker: Optional[OutboxWorker]):
+    global _worker
+    _worker = worker
+
+def start_outbox_worker():
+    """
+    Without SMTP_HOST, messages queue up (durably) until a worker with SMTP runs.
+    """
+    global _worker
+    if not SMTP_HOST:
+        logger.warning("SMTP_HOST not set, contact messages are queued but not delivered")
+        return
+    if _worker is None:
+        _worker = OutboxWorker(get_outbox(), SMTPConnection(SMTP_HOST))
+        _worker.start()
+
+def stop_outbox_worker():
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
@@ -1,110 +1,324 @@
 import os
 import json
 import base64
+import functools
+import hashlib
+import logging
 import math
+import threading
 import zipfile
 import io
-from PIL import Image, ImageDraw
-from typing import Tuple
+import numpy as np
+from collections import OrderedDict
+from PIL import Image, ImageDraw, ImageFont
+from typing import Dict, List, Optional, Tuple
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.serialization import pkcs7
+from app.core.calculations import ChartData, CHART_BODIES, chart_hash
+
+logger = logging.getLogger(__name__)
 
 # --- CONFIGURATION ---
 PASS_TYPE_ID = "pass.com.defrag.identity"
 TEAM_ID = "YOUR_TEAM_ID" # Placeholder - Needs to be replaced with real Apple Developer Team ID
+PASS_CERTS_DIR = os.getenv("PASS_CERTS_DIR", "certs")
+PASS_KEY_PASSWORD = os.getenv("PASS_KEY_PASSWORD")
+
+# Wallet picks the variant matching the device scale factor
+SCALES = (1, 2, 3)
+STRIP_SIZE = (375, 123)
+ICON_SIZE = (29, 29)
+LOGO_SIZE = (160, 50)
+STRIP_CACHE_SIZE = int(os.getenv("STRIP_CACHE_SIZE", 1024))
+
+# Strip palette
+VOID = (5, 5, 10)
+RING_COLOR = (100, 100, 120)
+GENERIC_RAY_COLORS = [((0, 255, 255), 60), ((255, 215, 0), 40), ((138, 43, 226), 40)]
+# Per-body ray colors (RGB, alpha). Sun/Earth/Moon/Mars/Venus match the mandala card.
+BODY_COLORS = {
+    "sun": ((212, 175, 55), 140),
+    "earth": ((34, 136, 255), 110),
+    "moon": ((238, 238, 238), 110),
+    "north_node": ((200, 200, 210), 60),
+    "south_node": ((100, 100, 120), 60),
+    "mercury": ((0, 255, 255), 80),
+    "venus": ((0, 255, 136), 90),
+    "mars": ((255, 0, 51), 90),
+    "jupiter": ((255, 215, 0), 70),
+    "saturn": ((138, 43, 226), 70),
+    "uranus": ((120, 200, 255), 60),
+    "neptune": ((80, 120, 255), 60),
+    "pluto": ((170, 60, 90), 60),
+}
+
+def _variant_name(base: str, scale: int) -> str:
+    return f"{base}.png" if scale == 1 else f"{base}@{scale}x.png"
+
+def _encode_png(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+class PassAsset:
+    """
+    An encoded bundle file with its manifest digest precomputed.
+    """
+    def __init__(self, data: bytes):
+        self.data = data
+        self.sha1 = hashlib.sha1(data).hexdigest()
+
+class PassSigner:
+    """
+    Produces the detached PKCS#7 signature over manifest.json.
+    Certificates and the private key are parsed once and reused for every pass.
+    """
+    def __init__(self, certs_dir: str = PASS_CERTS_DIR, key_password: Optional[str] = PASS_KEY_PASSWORD):
+        with open(os.path.join(certs_dir, "signerCert.pem"), "rb") as f:
+            self.cert = x509.load_pem_x509_certificate(f.read())
+        with open(os.path.join(certs_dir, "signerKey.pem"), "rb") as f:
+            password = key_password.encode() if key_password else None
+            self.key = serialization.load_pem_private_key(f.read(), password=password)
+
+        # Apple WWDR intermediate. Optional for local test key pairs.
+        self.wwdr = None
+        wwdr_path = os.path.join(certs_dir, "wwdr.pem")
+        if os.path.exists(wwdr_path):
+            try:
+                with open(wwdr_path, "rb") as f:
+                    self.wwdr = x509.load_pem_x509_certificate(f.read())
+            except ValueError as e:
+                logger.warning(f"Ignoring unreadable WWDR certificate at {wwdr_path}: {e}")
+
+    def sign(self, manifest: bytes) -> bytes:
+        builder = (
+            pkcs7.PKCS7SignatureBuilder()
+            .set_data(manifest)
+            .add_signer(self.cert, self.key, hashes.SHA256())
+        )
+        if self.wwdr is not None:
+            builder = builder.add_certificate(self.wwdr)
+        return builder.sign(serialization.Encoding.DER, [pkcs7.PKCS7Options.DetachedSignature, pkcs7.PKCS7Options.Binary])
+
+_signer: Optional[PassSigner] = None
+_signer_loaded = False
+
+def get_pass_signer() -> Optional[PassSigner]:
+    """
+    Returns the shared signer, or None if no certificates are configured.
+    Unsigned bundles keep the correct structure for local development.
+    """
+    global _signer, _signer_loaded
+    if not _signer_loaded:
+        try:
+            _signer = PassSigner()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Pass signing disabled, could not load certificates from {PASS_CERTS_DIR}: {e}")
+            _signer = None
+        _signer_loaded = True
+    return _signer
+
+def set_pass_signer(signer: Optional[PassSigner]):
+    global _signer, _signer_loaded
+    _signer = signer
+    _signer_loaded = True
+
+_static_assets: Optional[Dict[str, PassAsset]] = None
+_strip_cache: "OrderedDict[str, Dict[str, PassAsset]]" = OrderedDict()
+_strip_cache_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=16)
+def _strip_geometry(size: Tuple[int, int], glow: Tuple[int, int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Chart-independent part of the strip for one image size: per-pixel radius and
+    angle, plus the background (radial gradient and ghost rings) already rasterized.
+    """
+    width, height = size
+    scale = height / STRIP_SIZE[1]
+    cx, cy = width // 2, height // 2
+
+    y, x = np.ogrid[:height, :width]
+    dx = (x - cx).astype(np.float32)
+    dy = (y - cy).astype(np.float32)
+    r = np.hypot(dx, dy)
+    theta = np.degrees(np.arctan2(dy, dx)) % 360
+
+    def blend(img, color, alpha):
+        return img + alpha[..., None] * (np.asarray(color, dtype=np.float32) - img)
+
+    # A. Radial gradient: faint glow in the core fading to void
+    glow_alpha = np.clip(1.0 - r / height, 0.0, 1.0) ** 2 * 0.12
+    background = blend(np.full((height, width, 3), VOID, dtype=np.float32), glow, glow_alpha)
+
+    # B. The Parallax Depth (Ghost Rings): every pixel snaps to its nearest ring radius
+    spacing = 15 * scale
+    k = np.round((height - r) / spacing)
+    ring_r = height - k * spacing
+    coverage = np.clip(1.0 - np.abs(r - ring_r) / scale, 0.0, 1.0)
+    coverage *= (k >= 0) & (ring_r > 20 * scale)
+    background = blend(background, RING_COLOR, coverage * (20 * ring_r / height) / 255)
+
+    for arr in (r, theta, background):
+        arr.setflags(write=False)
+    return r, theta, background
+
+def _render_strip(size: Tuple[int, int], rays: List[Tuple[float, Tuple[int, int, int], int, float]],
+                  glow: Tuple[int, int, int]) -> np.ndarray:
+    """
+    Rasterizes the strip as whole-image NumPy operations.
+    rays: (angle in degrees, rgb, alpha 0-255, length as a fraction of height).
+    Returns an (height, width, 3) uint8 array.
+    """
+    height = size[1]
+    scale = height / STRIP_SIZE[1]
+    r, theta, background = _strip_geometry(size, glow)
+
+    # C. Rays: each pixel takes the angularly nearest ray, so cost doesn't grow with ray count
+    order = sorted(rays, key=lambda ray: ray[0])
+    angles = np.array([ray[0] for ray in order], dtype=np.float32)
+    colors = np.array([ray[1] for ray in order], dtype=np.float32)
+    alphas = np.array([ray[2] for ray in order], dtype=np.float32) / 255
+    lengths = np.array([ray[3] for ray in order], dtype=np.float32) * height
+
+    right = np.searchsorted(angles, theta) % len(angles)
+    left = right - 1  # -1 wraps to the last ray
+    d_right = np.abs((theta - angles[right] + 180) % 360 - 180)
+    d_left = np.abs((theta - angles[left] + 180) % 360 - 180)
+    nearest = np.where(d_left < d_right, left, right)
+    d = np.minimum(d_left, d_right)
+
+    # Only pixels within a line width of some ray get blended
+    perpendicular = r * np.sin(np.radians(np.minimum(d, 90)))
+    hit = np.nonzero((perpendicular < scale) & (r <= lengths[nearest]))
+    alpha = (1.0 - perpendicular[hit] / scale) * alphas[nearest[hit]]
+
+    img = background.copy()
+    img[hit] += alpha[:, None] * (colors[nearest[hit]] - img[hit])
+    return np.clip(img, 0, 255).astype(np.uint8)
 
 class PassGenerator:
     def __init__(self):
         pass
 
-    def create_mandala_strip(self, size: Tuple[int, int]) -> Image.Image:
+    def create_mandala_strip(self, size: Tuple[int, int], chart: Optional[ChartData] = None) -> Image.Image:
         """
         Generates the mandala artwork for the wallet card strip.
+        Without a chart this is the generic 36-ray design; with one, rays sit at
+        the planet longitudes in each body's color.
         """
-        width, height = size
-        # Base: Deep Void Black
-        img = Image.new('RGBA', size, (5, 5, 10, 255))
+        if chart is None:
+            rays = [(float(i), color, alpha, 0.85) for i, (color, alpha) in
+                    zip(range(0, 360, 10), GENERIC_RAY_COLORS * 12)]
+            glow = (0, 255, 255)
+        else:
+            # Zodiac runs counter-clockwise; image y grows downwards
+            rays = [((-getattr(chart, body).longitude) % 360, *BODY_COLORS[body], 0.95 if body == "sun" else 0.85)
+                    for body in CHART_BODIES]
+            glow = BODY_COLORS["sun"][0]
+        return Image.fromarray(_render_strip(size, rays, glow), "RGB").convert("RGBA")
+
+    def create_icon(self, scale: int = 1) -> Image.Image:
+        w, h = ICON_SIZE
+        img = Image.new('RGBA', (w * scale, h * scale), (0, 0, 0, 255))
         draw = ImageDraw.Draw(img)
-        cx, cy = width // 2, height // 2
-
-        # A. The Parallax Depth (Ghost Rings)
-        for r in range(height, 20, -15):
-            opacity = int(20 * (r / height))
-            draw.ellipse((cx-r, cy-r, cx+r, cy+r), outline=(100, 100, 120, opacity), width=1)
-
-        # B. The Iridescent Core (Cyan/Gold/Purple)
-        colors = [(0, 255, 255, 60), (255, 215, 0, 40), (138, 43, 226, 40)]
-        for i in range(0, 360, 10):
-            rad = math.radians(i)
-            color = colors[(i // 10) % 3]
-            x_end = cx + math.cos(rad) * (height * 0.85)
-            y_end = cy + math.sin(rad) * (height * 0.85)
-            draw.line((cx, cy, x_end, y_end), fill=color, width=1)
+        draw.ellipse((2 * scale, 2 * scale, 27 * scale, 27 * scale), fill=(0, 255, 255))
+        return img
 
+    def create_logo(self, scale: int = 1) -> Image.Image:
+        # Ideally logo.png should be transparent background with text or symbol.
+        w, h = LOGO_SIZE
+        img = Image.new('RGBA', (w * scale, h * scale), (0, 0, 0, 0)) # Transparent
+        draw = ImageDraw.Draw(img)
+        font = ImageFont.load_default(size=11 * scale)
+        draw.text((10 * scale, 15 * scale), "DEFRAG", fill=(255, 255, 255), font=font)
         return img
 
-    def generate_pass_bundle(self, user_id: str) -> io.BytesIO:
+    def static_assets(self) -> Dict[str, PassAsset]:
+        """
+        Icon, logo and strip images in every scale, PNG-encoded and hashed once per process.
+        """
+        global _static_assets
+        if _static_assets is None:
+            assets = {}
+            for scale in SCALES:
+                assets[_variant_name("icon", scale)] = PassAsset(_encode_png(self.create_icon(scale)))
+                assets[_variant_name("logo", scale)] = PassAsset(_encode_png(self.create_logo(scale)))
+                strip_size = (STRIP_SIZE[0] * scale, STRIP_SIZE[1] * scale)
+                assets[_variant_name("strip", scale)] = PassAsset(_encode_png(self.create_mandala_strip(strip_size)))
+            _static_assets = assets
+        return _static_assets
+
+    def chart_strip_assets(self, chart: ChartData) -> Dict[str, PassAsset]:
+        """
+        Personalized strip images in every scale, cached by chart hash.
+        """
+        key = chart_hash(chart)
+        with _strip_cache_lock:
+            cached = _strip_cache.get(key)
+            if cached is not None:
+                _strip_cache.move_to_end(key)
+                return cached
+
+        assets = {}
+        for scale in SCALES:
+            strip_size = (STRIP_SIZE[0] * scale, STRIP_SIZE[1] * scale)
+            assets[_variant_name("strip", scale)] = PassAsset(_encode_png(self.create_mandala_strip(strip_size, chart)))
+
+        with _strip_cache_lock:
+            _strip_cache[key] = assets
+            while len(_strip_cache) > STRIP_CACHE_SIZE:
+                _strip_cache.popitem(last=False)
+        return assets
+
+    def generate_pass_bundle(self, user_id: str, chart: Optional[ChartData] = None,
+                             name: Optional[str] = None, birth_date: Optional[str] = None) -> io.BytesIO:
         """
         Creates the .pkpass bundle (zip file) containing the pass.json and images.
+        Images come precomputed (static_assets / chart_strip_assets), so per-request
+        work is pass.json, manifest.json and its signature.
         """
-        # 1. Create In-Memory Zip
-        zip_buffer = io.BytesIO()
+        assets = dict(self.static_assets())
+        if chart is not None:
+            assets.update(self.chart_strip_assets(chart))
+
+        pass_json = PassAsset(json.dumps(self._get_pass_json(user_id, chart, name, birth_date), indent=2).encode())
+
+        # manifest.json maps every file in the bundle to its SHA-1
+        manifest = {"pass.json": pass_json.sha1}
+        manifest.update({name: asset.sha1 for name, asset in assets.items()})
+        manifest_bytes = json.dumps(manifest, indent=2).encode()
 
+        signer = get_pass_signer()
+
+        zip_buffer = io.BytesIO()
         with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-            # 2. Generate pass.json
-            pass_json = self._get_pass_json(user_id)
-            zf.writestr("pass.json", json.dumps(pass_json, indent=2))
-
-            # 3. Generate strip.png (The Mandala Artwork)
-            # Standard strip size for Wallet is usually around 375x123 or similar ratio.
-            # We use 375x123 as a good baseline for the strip image.
-            strip_img = self.create_mandala_strip((375, 123))
-            strip_bytes = io.BytesIO()
-            strip_img.save(strip_bytes, format="PNG")
-            zf.writestr("strip.png", strip_bytes.getvalue())
-
-            # 4. Add placeholder icon/logo (reuse strip or create simple ones)
-            # In a real app, you'd want specific icon.png (29x29) and logo.png
-            # For now, we'll resize the strip or just use a colored block for icon/logo to avoid errors if they are strictly checked.
-            # Ideally logo.png should be transparent background with text or symbol.
-
-            # Icon
-            icon_img = Image.new('RGBA', (29, 29), (0, 0, 0, 255))
-            icon_draw = ImageDraw.Draw(icon_img)
-            icon_draw.ellipse((2, 2, 27, 27), fill=(0, 255, 255))
-            icon_bytes = io.BytesIO()
-            icon_img.save(icon_bytes, format="PNG")
-            zf.writestr("icon.png", icon_bytes.getvalue())
-
-            # Logo
-            logo_img = Image.new('RGBA', (160, 50), (0, 0, 0, 0)) # Transparent
-            logo_draw = ImageDraw.Draw(logo_img)
-            logo_draw.text((10, 15), "DEFRAG", fill=(255, 255, 255)) # Default font
-            logo_bytes = io.BytesIO()
-            logo_img.save(logo_bytes, format="PNG")
-            zf.writestr("logo.png", logo_bytes.getvalue())
-
-            # Also need @2x and @3x ideally, but standard pass might work without them or scale them.
-            # Apple Wallet is picky. We might need manifest.json and signature for a REAL valid pass.
-            # For this "implementation", we are generating the bundle structure.
-            # Signing is a complex step requiring certificates. We will skip the actual cryptographic signature
-            # unless the user provided certs, but we can structure it correctly.
+            zf.writestr("pass.json", pass_json.data)
+            # PNGs are already compressed; deflating them again only burns CPU
+            for name, asset in assets.items():
+                zf.writestr(name, asset.data, compress_type=zipfile.ZIP_STORED)
+            zf.writestr("manifest.json", manifest_bytes)
+            if signer is not None:
+                zf.writestr("signature", signer.sign(manifest_bytes))
 
         zip_buffer.seek(0)
         return zip_buffer
 
-    def _get_pass_json(self, user_id: str):
+    def _get_pass_json(self, user_id: str, chart: Optional[ChartData] = None,
+                       name: Optional[str] = None, birth_date: Optional[str] = None):
         # Deep Link Payload
         identity_data = {
             "uid": user_id,
-            "name": "User", # In real app, fetch user name
-            "sun": "Capricorn", # Placeholder
-            "moon": "Virgo",    # Placeholder
-            "dob": "1993-07-26" # Placeholder
+            "name": name or "User",
+            "sun": chart.sun.zodiac_sign if chart else None,
+            "moon": chart.moon.zodiac_sign if chart else None,
+            "dob": birth_date
         }
         json_str = json.dumps(identity_data)
         payload_b64 = base64.b64encode(json_str.encode()).decode()
         deep_link = f"defrag://initialize?payload={payload_b64}"
 
-        return {
+        pass_json = {
           "formatVersion": 1,
           "passTypeIdentifier": PASS_TYPE_ID,
           "serialNumber": f"DEFRAG-{user_id[:8]}",
@@ -135,3 +349,12 @@ class PassGenerator:
             ]
           }
         }
+
+        if chart is not None:
+            pass_json["storeCard"]["secondaryFields"] = [
+                {"key": "sun", "label": "SUN", "value": f"{chart.sun.gate}.{chart.sun.line} {chart.sun.zodiac_sign}"},
+                {"key": "moon", "label": "MOON", "value": f"{chart.moon.gate}.{chart.moon.line} {chart.moon.zodiac_sign}"},
+                {"key": "vector", "label": "NODE", "value": f"{chart.north_node.gate}.{chart.north_node.line}", "textAlignment": "PKTextAlignmentRight"}
+            ]
+
+        return pass_json
@@ -0,0 +1,236 @@
+"""
+Recurrence scoring for timeline events.
+
+An event's recurrenceScore (0-10) says how much of it has happened to the user
+lately: how often its labels, its type and the gates transited by the Sun and
+Moon at event time appeared in the last RECURRENCE_WINDOW_DAYS. Its shadowId
+names the pattern recurring most: the event's most frequent label or transit
+gate, once seen at least SHADOW_MIN_COUNT times in the window
+("label:projection", "gate:51").
+
+Scoring is incremental. Each user has a sliding window of recent events and a
+running count per feature; a new event expires what fell out of the window,
+reads its own features' counts and adds itself, so the cost is O(features of
+the event), not O(history). Logging scores first and commits the event to the
+window only once the timeline store has accepted it, so a rejected (and
+retried) event isn't counted twice. A user's window is rebuilt from the timeline store
+the first time they log an event in this process. Historic events are scored
+by app.jobs.recurrence_backfill.
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+import swisseph as swe
+from app.core.calculations import get_hd_coords
+from app.core.timeline_store import get_timeline_store, normalize_time, TimelineQuery, MAX_PAGE_SIZE
+
+RECURRENCE_WINDOW_DAYS = float(os.getenv("RECURRENCE_WINDOW_DAYS", 30))
+RECURRENCE_MAX_USERS = int(os.getenv("RECURRENCE_MAX_USERS", 50000))
+# Weighted prior occurrences that give a score of ~6.3 (1 - 1/e)
+RECURRENCE_SCALE = float(os.getenv("RECURRENCE_SCALE", 6.0))
+SHADOW_MIN_COUNT = int(os.getenv("SHADOW_MIN_COUNT", 3))
+
+# A repeated label says more than a repeated transit, which says more than a repeated type
+FEATURE_WEIGHTS = {"label": 1.0, "gate": 0.5, "type": 0.2}
+SHADOW_KINDS = ("label", "gate")
+
+def event_epoch(event: Dict) -> float:
+    stamp = normalize_time(event.get("time") or event.get("timestamp"))
+    return datetime.fromisoformat(stamp.replace("Z", "+00:00")).timestamp()
+
+def transit_gates(epoch: float) -> Tuple[int, int]:
+    """
+    Gates of the transiting Sun and Moon at a moment.
+    """
+    dt = datetime.fromtimestamp(epoch, timezone.utc)
+    jd = swe.julday(dt.year, dt.month, dt.day, dt.hour + dt.minute / 60 + dt.second / 3600)
+    return get_hd_coords(swe.calc_ut(jd, swe.SUN)[0][0])[0], get_hd_coords(swe.calc_ut(jd, swe.MOON)[0][0])[0]
+
+def event_features(event: Dict, epoch: float) -> Tuple[str, ...]:
+    features = {f"label:{' '.join(str(label).lower().split())}" for label in event.get("labels") or [] if str(label).strip()}
+    features.add(f"type:{event.get('type', 'SYSTEM')}")
+    features.update(f"gate:{gate}" for gate in transit_gates(epoch))
+    return tuple(sorted(features))
+
+class UserRecurrence:
+    """
+    One user's sliding window: (epoch, features) in arrival order plus the
+    feature counts over it.
+    """
+    __slots__ = ("window", "counts", "newest")
+
+    def __init__(self):
+        self.window: Deque[Tuple[float, Tuple[str, ...]]] = deque()
+        self.counts: Counter = Counter()
+        self.newest = 0.0
+
+    def _expire(self, cutoff: float):
+        # Events arrive roughly in time order; a backdated one is dropped as
+        # soon as it reaches the front, which only delays its expiry
+        while self.window and self.window[0][0] < cutoff:
+            _, features = self.window.popleft()
+            self.counts.subtract(features)
+            for feature in features:
+                if self.counts[feature] <= 0:
+                    del self.counts[feature]
+
+    def score(self, epoch: float, features: Tuple[str, ...], window_seconds: float) -> Tuple[int, Optional[str]]:
+        """
+        Scores an event against the window without adding it. Returns (score, shadowId).
+        """
+        # Expiry only depends on the event's time, so a retried event expires the same entries
+        self._expire(max(self.newest, epoch) - window_seconds)
+        if epoch < self.newest - window_seconds:
+            # Older than the whole window: nothing to compare it with
+            return 0, None
+
+        raw = sum(FEATURE_WEIGHTS[f.split(":", 1)[0]] * self.counts[f] for f in features)
+        score = round(10 * (1 - math.exp(-raw / RECURRENCE_SCALE)))
+
+        shadow, best = None, 0.0
+        for feature in features:
+            kind = feature.split(":", 1)[0]
+            # The event counts towards its own shadow
+            count = self.counts[feature] + 1
+            if kind in SHADOW_KINDS and count >= SHADOW_MIN_COUNT:
+                weighted = FEATURE_WEIGHTS[kind] * count
+                if weighted > best:
+                    shadow, best = feature, weighted
+        return score, shadow
+
+    def commit(self, epoch: float, features: Tuple[str, ...], window_seconds: float):
+        """
+        Adds a scored event to the window.
+        """
+        if epoch < self.newest - window_seconds:
+            return
+        self.newest = max(self.newest, epoch)
+        self.window.append((epoch, features))
+        self.counts.update(features)
+
+    def observe(self, epoch: float, features: Tuple[str, ...], window_seconds: float) -> Tuple[int, Optional[str]]:
+        """
+        Scores an event, then adds it. Returns (score, shadowId).
+        """
+        result = self.score(epoch, features, window_seconds)
+        self.commit(epoch, features, window_seconds)
+        return result
+
+class RecurrenceEngine:
+    """
+    Per-user windows, least recently used evicted beyond max_users. `loader`
+    (user_id, since ISO time) -> that user's events since then, oldest first;
+    it warms a user seen for the first time. Without one, users start empty.
+    """
+    def __init__(self, window_days: float = RECURRENCE_WINDOW_DAYS, max_users: int = RECURRENCE_MAX_USERS,
+                 loader: Optional[Callable[[str, str], Iterable[Dict]]] = None):
+        self.window_seconds = window_days * 86400
+        self.max_users = max_users
+        self.loader = loader
+        self._users: "OrderedDict[str, UserRecurrence]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _warm(self, user_id: str, now: float) -> UserRecurrence:
+        state = UserRecurrence()
+        if self.loader is not None:
+            since = datetime.fromtimestamp(now - self.window_seconds, timezone.utc).isoformat()
+            for event in self.loader(user_id, since):
+                epoch = event_epoch(event)
+                state.observe(epoch, event_features(event, epoch), self.window_seconds)
+        return state
+
+    def _state(self, user_id: str, epoch: float) -> UserRecurrence:
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None:
+                self._users.move_to_end(user_id)
+                return state
+        # Loading history is I/O, done outside the lock
+        loaded = self._warm(user_id, max(epoch, time.time()))
+        with self._lock:
+            state = self._users.setdefault(user_id, loaded)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            return state
+
+    def score(self, user_id: str, event: Dict) -> Dict:
+        """
+        Returns a copy of event with recurrenceScore and shadowId set. The
+        event isn't part of the user's window until commit().
+        """
+        epoch = event_epoch(event)
+        features = event_features(event, epoch)
+        state = self._state(user_id, epoch)
+        with self._lock:
+            score, shadow = state.score(epoch, features, self.window_seconds)
+        return dict(event, recurrenceScore=score, shadowId=shadow)
+
+    def commit(self, user_id: str, event: Dict):
+        """
+        Adds a scored event, once stored, to the user's window.
+        """
+        epoch = event_epoch(event)
+        features = event_features(event, epoch)
+        state = self._state(user_id, epoch)
+        with self._lock:
+            state.commit(epoch, features, self.window_seconds)
+
+    def observe(self, user_id: str, event: Dict) -> Dict:
+        """
+        score() and commit() in one.
+        """
+        scored = self.score(user_id, event)
+        self.commit(user_id, scored)
+        return scored
+
+    def forget(self, user_id: str):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+def score_stream(events: Iterable[Dict], window_days: float = RECURRENCE_WINDOW_DAYS) -> Iterable[Tuple[Dict, int, Optional[str]]]:
+    """
+    Scores events ordered by (userId, time) in one pass, holding only the
+    current user's window. Yields (event, score, shadowId).
+    """
+    window_seconds = window_days * 86400
+    user, state = None, None
+    for event in events:
+        if event.get("userId") != user:
+            user, state = event.get("userId"), UserRecurrence()
+        epoch = event_epoch(event)
+        score, shadow = state.observe(epoch, event_features(event, epoch), window_seconds)
+        yield event, score, shadow
+
+def timeline_loader(user_id: str, since: str) -> List[Dict]:
+    """
+    The user's timeline events since `since`, oldest first.
+    """
+    store = get_timeline_store()
+    events, cursor = [], None
+    while True:
+        page = store.query(user_id, TimelineQuery(start=since, limit=MAX_PAGE_SIZE, cursor=cursor))
+        events.extend(page.events)
+        cursor = page.next_cursor
+        if not cursor:
+            break
+    return list(reversed(events))
+
+_engine: Optional[RecurrenceEngine] = None
+
+def get_recurrence_engine() -> RecurrenceEngine:
+    global _engine
+    if _engine is None:
+        _engine = RecurrenceEngine(loader=timeline_loader)
+    return _engine
+
+def set_recurrence_engine(engine: Optional[RecurrenceEngine]):
+    global _engine
+    _engine = engine
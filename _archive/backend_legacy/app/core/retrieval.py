@@ -0,0 +1,160 @@
+"""
+Local retrieval over the knowledge base.
+
+Each topic is split into paragraph-sized snippets and indexed with TF-IDF
+in an inverted index (term -> postings), so a query only touches snippets that
+share a term with it. The chat agent pulls the top-k snippets for a message
+instead of pasting whole topics, or nothing, into the prompt.
+
+The index is built once from knowledge_base.TOPICS; any dict shaped like
+TOPICS ({key: {title, short_desc, deep_dive}}) can be indexed. A sorted copy
+of the vocabulary lets query words also match as prefixes ("individ" ->
+"individuation") via binary search, without scanning the vocabulary.
+"""
+import bisect
+import math
+import re
+import textwrap
+from collections import Counter, defaultdict
+from typing import Dict, List, NamedTuple, Optional
+from app.core import knowledge_base
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its me my not of on or our so that the
+their them these they this to was we what when where which who why will with you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS and len(t) > 1]
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough LLM token count (~4 characters per token for English prose).
+    Good enough for budgeting; the provider's tokenizer is not available locally.
+    """
+    return (len(text) + 3) // 4
+
+class Snippet(NamedTuple):
+    topic: str
+    title: str
+    text: str
+
+class ScoredSnippet(NamedTuple):
+    snippet: Snippet
+    score: float
+
+class ScoredTopic(NamedTuple):
+    topic: str
+    title: str
+    score: float
+
+# Weight of a prefix match relative to an exact term match
+PREFIX_WEIGHT = 0.5
+# Shorter query words would expand to too much of the vocabulary
+MIN_PREFIX_LENGTH = 3
+
+def topic_snippets(key: str, topic: Dict) -> List[Snippet]:
+    """
+    The title line plus one snippet per paragraph of the deep dive.
+    """
+    title = topic.get("title", key)
+    snippets = [Snippet(key, title, f"{title}: {topic.get('short_desc', '')}".strip())]
+    for paragraph in textwrap.dedent(topic.get("deep_dive", "")).split("\n\n"):
+        paragraph = " ".join(paragraph.split())
+        if paragraph:
+            snippets.append(Snippet(key, title, paragraph))
+    return snippets
+
+class KnowledgeIndex:
+    def __init__(self, snippets: List[Snippet]):
+        self.snippets = snippets
+        postings: Dict[str, List] = defaultdict(list)
+        for doc_id, snippet in enumerate(snippets):
+            # Titles are indexed with every snippet of their topic
+            counts = Counter(tokenize(snippet.text) + tokenize(snippet.title))
+            for term, count in counts.items():
+                postings[term].append((doc_id, count))
+
+        n = len(snippets)
+        self.idf = {term: math.log((n + 1) / (len(docs) + 1)) + 1 for term, docs in postings.items()}
+        # Store tf-idf weights directly so search is a single pass over postings
+        self.postings = {
+            term: [(doc_id, (1 + math.log(count)) * self.idf[term]) for doc_id, count in docs]
+            for term, docs in postings.items()
+        }
+        norms = [0.0] * n
+        for docs in self.postings.values():
+            for doc_id, weight in docs:
+                norms[doc_id] += weight * weight
+        self.norms = [math.sqrt(v) or 1.0 for v in norms]
+        self.vocabulary = sorted(self.postings)
+
+    @classmethod
+    def from_topics(cls, topics: Dict[str, Dict]) -> "KnowledgeIndex":
+        return cls([s for key, topic in topics.items() for s in topic_snippets(key, topic)])
+
+    def prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\uffff")
+        return self.vocabulary[start:end]
+
+    def _query_weights(self, query: str, prefix: bool) -> Dict[str, float]:
+        weights: Dict[str, float] = defaultdict(float)
+        for token, count in Counter(tokenize(query)).items():
+            tf = 1 + math.log(count)
+            if token in self.postings:
+                weights[token] = max(weights[token], tf * self.idf[token])
+            if prefix and len(token) >= MIN_PREFIX_LENGTH:
+                for term in self.prefix_terms(token):
+                    if term != token:
+                        weights[term] = max(weights[term], PREFIX_WEIGHT * tf * self.idf[term])
+        return weights
+
+    def _rank(self, query: str, prefix: bool) -> List[tuple]:
+        weights = self._query_weights(query, prefix)
+        if not weights:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for term, q_weight in weights.items():
+            for doc_id, weight in self.postings[term]:
+                scores[doc_id] += q_weight * weight
+        query_norm = math.sqrt(sum(w * w for w in weights.values()))
+        return sorted(
+            ((doc_id, score / (self.norms[doc_id] * query_norm)) for doc_id, score in scores.items()),
+            key=lambda item: item[1], reverse=True
+        )
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.05, prefix: bool = False) -> List[ScoredSnippet]:
+        """
+        Top-k snippets by cosine similarity to query, best first.
+        """
+        ranked = self._rank(query, prefix)
+        return [ScoredSnippet(self.snippets[doc_id], score) for doc_id, score in ranked[:k] if score >= min_score]
+
+    def search_topics(self, query: str, k: int = 10, min_score: float = 0.05, prefix: bool = True) -> List[ScoredTopic]:
+        """
+        Top-k topics, each scored by its best matching snippet.
+        """
+        best: Dict[str, ScoredTopic] = {}
+        for doc_id, score in self._rank(query, prefix):
+            if score < min_score:
+                break
+            snippet = self.snippets[doc_id]
+            if snippet.topic not in best:
+                best[snippet.topic] = ScoredTopic(snippet.topic, snippet.title, score)
+                if len(best) == k:
+                    break
+        return list(best.values())
+
+_index: Optional[KnowledgeIndex] = None
+
+def get_knowledge_index() -> KnowledgeIndex:
+    global _index
+    if _index is None:
+        _index = KnowledgeIndex.from_topics(knowledge_base.TOPICS)
+    return _index
+
+def set_knowledge_index(index: Optional[KnowledgeIndex]):
+    global _index
+    _index = index
@@ -0,0 +1,210 @@
+"""
+Expired share sweeper.
+
+Shares carry expires_at but stayed `active` forever, in both copies
+(`therapist_shares/{id}` and `users/{uid}/shares/{id}`). The sweeper
+deactivates each share once it expires, touching only shares that are due:
+
+- Every SHARE_SWEEP_REFILL seconds an indexed query (active, expires_at)
+  loads the shares expiring within the next SHARE_SWEEP_HORIZON seconds,
+  overdue ones included, into a heap ordered by expiry. Shares created in
+  the meantime are pushed on directly.
+- The sweeper thread sleeps until the heap's earliest expiry, pops every
+  share that is due and deactivates both copies through the write-behind
+  buffer, so they land in the same batches.
+
+Cost scales with the number of shares expiring, not with the number of
+shares. Lag (deactivation time minus expiry) is logged and kept in stats().
+Deactivation is an idempotent merge, so several instances sweeping the same
+share only repeat the same write.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SHARE_SWEEP_HORIZON = float(os.getenv("SHARE_SWEEP_HORIZON", 3600))
+SHARE_SWEEP_REFILL = float(os.getenv("SHARE_SWEEP_REFILL", 900))
+SHARE_SWEEPER = os.getenv("SHARE_SWEEPER", "1") == "1"
+SWEEP_PAGE_SIZE = 500
+
+# (expires_at epoch, share_id, user_id)
+DueShare = Tuple[float, str, str]
+
+def firestore_due_shares(until: float) -> Iterable[DueShare]:
+    """
+    Active shares expiring before `until`, earliest first.
+    Needs the composite index therapist_shares (active, expires_at).
+    """
+    from app.core.firebase import firestore
+    query = firestore.client().collection("therapist_shares") \
+        .where("active", "==", True) \
+        .where("expires_at", "<=", datetime.fromtimestamp(until, timezone.utc)) \
+        .order_by("expires_at").select(["user_id", "expires_at"])
+    last = None
+    while True:
+        page = (query.start_after(last) if last is not None else query).limit(SWEEP_PAGE_SIZE)
+        docs = list(page.stream())
+        if not docs:
+            return
+        for doc in docs:
+            yield doc.get("expires_at").timestamp(), doc.id, doc.get("user_id")
+        last = docs[-1]
+
+def firestore_deactivate(shares: List[DueShare], now: float):
+    from app.core.firebase import firestore
+    from app.core.write_behind import Write, get_write_behind
+    db = firestore.client()
+    buffer = get_write_behind()
+    expired = {"active": False, "expired_at": datetime.fromtimestamp(now, timezone.utc)}
+    for _, share_id, user_id in shares:
+        # Both copies in one group, so they never drift apart
+        buffer.enqueue(db, [
+            Write(db.collection("therapist_shares").document(share_id), expired, merge=True),
+            Write(db.collection("users").document(user_id).collection("shares").document(share_id), expired, merge=True)
+        ])
+
+class ShareSweeper:
+    def __init__(self, loader: Callable[[float], Iterable[DueShare]] = firestore_due_shares,
+                 deactivate: Callable[[List[DueShare], float], None] = firestore_deactivate,
+                 horizon: float = SHARE_SWEEP_HORIZON, refill_interval: float = SHARE_SWEEP_REFILL,
+                 clock: Callable[[], float] = time.time):
+        self.loader = loader
+        self.deactivate = deactivate
+        self.horizon = horizon
+        self.refill_interval = refill_interval
+        self.clock = clock
+        self._heap: List[DueShare] = []
+        self._queued: Set[str] = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._covered_until = float("-inf") # everything expiring before this is in the heap
+        self._next_refill = float("-inf")
+        self.swept = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def schedule(self, share_id: str, user_id: str, expires_at: float):
+        """
+        Called for new shares. Only those inside the loaded horizon need the
+        heap; later ones are picked up by the refill that reaches them.
+        """
+        with self._cond:
+            if expires_at > self._covered_until or share_id in self._queued:
+                return
+            heapq.heappush(self._heap, (expires_at, share_id, user_id))
+            self._queued.add(share_id)
+            self._cond.notify_all()
+
+    def refill(self):
+        now = self.clock()
+        until = now + self.horizon
+        due = list(self.loader(until))
+        with self._cond:
+            for expires_at, share_id, user_id in due:
+                if share_id not in self._queued:
+                    heapq.heappush(self._heap, (expires_at, share_id, user_id))
+                    self._queued.add(share_id)
+            self._covered_until = until
+            self._next_refill = now + self.refill_interval
+            self._cond.notify_all()
+        logger.info(f"Share sweeper loaded {len(due)} shares expiring in the next {self.horizon:.0f}s")
+
+    def sweep(self) -> int:
+        """
+        Deactivates every share that is due. Returns how many.
+        """
+        now = self.clock()
+        with self._cond:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+        if not due:
+            return 0
+        try:
+            self.deactivate(due, now)
+        except Exception as e:
+            logger.error(f"Share deactivation failed, retrying next sweep: {e}")
+            with self._cond:
+                for share in due:
+                    heapq.heappush(self._heap, share)
+            return 0
+        lag = now - due[0][0]
+        with self._cond:
+            self._queued.difference_update(share_id for _, share_id, _ in due)
+            self.swept += len(due)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+        logger.info(f"Deactivated {len(due)} expired shares, lag up to {lag:.1f}s")
+        return len(due)
+
+    def _run(self):
+        while True:
+            if self.clock() >= self._next_refill:
+                try:
+                    self.refill()
+                except Exception as e:
+                    logger.warning(f"Share sweeper refill failed: {e}")
+                    self._next_refill = self.clock() + min(self.refill_interval, 60)
+            self.sweep()
+            with self._cond:
+                if self._stopping:
+                    return
+                wake = self._next_refill
+                if self._heap:
+                    wake = min(wake, self._heap[0][0])
+                delay = wake - self.clock()
+                # Still due right after a sweep means deactivation failed: back off a little
+                self._cond.wait(delay if delay > 0 else 1.0)
+                if self._stopping:
+                    return
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="share-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._heap),
+                "next_expiry": self._heap[0][0] if self._heap else None,
+                "swept": self.swept,
+                "last_lag_seconds": round(self.last_lag, 3),
+                "max_lag_seconds": round(self.max_lag, 3)
+            }
+
+_sweeper: Optional[ShareSweeper] = None
+
+def get_share_sweeper() -> ShareSweeper:
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = ShareSweeper()
+    return _sweeper
+
+def set_share_sweeper(sweeper: Optional[ShareSweeper]):
+    global _sweeper
+    _sweeper = sweeper
+
+def start_share_sweeper():
+    if SHARE_SWEEPER:
+        get_share_sweeper().start()
+
+def stop_share_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.stop()
+        _sweeper = None
@@ -0,0 +1,189 @@
+"""
+Signed therapist share tokens.
+
+A share link carries an HMAC-SHA256 signed token embedding the share ID, the
+sharing user, the access scope and the expiry, so checking a clinician's
+access is a signature check and a clock comparison, no Firestore read.
+
+The one thing a token can't know is that it was revoked before it expired.
+Revoked share IDs are kept in memory (until their share would have expired
+anyway) and re-synced from Firestore every SHARE_REVOCATION_SYNC seconds in
+the background, so a revocation made on another instance is honoured within
+that interval and immediately on the instance that made it.
+
+Token format: base64url(payload JSON) "." base64url(signature). Set
+SHARE_TOKEN_SECRET to the same value on every instance; without it tokens are
+signed with a per-process key and stop verifying after a restart.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SHARE_REVOCATION_SYNC = float(os.getenv("SHARE_REVOCATION_SYNC", 60))
+# Upper bound on a share's lifetime (ShareRequest.duration_days), used when a
+# revocation arrives without the share's own expiry
+MAX_SHARE_SECONDS = 365 * 86400
+
+ACCESS_CODES = {"read_only": "r", "read_write": "rw"}
+ACCESS_NAMES = {code: name for name, code in ACCESS_CODES.items()}
+
+class InvalidShareToken(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason # malformed | signature | expired | revoked
+
+class ShareClaims(NamedTuple):
+    share_id: str
+    user_id: str
+    access_type: str
+    expires_at: int # epoch seconds
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+class ShareSigner:
+    def __init__(self, secret: bytes):
+        self._secret = secret
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()
+
+    def issue(self, claims: ShareClaims) -> str:
+        payload = json.dumps(
+            {"s": claims.share_id, "u": claims.user_id, "a": ACCESS_CODES[claims.access_type], "e": int(claims.expires_at)},
+            separators=(",", ":")
+        ).encode()
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}"
+
+    def decode(self, token: str, now: Optional[float] = None) -> ShareClaims:
+        """
+        Claims of a genuine, unexpired token. Raises InvalidShareToken otherwise.
+        Revocation is checked separately (RevocationCache).
+        """
+        try:
+            payload_part, signature_part = token.split(".")
+            payload, signature = _b64decode(payload_part), _b64decode(signature_part)
+        except ValueError:
+            raise InvalidShareToken("malformed")
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidShareToken("signature")
+        try:
+            data = json.loads(payload)
+            claims = ShareClaims(str(data["s"]), str(data["u"]), ACCESS_NAMES[data["a"]], int(data["e"]))
+        except (ValueError, KeyError, TypeError):
+            raise InvalidShareToken("malformed")
+        if claims.expires_at <= (time.time() if now is None else now):
+            raise InvalidShareToken("expired")
+        return claims
+
+class RevocationCache:
+    """
+    share_id -> expiry of revoked shares. `loader` returns every revoked,
+    unexpired (share_id, expires_at epoch) from the store.
+    """
+    def __init__(self, loader: Optional[Callable[[], Iterable[Tuple[str, float]]]] = None,
+                 sync_interval: float = SHARE_REVOCATION_SYNC, clock: Callable[[], float] = time.time):
+        self.loader = loader
+        self.sync_interval = sync_interval
+        self.clock = clock
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._synced_at = float("-inf")
+        self._syncing = False
+
+    def add(self, share_id: str, expires_at: Optional[float] = None):
+        with self._lock:
+            self._revoked[share_id] = expires_at if expires_at is not None else self.clock() + MAX_SHARE_SECONDS
+
+    def is_revoked(self, share_id: str) -> bool:
+        # Never waits on the store: a due sync runs in the background
+        if self.loader is not None and self.clock() - self._synced_at >= self.sync_interval and not self._syncing:
+            self._start_sync()
+        return share_id in self._revoked
+
+    def _start_sync(self):
+        with self._lock:
+            if self._syncing:
+                return
+            self._syncing = True
+        threading.Thread(target=self.sync, name="share-revocations", daemon=True).start()
+
+    def sync(self):
+        """
+        Merges the store's revocations in and drops entries past their expiry.
+        Local additions are kept; the store may not have them yet.
+        """
+        try:
+            loaded = list(self.loader()) if self.loader else []
+            now = self.clock()
+            with self._lock:
+                for share_id, expires_at in loaded:
+                    self._revoked[share_id] = expires_at
+                self._revoked = {k: v for k, v in self._revoked.items() if v > now}
+                self._synced_at = now
+        except Exception as e:
+            logger.warning(f"Share revocation sync failed, keeping cached set: {e}")
+            # Retry on the next interval rather than on every check
+            self._synced_at = self.clock()
+        finally:
+            self._syncing = False
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+def firestore_revocations() -> Iterable[Tuple[str, float]]:
+    from app.core.firebase import firestore
+    now = datetime.now(timezone.utc)
+    docs = firestore.client().collection("therapist_shares") \
+        .where("active", "==", False).where("expires_at", ">", now).select(["expires_at"]).stream()
+    for doc in docs:
+        expires_at = doc.get("expires_at")
+        yield doc.id, expires_at.timestamp() if expires_at else time.time() + MAX_SHARE_SECONDS
+
+def verify_share_token(token: str, now: Optional[float] = None) -> ShareClaims:
+    """
+    The hot path: signature, expiry and revocation, all in memory.
+    """
+    claims = get_share_signer().decode(token, now)
+    if get_revocations().is_revoked(claims.share_id):
+        raise InvalidShareToken("revoked")
+    return claims
+
+_signer: Optional[ShareSigner] = None
+_revocations: Optional[RevocationCache] = None
+
+def get_share_signer() -> ShareSigner:
+    global _signer
+    if _signer is None:
+        secret = os.getenv("SHARE_TOKEN_SECRET")
+        if not secret:
+            logger.warning("SHARE_TOKEN_SECRET not set, share tokens are signed with a per-process key")
+        _signer = ShareSigner(secret.encode() if secret else secrets.token_bytes(32))
+    return _signer
+
+def set_share_signer(signer: Optional[ShareSigner]):
+    global _signer
+    _signer = signer
+
+def get_revocations() -> RevocationCache:
+    global _revocations
+    if _revocations is None:
+        _revocations = RevocationCache(loader=firestore_revocations)
+    return _revocations
+
+def set_revocations(cache: Optional[RevocationCache]):
+    global _revocations
+    _revocations = cache
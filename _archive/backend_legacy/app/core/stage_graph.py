@@ -0,0 +1,100 @@
+"""
+Minimal async stage graph.
+
+A request pipeline is declared as named stages with dependencies. Each stage
+starts as soon as its dependencies finish, so independent stages overlap and
+end-to-end latency approaches the slowest path instead of the sum of all steps.
+Every stage has its own timeout and fallback value: a slow or failing stage
+degrades to its fallback without taking the request down.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """
+    fn is an async callable receiving each dependency's value as a keyword
+    argument named after that dependency.
+    """
+    def __init__(self, name: str, fn: Callable[..., Awaitable[Any]], deps: Iterable[str] = (),
+                 timeout: Optional[float] = None, fallback: Any = None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+
+class StageResult:
+    def __init__(self, value: Any, seconds: float, status: str = "ok", error: Optional[str] = None,
+                 exception: Optional[BaseException] = None):
+        self.value = value
+        self.seconds = seconds
+        # ok | timeout | error
+        self.status = status
+        self.error = error
+        # The exception behind an "error", for callers that treat some failures specially
+        self.exception = exception
+
+class StageGraph:
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [d for d in stage.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages {missing}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task]) -> StageResult:
+        deps = {name: (await tasks[name]).value for name in stage.deps}
+        started = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(stage.fn(**deps), stage.timeout)
+            return StageResult(value, time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stage '{stage.name}' timed out after {stage.timeout}s, using fallback")
+            return StageResult(stage.fallback, time.perf_counter() - started, "timeout")
+        except Exception as e:
+            logger.error(f"Stage '{stage.name}' failed, using fallback: {e}")
+            return StageResult(stage.fallback, time.perf_counter() - started, "error", str(e), e)
+
+    async def run(self) -> Dict[str, StageResult]:
+        tasks: Dict[str, asyncio.Task] = {}
+        # Tasks only await their dependencies' tasks, so creation order doesn't
+        # matter as long as every task exists before any of them runs
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.ensure_future(self._run_stage(stage, tasks))
+        await asyncio.gather(*tasks.values())
+        return {name: task.result() for name, task in tasks.items()}
+
+def server_timing(results: Dict[str, StageResult]) -> str:
+    """
+    Formats stage timings as a Server-Timing header value, e.g.
+    'chart;dur=1.2, llm;dur=812.0;desc="timeout"'.
+    """
+    parts = []
+    for name, result in results.items():
+        part = f"{name};dur={result.seconds * 1000:.1f}"
+        if result.status != "ok":
+            part += f';desc="{result.status}"'
+        parts.append(part)
+    return ", ".join(parts)
@@ -0,0 +1,296 @@
+"""
+Timeline repository.
+
+Timeline events are read newest first, a page at a time, with optional time
+range, type and label filters. Pages continue from an opaque cursor (the last
+event's time and ID) rather than an offset, so every read touches at most one
+page of events no matter how long a user's history is.
+
+Backends:
+- FirestoreTimelineStore: `users/{userId}/timeline/{eventId}` (default).
+  Filtered queries need composite indexes on (type, time), (labels, time).
+  Writes go through the write-behind buffer, so a just-logged event shows up
+  in queries after the next flush (WRITE_FLUSH_INTERVAL).
+- SQLiteTimelineStore: embedded stand-in for tests and local dev (TIMELINE_DB=path).
+
+Times are stored as UTC ISO-8601 strings with a fixed width, so string order
+is time order in both backends.
+"""
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from app.core.write_behind import Write, WriteBufferFull, get_write_behind
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_DB = os.getenv("TIMELINE_DB")
+MAX_PAGE_SIZE = 100
+SCAN_PAGE_SIZE = 1000
+
+def normalize_time(value: Optional[str]) -> str:
+    """
+    Any ISO-8601 timestamp -> 'YYYY-MM-DDTHH:MM:SS.ffffffZ' in UTC. Naive
+    timestamps are taken as UTC. None means now.
+    """
+    if not value:
+        dt = datetime.now(timezone.utc)
+    else:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        dt = dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+def encode_cursor(time: str, event_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([time, event_id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Raises ValueError for a cursor this module didn't produce.
+    """
+    try:
+        time, event_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(time), str(event_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+class TimelineQuery(NamedTuple):
+    start: Optional[str] = None # inclusive
+    end: Optional[str] = None # exclusive
+    types: Optional[Sequence[str]] = None
+    label: Optional[str] = None
+    limit: int = 50
+    cursor: Optional[str] = None
+
+class TimelinePage(NamedTuple):
+    events: List[Dict]
+    next_cursor: Optional[str]
+
+def new_event(user_id: str, event: Dict) -> Dict:
+    return {
+        "id": event.get("id") or uuid.uuid4().hex,
+        "userId": user_id,
+        "time": normalize_time(event.get("time") or event.get("timestamp")),
+        "type": event.get("type", "SYSTEM"),
+        "narrative": event.get("narrative"),
+        "location": event.get("location"),
+        "media_url": event.get("media_url"),
+        "labels": list(event.get("labels") or []),
+        "shadowId": event.get("shadowId"),
+        "recurrenceScore": int(event.get("recurrenceScore") or 0),
+        "importance": int(event.get("importance") or 5),
+    }
+
+def _page(rows: List[Dict], limit: int) -> TimelinePage:
+    # One extra row was fetched to know whether another page exists
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        return TimelinePage(rows[:limit], encode_cursor(last["time"], last["id"]))
+    return TimelinePage(rows, None)
+
+class SQLiteTimelineStore:
+    def __init__(self, path: str = ":memory:"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS timeline (
+                    user_id TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    PRIMARY KEY (user_id, id)
+                );
+                CREATE INDEX IF NOT EXISTS timeline_by_time ON timeline (user_id, time DESC, id DESC);
+                CREATE TABLE IF NOT EXISTS timeline_labels (
+                    user_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    label TEXT NOT NULL,
+                    PRIMARY KEY (user_id, label, event_id)
+                );
+            """)
+
+    def add(self, user_id: str, event: Dict) -> Dict:
+        return self.add_many(user_id, [event])[0]
+
+    def add_many(self, user_id: str, events: List[Dict]) -> List[Dict]:
+        stored = [new_event(user_id, e) for e in events]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO timeline (user_id, id, time, type, event) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, e["id"], e["time"], e["type"], json.dumps(e)) for e in stored]
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO timeline_labels (user_id, event_id, label) VALUES (?, ?, ?)",
+                [(user_id, e["id"], label) for e in stored for label in e["labels"]]
+            )
+        return stored
+
+    def query(self, user_id: str, q: TimelineQuery = TimelineQuery(), timeout: Optional[float] = None) -> TimelinePage:
+        # timeout is for network stores; a local query doesn't wait on anything
+        limit = max(1, min(q.limit, MAX_PAGE_SIZE))
+        sql = ["SELECT event FROM timeline t WHERE user_id = ?"]
+        args: List = [user_id]
+        if q.start:
+            sql.append("AND time >= ?")
+            args.append(normalize_time(q.start))
+        if q.end:
+            sql.append("AND time < ?")
+            args.append(normalize_time(q.end))
+        if q.types:
+            sql.append(f"AND type IN ({','.join('?' * len(q.types))})")
+            args.extend(q.types)
+        if q.label:
+            sql.append("AND EXISTS (SELECT 1 FROM timeline_labels l WHERE l.user_id = t.user_id AND l.event_id = t.id AND l.label = ?)")
+            args.append(q.label)
+        if q.cursor:
+            sql.append("AND (time, id) < (?, ?)")
+            args.extend(decode_cursor(q.cursor))
+        sql.append("ORDER BY time DESC, id DESC LIMIT ?")
+        args.append(limit + 1)
+        with self._lock:
+            rows = self._db.execute(" ".join(sql), args).fetchall()
+        return _page([json.loads(row["event"]) for row in rows], limit)
+
+    def scan(self) -> Iterator[Dict]:
+        """
+        Every event of every user, ordered by (userId, time), a page at a time.
+        """
+        last = ("", "", "")
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT user_id, time, id, event FROM timeline WHERE (user_id, time, id) > (?, ?, ?) "
+                    "ORDER BY user_id, time, id LIMIT ?", (*last, SCAN_PAGE_SIZE)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield json.loads(row["event"])
+            last = (rows[-1]["user_id"], rows[-1]["time"], rows[-1]["id"])
+
+    def set_scores(self, user_id: str, scores: List[Tuple[str, int, Optional[str]]]):
+        """
+        (event id, recurrenceScore, shadowId) for existing events.
+        """
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE timeline SET event = json_set(event, '$.recurrenceScore', ?, '$.shadowId', ?) "
+                "WHERE user_id = ? AND id = ?",
+                [(score, shadow, user_id, event_id) for event_id, score, shadow in scores]
+            )
+
+    def close(self):
+        self._db.close()
+
+class FirestoreTimelineStore:
+    def _collection(self, user_id: str):
+        from app.core.firebase import firestore
+        return firestore.client().collection('users').document(user_id).collection('timeline')
+
+    def add(self, user_id: str, event: Dict) -> Dict:
+        return self.add_many(user_id, [event])[0]
+
+    def add_many(self, user_id: str, events: List[Dict]) -> List[Dict]:
+        """
+        Queues the events and returns them without waiting for Firestore.
+        Event IDs are assigned here, so a retried batch rewrites the same documents.
+        """
+        from app.core.firebase import firestore
+        collection = self._collection(user_id)
+        stored = [new_event(user_id, e) for e in events]
+        buffer = get_write_behind()
+        # Oversized imports are queued in batch-sized groups
+        for i in range(0, len(stored), buffer.batch_size):
+            buffer.enqueue(firestore.client(), [
+                Write(collection.document(e["id"]), dict(e, created_at=firestore.SERVER_TIMESTAMP))
+                for e in stored[i:i + buffer.batch_size]
+            ])
+        return stored
+
+    def query(self, user_id: str, q: TimelineQuery = TimelineQuery(), timeout: Optional[float] = None) -> TimelinePage:
+        from app.core.firebase import firestore
+        limit = max(1, min(q.limit, MAX_PAGE_SIZE))
+        collection = self._collection(user_id)
+        query = collection
+        if q.start:
+            query = query.where("time", ">=", normalize_time(q.start))
+        if q.end:
+            query = query.where("time", "<", normalize_time(q.end))
+        if q.types:
+            query = query.where("type", "in", list(q.types))
+        if q.label:
+            query = query.where("labels", "array_contains", q.label)
+        query = query.order_by("time", direction=firestore.Query.DESCENDING) \
+                     .order_by("__name__", direction=firestore.Query.DESCENDING)
+        if q.cursor:
+            time, event_id = decode_cursor(q.cursor)
+            snapshot = collection.document(event_id).get(timeout=timeout)
+            # A deleted cursor event can only be resumed by time
+            query = query.start_after(snapshot if snapshot.exists else {"time": time})
+        docs = query.limit(limit + 1).stream(timeout=timeout)
+        rows = []
+        for doc in docs:
+            event = doc.to_dict()
+            event.pop("created_at", None)
+            rows.append(dict(event, id=doc.id))
+        return _page(rows, limit)
+
+    def scan(self) -> Iterator[Dict]:
+        """
+        Every event of every user, ordered by (userId, time), a page at a time.
+        Needs a collection group index on timeline (userId, time).
+        """
+        from app.core.firebase import firestore
+        query = firestore.client().collection_group('timeline').order_by("userId").order_by("time")
+        last = None
+        while True:
+            page = (query.start_after(last) if last is not None else query).limit(SCAN_PAGE_SIZE)
+            docs = list(page.stream())
+            if not docs:
+                return
+            for doc in docs:
+                event = doc.to_dict()
+                event.pop("created_at", None)
+                yield dict(event, id=doc.id)
+            last = docs[-1]
+
+    def set_scores(self, user_id: str, scores: List[Tuple[str, int, Optional[str]]]):
+        """
+        Bulk writer (app.jobs.recurrence_backfill): when the write-behind
+        buffer is full it waits for it to drain rather than failing.
+        """
+        from app.core.firebase import firestore
+        collection = self._collection(user_id)
+        buffer = get_write_behind()
+        for i in range(0, len(scores), buffer.batch_size):
+            writes = [
+                Write(collection.document(event_id), {"recurrenceScore": score, "shadowId": shadow}, merge=True)
+                for event_id, score, shadow in scores[i:i + buffer.batch_size]
+            ]
+            while True:
+                try:
+                    buffer.enqueue(firestore.client(), writes)
+                    break
+                except WriteBufferFull:
+                    buffer.flush()
+
+_store = None
+
+def get_timeline_store():
+    global _store
+    if _store is None:
+        _store = SQLiteTimelineStore(TIMELINE_DB) if TIMELINE_DB else FirestoreTimelineStore()
+    return _store
+
+def set_timeline_store(store):
+    global _store
+    _store = store
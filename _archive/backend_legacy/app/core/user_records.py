@@ -0,0 +1,81 @@
+"""
+The `users/{id}` document.
+
+Request models and builders shared by /api/users/init and the bulk import
+(app.jobs.user_import), so both write the same record.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+from app.core.chart_store import compute_chart
+
+logger = logging.getLogger(__name__)
+
+class BioMetrics(BaseModel):
+    birthDate: str
+    birthTime: Optional[str] = None
+    birthLocation: str
+    humanDesignType: Optional[str] = None
+    enneagram: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+class Vector3(BaseModel):
+    x: float
+    y: float
+    z: float
+
+class LineageMember(BaseModel):
+    id: str
+    role: str
+    lifePath: Optional[int] = None
+    humanDesign: Optional[str] = None
+    vector: Optional[Vector3] = None
+    # Birth data, when known, gets the member a stored chart too
+    birthDate: Optional[str] = None
+    birthTime: Optional[str] = None
+    birthLocation: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+class UserInitRequest(BaseModel):
+    userId: str
+    email: str
+    name: str
+    bioMetrics: BioMetrics
+    familyMembers: Optional[list[LineageMember]] = []
+
+def attach_charts(bio: dict, members: list) -> Optional[dict]:
+    """
+    Resolves location and timezone and calculates the natal chart once, for the
+    user and every family member with a birth date. Returns the user's chart
+    blob; members get theirs under "chart". A failure leaves that chart to the
+    lazy backfill.
+    """
+    blob = None
+    try:
+        blob = compute_chart(bio)[1]
+    except Exception as e:
+        logger.warning(f"Natal chart precomputation failed, will backfill on read: {e}")
+    for member in members:
+        if member.get("birthDate"):
+            try:
+                member["chart"] = compute_chart(member)[1]
+            except Exception as e:
+                logger.warning(f"Chart for family member {member.get('id')} failed: {e}")
+    return blob
+
+def build_user_data(request: UserInitRequest, bio: dict, members: list, chart: Optional[dict]) -> dict:
+    user_data = {
+        "id": request.userId,
+        "email": request.email,
+        "name": request.name,
+        "bioMetrics": bio,
+        "familyMembers": members,
+        "tier": "ACCESS_SIGNAL", # Default tier
+        "initializedAt": datetime.utcnow()
+    }
+    if chart:
+        user_data["chart"] = chart
+    return user_data
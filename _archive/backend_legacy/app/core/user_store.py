@@ -0,0 +1,112 @@
+"""
+User record sources for batch jobs.
+
+Jobs read users in chunks from Firestore in production, or from a local
+JSON / NDJSON export for testing and dry runs. Records are plain dicts shaped
+like the `users/{id}` documents written by /api/users/init, with `id` set.
+"""
+import json
+import logging
+from typing import Dict, Iterator, List, Optional
+from app.core.calculations import ChartData
+from app.core.chart_store import compute_chart, save_chart, stored_chart
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+class FirestoreUserSource:
+    """
+    Pages through the `users` collection ordered by document ID.
+    """
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def chunks(self) -> Iterator[List[Dict]]:
+        # Initializes the default app on first use, in jobs outside the API process too
+        from app.core.firebase import firestore
+        db = firestore.client()
+        query = db.collection('users').order_by('__name__').limit(self.chunk_size)
+        last = None
+        while True:
+            page = query.start_after(last) if last is not None else query
+            docs = list(page.stream())
+            if not docs:
+                return
+            yield [dict(doc.to_dict(), id=doc.id) for doc in docs]
+            last = docs[-1]
+
+class LocalUserSource:
+    """
+    Reads users from a JSON array or an NDJSON file (one user object per line).
+    NDJSON is streamed; a JSON array is loaded whole, so keep those small.
+    """
+    def __init__(self, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def _records(self) -> Iterator[Dict]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            first = f.read(1)
+            while first and first.isspace():
+                first = f.read(1)
+            f.seek(0)
+            if first == "[":
+                yield from json.load(f)
+                return
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def chunks(self) -> Iterator[List[Dict]]:
+        chunk = []
+        for record in self._records():
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def open_user_source(spec: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    "firestore" selects the live collection; anything else is a local file path.
+    """
+    if spec == "firestore":
+        return FirestoreUserSource(chunk_size)
+    return LocalUserSource(spec, chunk_size)
+
+def get_user_records(user_ids: List[str], timeout: Optional[float] = None) -> Dict[str, Dict]:
+    """
+    `users/{id}` documents for user_ids in one round trip. Missing users are left out.
+    """
+    from app.core.firebase import firestore
+    db = firestore.client()
+    docs = db.get_all([db.collection('users').document(user_id) for user_id in user_ids], timeout=timeout)
+    return {doc.id: dict(doc.to_dict(), id=doc.id) for doc in docs if doc.exists}
+
+def chart_from_record(record: Dict, backfill: bool = False) -> Optional[ChartData]:
+    """
+    The natal chart of a stored user record, or None if its bioMetrics are
+    missing or unusable. Served from the stored chart blob when it is current
+    (app.core.chart_store); otherwise calculated, and with backfill=True
+    saved on the user document for next time.
+    """
+    chart = stored_chart(record)
+    if chart is not None:
+        return chart
+    bio = record.get("bioMetrics") or {}
+    if not bio.get("birthDate"):
+        return None
+    try:
+        chart, blob = compute_chart(bio)
+    except Exception as e:
+        logger.warning(f"Chart unavailable for user {record.get('id')}: {e}")
+        return None
+    if backfill and record.get("id"):
+        try:
+            save_chart(str(record["id"]), blob)
+        except Exception as e:
+            logger.warning(f"Chart backfill failed for user {record.get('id')}: {e}")
+    return chart
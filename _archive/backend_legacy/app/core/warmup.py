@@ -0,0 +1,87 @@
+"""
+Startup warm-up.
+
+Heavy dependencies (Firebase Admin, Stripe, matplotlib, Pillow/cryptography,
+timezonefinder's polygon data, the Gemini SDK) are no longer imported when
+the API starts; each loads on first use. So that the first real request
+doesn't pay for them either, the lifespan hook runs warm_up() once the app
+is up. STARTUP_WARMUP selects how:
+
+- "background" (default): in a daemon thread, /health answers immediately
+- "blocking": before the app starts serving, for deployments that would
+  rather be slow to become healthy than slow on the first request
+- "off": everything loads on first use
+
+Each step is timed and logged; a failed step is logged and skipped, the
+dependency then loads (and fails) on first use as it would without warm-up.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+
+def _firebase():
+    from app.core.firebase import firestore
+    firestore.load()
+
+def _calculator():
+    from app.core.calculations import get_calculator
+    calculator = get_calculator()
+    calculator.tf
+    calculator.geolocator
+
+def _stripe():
+    from app.api.endpoints.payment import stripe
+    stripe.load()
+
+def _charts():
+    import matplotlib.pyplot
+    import app.core.pass_generator
+
+def _llm():
+    from app.core.llm_gateway import get_llm_gateway
+    get_llm_gateway()
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("firebase", _firebase),
+    ("calculator", _calculator),
+    ("stripe", _stripe),
+    ("charts", _charts),
+    ("llm", _llm),
+]
+
+_timings: Dict[str, float] = {}
+
+def warm_up(steps: List[Tuple[str, Callable[[], None]]] = WARMUP_STEPS) -> Dict[str, float]:
+    """
+    Runs every step, returns {step: seconds}. Never raises.
+    """
+    started = time.perf_counter()
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+            continue
+        _timings[name] = round(time.perf_counter() - step_started, 3)
+    logger.info(f"Warm-up done in {time.perf_counter() - started:.2f}s: {_timings}")
+    return dict(_timings)
+
+def start_warm_up(mode: str = STARTUP_WARMUP) -> Optional[threading.Thread]:
+    if mode == "off":
+        return None
+    if mode == "blocking":
+        warm_up()
+        return None
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def warm_up_timings() -> Dict[str, float]:
+    return dict(_timings)
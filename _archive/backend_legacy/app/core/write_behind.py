@@ -0,0 +1,214 @@
+"""
+Write-behind buffer for Firestore.
+
+Endpoints that only need to record something (timeline events, share
+documents) enqueue their writes and answer right away; a background thread
+commits them as WriteBatches once WRITE_BATCH_SIZE writes are waiting or
+WRITE_FLUSH_INTERVAL seconds after the oldest one arrived, whichever comes first.
+
+- Writes enqueued together (one group) always land in the same batch, so they
+  commit atomically.
+- Every write targets an explicit document ID, so retrying a failed batch
+  (exponential backoff, up to WRITE_MAX_RETRIES times) can't create duplicates.
+- The queue is bounded at WRITE_QUEUE_MAX writes; enqueue() raises
+  WriteBufferFull beyond that rather than growing without limit.
+- close() (called on API shutdown) flushes whatever is still queued.
+
+Only set() writes are buffered: an update() of a missing document would fail
+its whole batch, and everyone else's writes with it. Partial updates use
+set(merge=True) instead.
+
+The buffer works with anything exposing Firestore's client.batch() /
+batch.set() / batch.commit(), e.g. the emulator or the in-memory fake in
+tests/fake_firestore.py.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Firestore caps a batched write at 500 operations
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 500))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", 0.25))
+WRITE_QUEUE_MAX = int(os.getenv("WRITE_QUEUE_MAX", 20000))
+WRITE_MAX_RETRIES = int(os.getenv("WRITE_MAX_RETRIES", 5))
+WRITE_RETRY_BACKOFF = float(os.getenv("WRITE_RETRY_BACKOFF", 0.2))
+
+class WriteBufferFull(Exception):
+    """The write-behind queue is at capacity; the caller should retry later."""
+
+class Write(NamedTuple):
+    ref: Any # DocumentReference with an explicit ID
+    data: Dict
+    merge: bool = False
+
+class _Group(NamedTuple):
+    client: Any
+    writes: List[Write]
+    enqueued_at: float
+
+class WriteBehind:
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, flush_interval: float = WRITE_FLUSH_INTERVAL,
+                 max_queue: int = WRITE_QUEUE_MAX, max_retries: int = WRITE_MAX_RETRIES,
+                 retry_backoff: float = WRITE_RETRY_BACKOFF):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._cond = threading.Condition()
+        self._queue: Deque[_Group] = deque()
+        self._queued = 0 # writes waiting in _queue
+        self._inflight = 0 # writes taken by the flusher, not yet committed or dropped
+        self._flush_now = False
+        self._closing = False
+        self.committed = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, client, writes: List[Write]):
+        """
+        Queues writes as one group for client. Returns immediately.
+        Raises WriteBufferFull when the queue is at capacity.
+        """
+        if not writes:
+            return
+        if len(writes) > self.batch_size:
+            raise ValueError(f"A write group can hold at most {self.batch_size} writes")
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("Write-behind buffer is closed")
+            if self._queued + self._inflight + len(writes) > self.max_queue:
+                raise WriteBufferFull(f"{self._queued + self._inflight} writes pending")
+            self._queue.append(_Group(client, list(writes), time.monotonic()))
+            self._queued += len(writes)
+            self._cond.notify_all()
+
+    def _take(self) -> List[_Group]:
+        groups, count = [], 0
+        while self._queue and count + len(self._queue[0].writes) <= self.batch_size:
+            group = self._queue.popleft()
+            groups.append(group)
+            count += len(group.writes)
+        self._queued -= count
+        self._inflight += count
+        return groups
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # Wait for a full batch, the oldest write's deadline, or a flush request
+                deadline = self._queue[0].enqueued_at + self.flush_interval
+                while (self._queued < self.batch_size and not self._flush_now and not self._closing
+                       and deadline - time.monotonic() > 0):
+                    self._cond.wait(deadline - time.monotonic())
+                groups = self._take()
+            self._commit(groups)
+
+    def _commit(self, groups: List[_Group]):
+        # Consecutive groups for the same client share one batch
+        segments: List[List[_Group]] = []
+        for group in groups:
+            if segments and segments[-1][0].client is group.client:
+                segments[-1].append(group)
+            else:
+                segments.append([group])
+
+        for segment in segments:
+            writes = [w for g in segment for w in g.writes]
+            ok = self._commit_batch(segment[0].client, writes)
+            with self._cond:
+                self._inflight -= len(writes)
+                if ok:
+                    self.committed += len(writes)
+                    self.batches += 1
+                else:
+                    self.dropped += len(writes)
+                self._cond.notify_all()
+
+    def _commit_batch(self, client, writes: List[Write]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                batch = client.batch()
+                for write in writes:
+                    batch.set(write.ref, write.data, merge=write.merge)
+                batch.commit()
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    paths = [getattr(w.ref, "path", repr(w.ref)) for w in writes[:5]]
+                    logger.error(f"Dropping {len(writes)} writes after {attempt + 1} attempts ({paths}...): {e}")
+                    return False
+                self.retries += 1
+                logger.warning(f"Batch commit failed, retrying: {e}")
+                time.sleep(self.retry_backoff * (2 ** attempt))
+        return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Commits everything queued so far, without waiting for the interval.
+        Returns False if timeout ran out first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_now = True
+            self._cond.notify_all()
+            try:
+                while self._queued or self._inflight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flush_now = False
+
+    def close(self, timeout: Optional[float] = 10):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": self._queued,
+                "inflight": self._inflight,
+                "committed": self.committed,
+                "batches": self.batches,
+                "retries": self.retries,
+                "dropped": self.dropped
+            }
+
+_buffer: Optional[WriteBehind] = None
+_lock = threading.Lock()
+
+def get_write_behind() -> WriteBehind:
+    global _buffer
+    with _lock:
+        if _buffer is None:
+            _buffer = WriteBehind()
+        return _buffer
+
+def set_write_behind(buffer: Optional[WriteBehind]):
+    global _buffer
+    with _lock:
+        _buffer = buffer
+
+def close_write_behind():
+    global _buffer
+    with _lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.close()
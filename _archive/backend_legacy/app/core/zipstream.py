@@ -0,0 +1,52 @@
+import zipfile
+from typing import Optional
+
+class _ChunkSink:
+    """
+    Write-only file object for zipfile. Collects whatever the ZipFile writes
+    until the caller drains it, and reports a running offset so zipfile can
+    build the central directory without ever seeking.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class ZipStream:
+    """
+    Incremental ZIP writer for streaming responses.
+
+    Each add() returns the bytes produced for that entry, and close() returns
+    the central directory. Only the current entry is ever held in memory.
+    Usage:
+        zs = ZipStream()
+        yield zs.add("a.png", png_bytes)
+        yield zs.close()
+    """
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zf = zipfile.ZipFile(self._sink, "w", zipfile.ZIP_STORED)
+
+    def add(self, name: str, data: bytes, compress_type: Optional[int] = None) -> bytes:
+        # PNGs are already deflated, so entries are stored as-is unless the caller asks otherwise
+        self._zf.writestr(name, data, compress_type=compress_type)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zf.close()
+        return self._sink.drain()
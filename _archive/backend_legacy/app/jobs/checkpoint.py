@@ -0,0 +1,35 @@
+import os
+from typing import Iterable, Optional, Set
+
+class Checkpoint:
+    """
+    Append-only record of finished item IDs, one per line.
+    A job that restarts with the same checkpoint file skips everything listed.
+    Lines are flushed and fsynced per commit() so a crash loses at most the
+    chunk in progress.
+    """
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: Set[str] = set()
+        self._fh = None
+        if path:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    self.done = {line.strip() for line in f if line.strip()}
+            self._fh = open(path, "a", encoding="utf-8")
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.done
+
+    def commit(self, item_ids: Iterable[str]):
+        ids = [i for i in item_ids if i not in self.done]
+        self.done.update(ids)
+        if self._fh and ids:
+            self._fh.write("".join(f"{i}\n" for i in ids))
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
@@ -0,0 +1,220 @@
+"""
+Nightly "daily read" precomputation.
+
+Builds today's analysis for every user before the morning spike, so
+/api/analyze serves a stored read instead of recomputing charts, forecasts
+and narratives on demand. Per user: natal chart, 7-day forecast (transits are
+computed once per run and shared), the deterministic narrative and, when an
+LLM is configured and --llm-rate > 0, the LLM narrative at a bounded rate.
+
+Runs are resumable with --checkpoint and can be split across workers with
+--shard i/n: each worker takes the users whose ID hashes to shard i.
+
+Usage:
+    python -m app.jobs.daily_reads --source firestore --shard 0/4 --checkpoint reads-0.ckpt
+    python -m app.jobs.daily_reads --source users.ndjson --store reads/ --date 2025-01-31
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from app.core.calculations import get_calculator, ChartData, TransitDay
+from app.core.chart_store import chart_summary
+from app.core.daily_reads import open_daily_store, profile_signature
+from app.core.llm_gateway import get_llm_gateway
+from app.core.user_store import open_user_source, chart_from_record, DEFAULT_CHUNK_SIZE
+from app.jobs.checkpoint import Checkpoint
+from app.core.analysis import (
+    BioMetricProfile, DefragAnalysis, build_analysis_prompt, build_deterministic_analysis
+)
+
+logger = logging.getLogger(__name__)
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    "i/n" -> (i, n), with 0 <= i < n.
+    """
+    index, count = (int(part) for part in spec.split("/", 1))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}', expected i/n with 0 <= i < n")
+    return index, count
+
+def shard_of(user_id: str, shards: int) -> int:
+    # Stable across processes and runs, unlike hash()
+    return int(hashlib.sha1(user_id.encode()).hexdigest(), 16) % shards
+
+def profile_from_record(record: Dict) -> BioMetricProfile:
+    bio = record.get("bioMetrics") or {}
+    return BioMetricProfile(
+        userId=str(record.get("id")),
+        name=record.get("name") or "",
+        birthDate=bio.get("birthDate") or "",
+        birthTime=bio.get("birthTime") or "12:00",
+        birthLocation=bio.get("birthLocation") or "",
+        designType=bio.get("humanDesignType"),
+        enneagram=bio.get("enneagram"),
+        latitude=bio.get("latitude"),
+        longitude=bio.get("longitude")
+    )
+
+def build_read(record: Dict, transits: List[TransitDay]) -> Tuple[str, Optional[Dict], Optional[ChartData], Optional[str]]:
+    """
+    Deterministic read for one user. Runs in a worker process.
+    Returns (user_id, read, chart, error); read is None when the user has no usable birth data.
+    """
+    user_id = str(record.get("id"))
+    try:
+        chart = chart_from_record(record)
+        if chart is None:
+            return user_id, None, None, None
+        profile = profile_from_record(record)
+        forecast = [event.model_dump() for event in get_calculator().get_forecast(chart, transits=transits)]
+        read = {
+            "profile": profile_signature(profile.name, profile.birthDate, profile.birthTime, profile.birthLocation,
+                                         profile.designType, profile.enneagram, profile.latitude, profile.longitude),
+            # Lets requests that don't send coordinates match the signature
+            "coordinates": [profile.latitude, profile.longitude] if profile.latitude is not None and profile.longitude is not None else None,
+            "source": "deterministic",
+            "chart": chart_summary(chart),
+            "analysis": dict(build_deterministic_analysis(chart), forecast=forecast, audio_url=None)
+        }
+        return user_id, read, chart, None
+    except Exception as e:
+        return user_id, None, None, str(e)
+
+class RateLimiter:
+    """
+    Spaces acquisitions at least 1/rate seconds apart.
+    """
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next = max(self._next, loop.time()) + self.interval
+
+async def add_llm_narrative(read: Dict, record: Dict, chart: ChartData, gateway, limiter: RateLimiter) -> bool:
+    """
+    Replaces the deterministic analysis in read with the LLM one. On any
+    failure the deterministic read is kept. Returns whether the LLM was used.
+    """
+    await limiter.acquire()
+    try:
+        text = await gateway.generate(build_analysis_prompt(profile_from_record(record), chart), route="batch", json_mode=True)
+        analysis = read["analysis"]
+        read["analysis"] = DefragAnalysis(**dict(json.loads(text), forecast=analysis["forecast"], audio_url=None)).model_dump()
+        read["source"] = "llm"
+        return True
+    except Exception as e:
+        logger.warning(f"LLM narrative failed for {record.get('id')}, keeping deterministic read: {e}")
+        return False
+
+async def run(source, store, checkpoint: Checkpoint, day: date, shard: Tuple[int, int] = (0, 1),
+              workers: int = os.cpu_count() or 1, gateway=None, llm_rate: float = 0.0) -> Dict:
+    """
+    Writes the reads for day for every user in this shard not already in checkpoint.
+    Failed users are logged and left out of the checkpoint so a re-run retries them;
+    users without birth data are checkpointed, there is nothing to compute for them.
+    """
+    started = time.perf_counter()
+    day_key = day.isoformat()
+    shard_index, shard_count = shard
+    stats = {"written": 0, "llm": 0, "no_chart": 0, "failed": 0, "skipped": 0, "other_shards": 0}
+
+    # Same for every user: computed once and shipped to the workers
+    transits = get_calculator().get_transits(start=datetime.combine(day, datetime.min.time()))
+    job = functools.partial(build_read, transits=transits)
+    limiter = RateLimiter(llm_rate) if gateway is not None and llm_rate > 0 else None
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in source.chunks():
+            mine = [r for r in chunk if shard_of(str(r.get("id")), shard_count) == shard_index]
+            stats["other_shards"] += len(chunk) - len(mine)
+            todo = [r for r in mine if str(r.get("id")) not in checkpoint]
+            stats["skipped"] += len(mine) - len(todo)
+            if not todo:
+                continue
+
+            results = await asyncio.gather(*(loop.run_in_executor(pool, job, record) for record in todo))
+
+            reads, finished, narrations = {}, [], []
+            for record, (user_id, read, chart, error) in zip(todo, results):
+                if error:
+                    stats["failed"] += 1
+                    logger.error(f"Daily read failed for {user_id}: {error}")
+                    continue
+                finished.append(user_id)
+                if read is None:
+                    stats["no_chart"] += 1
+                    continue
+                reads[user_id] = read
+                if limiter:
+                    narrations.append(add_llm_narrative(read, record, chart, gateway, limiter))
+
+            stats["llm"] += sum(await asyncio.gather(*narrations))
+            if reads:
+                await loop.run_in_executor(None, store.put_many, day_key, reads)
+            checkpoint.commit(finished)
+            stats["written"] += len(reads)
+
+            elapsed = time.perf_counter() - started
+            logger.info(f"Wrote {stats['written']} reads ({stats['written'] / elapsed:.1f}/sec), "
+                        f"{stats['failed']} failed, {stats['skipped']} skipped")
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["reads_per_sec"] = round(stats["written"] / elapsed, 2) if elapsed else 0.0
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute today's analysis for all users.")
+    parser.add_argument("--source", default="firestore", help='"firestore" or path to a JSON/NDJSON user export')
+    parser.add_argument("--store", default="firestore", help='"firestore" or a local directory')
+    parser.add_argument("--date", default=date.today().isoformat(), help="Day to compute, YYYY-MM-DD (default: today)")
+    parser.add_argument("--shard", default="0/1", help="i/n: only process users whose ID hashes to shard i of n")
+    parser.add_argument("--checkpoint", help="Checkpoint file; re-run with the same file to resume")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--llm-rate", type=float, default=0.0,
+                        help="LLM narratives per second; 0 writes deterministic reads only")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    source = open_user_source(args.source, args.chunk_size)
+    store = open_daily_store(args.store)
+    checkpoint = Checkpoint(args.checkpoint)
+    day = date.fromisoformat(args.date)
+
+    async def job():
+        gateway = get_llm_gateway() if args.llm_rate > 0 else None
+        try:
+            return await run(source, store, checkpoint, day, parse_shard(args.shard), args.workers, gateway, args.llm_rate)
+        finally:
+            if gateway is not None:
+                await gateway.close()
+
+    try:
+        stats = asyncio.run(job())
+    finally:
+        checkpoint.close()
+    logger.info(f"Daily reads complete: {stats}")
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Recurrence score backfill.
+
+Scores every existing timeline event the way app.core.recurrence scores new
+ones, as if each had been logged in time order. One streaming pass over the
+timeline ordered by (userId, time): only the current user's window is held in
+memory, and only events whose score or shadowId changed are written back.
+
+Usage:
+    python -m app.jobs.recurrence_backfill --store firestore
+    python -m app.jobs.recurrence_backfill --store timeline.db --window-days 14 --dry-run
+"""
+import argparse
+import logging
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from app.core.recurrence import score_stream, RECURRENCE_WINDOW_DAYS
+from app.core.timeline_store import FirestoreTimelineStore, SQLiteTimelineStore
+from app.core.write_behind import get_write_behind, close_write_behind
+
+logger = logging.getLogger(__name__)
+
+# Score updates written per call
+WRITE_CHUNK = 500
+
+def open_timeline_store(spec: str):
+    """
+    "firestore" or a path to a SQLite timeline database.
+    """
+    return FirestoreTimelineStore() if spec == "firestore" else SQLiteTimelineStore(spec)
+
+def run(store, window_days: float = RECURRENCE_WINDOW_DAYS, dry_run: bool = False) -> Dict:
+    started = time.perf_counter()
+    stats = {"users": 0, "events": 0, "updated": 0}
+    user: Optional[str] = None
+    pending: List[Tuple[str, int, Optional[str]]] = []
+
+    def write():
+        if pending and not dry_run:
+            store.set_scores(user, list(pending))
+        stats["updated"] += len(pending)
+        pending.clear()
+
+    for event, score, shadow in score_stream(store.scan(), window_days):
+        if event.get("userId") != user:
+            write()
+            user = event.get("userId")
+            stats["users"] += 1
+        stats["events"] += 1
+        if event.get("recurrenceScore") != score or event.get("shadowId") != shadow:
+            pending.append((event["id"], score, shadow))
+            if len(pending) >= WRITE_CHUNK:
+                write()
+        if stats["events"] % 10000 == 0:
+            logger.info(f"Scored {stats['events']} events for {stats['users']} users, {stats['updated']} updated")
+    write()
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["events_per_sec"] = round(stats["events"] / elapsed, 2) if elapsed else 0.0
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute recurrence scores for all timeline events.")
+    parser.add_argument("--store", default="firestore", help='"firestore" or path to a SQLite timeline database')
+    parser.add_argument("--window-days", type=float, default=RECURRENCE_WINDOW_DAYS)
+    parser.add_argument("--dry-run", action="store_true", help="Count changes without writing them")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    store = open_timeline_store(args.store)
+    try:
+        stats = run(store, args.window_days, args.dry_run)
+        # Firestore updates go through the write-behind buffer
+        get_write_behind().flush()
+    finally:
+        close_write_behind()
+    logger.info(f"Recurrence backfill complete: {stats}")
+    return stats
+
+if __name__ == "__main__":
+    main()
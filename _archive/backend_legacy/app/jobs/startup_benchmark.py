@@ -0,0 +1,151 @@
+"""
+Startup benchmark.
+
+Measures a cold start in fresh interpreters, so nothing is already imported:
+
+1. import time per module, from `python -X importtime -c "import app.main"`,
+   reported as the slowest modules (cumulative, i.e. including what they
+   import) and the total per top-level package
+2. with --health, time from launching uvicorn to the first 200 from /health,
+   the number Render's health check sees
+
+Usage:
+    python -m app.jobs.startup_benchmark
+    python -m app.jobs.startup_benchmark --health --runs 3 --top 30
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for /health before giving up
+HEALTH_TIMEOUT = 30.0
+# Importing these at startup is a regression: see app.core.lazy and app.core.warmup
+HEAVY_MODULES = (
+    "firebase_admin", "google.cloud.firestore", "google.generativeai", "stripe", "matplotlib",
+    "numpy", "PIL", "cryptography", "timezonefinder", "geopy"
+)
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    `-X importtime` lines -> [{"module", "self_ms", "cumulative_ms"}] in import order.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000
+        })
+    return modules
+
+def import_profile(module: str = "app.main", top: int = 20) -> Dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}, sys; print(','.join(sorted(sys.modules)))"],
+        capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - started
+    modules = parse_importtime(result.stderr)
+    loaded = set(result.stdout.strip().splitlines()[-1].split(","))
+
+    packages = defaultdict(float)
+    for entry in modules:
+        packages[entry["module"].split(".")[0]] += entry["self_ms"]
+    target = next((m for m in modules if m["module"] == module), None)
+    return {
+        "module": module,
+        "import_ms": round(target["cumulative_ms"], 1) if target else None,
+        "process_seconds": round(wall, 3),
+        "slowest_modules": sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:top],
+        "packages_ms": {k: round(v, 1) for k, v in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]},
+        "heavy_loaded": sorted(m for m in HEAVY_MODULES if m in loaded)
+    }
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def time_to_health(app: str = "app.main:app", timeout: float = HEALTH_TIMEOUT) -> float:
+    """
+    Seconds from launching uvicorn to the first successful /health.
+    """
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=dict(os.environ)
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"/health not up after {timeout}s")
+    finally:
+        server.terminate()
+        try:
+            server.wait(5)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def run(module: str = "app.main", top: int = 20, health: bool = False, runs: int = 1) -> Dict:
+    stats = import_profile(module, top)
+    if health:
+        samples = [time_to_health() for _ in range(runs)]
+        stats["time_to_health_seconds"] = {
+            "runs": [round(s, 3) for s in samples],
+            "best": round(min(samples), 3),
+            "mean": round(sum(samples) / len(samples), 3)
+        }
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API cold start: import time per module and time to /health.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=20, help="Modules and packages to list")
+    parser.add_argument("--health", action="store_true", help="Also time uvicorn launch to first /health")
+    parser.add_argument("--runs", type=int, default=1, help="Launches to time with --health")
+    parser.add_argument("--json", action="store_true", help="Print the raw stats as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    stats = run(args.module, args.top, args.health, args.runs)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        return stats
+    print(f"import {stats['module']}: {stats['import_ms']} ms (interpreter total {stats['process_seconds']} s)")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for entry in stats["slowest_modules"]:
+        print(f"{entry['cumulative_ms']:>14.1f} {entry['self_ms']:>9.1f}  {entry['module']}")
+    print(f"\n{'self ms':>14}  package")
+    for package, ms in stats["packages_ms"].items():
+        print(f"{ms:>14.1f}  {package}")
+    if stats["heavy_loaded"]:
+        print(f"\nHeavy modules imported at startup: {', '.join(stats['heavy_loaded'])}")
+    if "time_to_health_seconds" in stats:
+        health = stats["time_to_health_seconds"]
+        print(f"\ntime to /health: best {health['best']} s, mean {health['mean']} s over {len(health['runs'])} runs")
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Bulk user import.
+
+Onboards a partner cohort from an NDJSON or CSV file through the same
+pipeline as /api/users/init, without one request per user. The file is
+streamed in chunks of --chunk-size rows, so memory stays flat whatever its
+size. Per chunk:
+
+1. rows are validated (UserInitRequest plus date/time formats)
+2. locations without coordinates are geocoded through the geocoding cache,
+   each distinct location once per chunk, and cache misses are spaced at
+   --geocode-rate requests/second (Nominatim allows 1). A location that
+   can't be geocoded is reported once, under unresolved_locations with its
+   row count, and not looked up again
+3. charts are calculated in a process pool
+4. users are written in batched store writes (Firestore batches of 500, or
+   an NDJSON file for dry runs)
+
+Rows that fail are reported with their line number (and to --errors as
+NDJSON); the rest of the file carries on. Progress and rows/sec are logged
+after every chunk.
+
+NDJSON rows are /api/users/init bodies. CSV rows are flat, one column per
+field: userId, email, name, birthDate, birthTime, birthLocation, latitude,
+longitude, humanDesignType, enneagram.
+
+Usage:
+    python -m app.jobs.user_import cohort.ndjson --target firestore --errors errors.ndjson
+    python -m app.jobs.user_import cohort.csv --target users.ndjson --workers 4
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from app.core.calculations import get_calculator
+from app.core.chart_store import compute_chart
+from app.core.geocode_cache import location_key
+from app.core.user_store import DEFAULT_CHUNK_SIZE
+from app.core.user_records import UserInitRequest, build_user_data
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_BATCH_SIZE = 500
+# Errors kept in the returned stats; all of them go to the errors file
+MAX_REPORTED_ERRORS = 100
+# Nominatim usage policy: at most 1 request/second
+GEOCODE_RATE = float(os.getenv("GEOCODE_RATE", 1.0))
+BIO_FIELDS = ("birthDate", "birthTime", "birthLocation", "latitude", "longitude", "humanDesignType", "enneagram")
+
+def read_rows(f: IO[str], fmt: str) -> Iterator[Tuple[int, object]]:
+    """
+    (line number, row dict) per row, streamed. A row that can't be parsed is
+    yielded as the exception instead.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"Invalid JSON: {e}")
+
+def row_to_request(row: Dict) -> UserInitRequest:
+    """
+    Raises ValidationError / ValueError for an unusable row.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Row is not an object")
+    if "bioMetrics" not in row:
+        # Flat CSV row: empty cells are missing values
+        row = {k: (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+        row = {k: v for k, v in row.items() if v not in ("", None)}
+        row = dict(
+            {k: v for k, v in row.items() if k not in BIO_FIELDS},
+            bioMetrics={k: row[k] for k in BIO_FIELDS if k in row}
+        )
+    request = UserInitRequest(**row)
+    bio = request.bioMetrics
+    datetime.strptime(bio.birthDate, "%Y-%m-%d")
+    if bio.birthTime:
+        datetime.strptime(bio.birthTime, "%H:%M")
+    return request
+
+def describe_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+    return str(e)
+
+def chart_row(bio: Dict, members: List[Dict]) -> Tuple[Optional[Dict], List[Dict], Optional[str]]:
+    """
+    Chart blobs for a user and their family members. Runs in a worker process;
+    locations are already resolved, so nothing here touches the network.
+    Returns (user blob, members, error).
+    """
+    try:
+        blob = compute_chart(bio)[1]
+        for member in members:
+            if member.get("birthDate"):
+                member["chart"] = compute_chart(member)[1]
+        return blob, members, None
+    except Exception as e:
+        return None, members, str(e)
+
+class RateLimiter:
+    """
+    Spaces acquisitions at least 1/rate seconds apart. The blocking
+    counterpart of app.jobs.daily_reads.RateLimiter.
+    """
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            wait = self._next - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._next = max(self._next, time.monotonic()) + self.interval
+
+def needs_coordinates(holder: Dict) -> bool:
+    return bool(holder.get("birthDate")) and (holder.get("latitude") is None or holder.get("longitude") is None)
+
+def geocode_locations(locations: List[str], limiter: Optional[RateLimiter] = None) -> Dict[str, Optional[Tuple[float, float]]]:
+    """
+    {location_key: (lat, lon) or None}, one lookup per distinct location.
+    Cache hits are free; only lookups that reach Nominatim wait on limiter.
+    """
+    resolved = {}
+    for location in locations:
+        key = location_key(location)
+        if key not in resolved:
+            resolved[key] = get_calculator().geocode(location, throttle=limiter.acquire if limiter else None)
+    return resolved
+
+def resolve_coordinates(holders: List[Dict], resolved: Dict[str, Optional[Tuple[float, float]]]) -> Optional[str]:
+    """
+    Fills in latitude/longitude from geocode_locations() results for every
+    holder with a birth date. Returns the first location that couldn't be
+    resolved, or None.
+    """
+    for holder in holders:
+        if not needs_coordinates(holder):
+            continue
+        location = holder.get("birthLocation") or ""
+        coords = resolved.get(location_key(location)) if location else None
+        if coords is None:
+            return location
+        holder["latitude"], holder["longitude"] = coords
+    return None
+
+class FirestoreUserWriter:
+    def write_many(self, users: List[Dict]):
+        # Initializes the default app on first use, in jobs outside the API process too
+        from app.core.firebase import firestore
+        db = firestore.client()
+        for start in range(0, len(users), FIRESTORE_BATCH_SIZE):
+            batch = db.batch()
+            for user in users[start:start + FIRESTORE_BATCH_SIZE]:
+                # Merge, like /api/users/init, so re-importing updates in place
+                batch.set(db.collection('users').document(user["id"]), user, merge=True)
+            batch.commit()
+
+    def close(self):
+        pass
+
+class NdjsonUserWriter:
+    def __init__(self, path: str):
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def write_many(self, users: List[Dict]):
+        self._fh.write("".join(json.dumps(user, default=str) + "\n" for user in users))
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+def open_user_writer(spec: str):
+    """
+    "firestore" or a path to an NDJSON file to append to.
+    """
+    return FirestoreUserWriter() if spec == "firestore" else NdjsonUserWriter(spec)
+
+def detect_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+def run(f: IO[str], fmt: str, writer, workers: int = os.cpu_count() or 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+        on_error: Optional[Callable[[Dict], None]] = None,
+        on_progress: Optional[Callable[[Dict], None]] = None, geocode_rate: float = GEOCODE_RATE) -> Dict:
+    started = time.perf_counter()
+    stats = {"rows": 0, "imported": 0, "failed": 0, "errors": [], "unresolved_locations": {}}
+    limiter = RateLimiter(geocode_rate)
+    # location_key -> location, for locations already known not to geocode
+    unresolved: Dict[str, str] = {}
+
+    def fail(line: int, user_id: Optional[str], error: str, report: bool = True):
+        stats["failed"] += 1
+        entry = {"line": line, "userId": user_id, "error": error}
+        if report and len(stats["errors"]) < MAX_REPORTED_ERRORS:
+            stats["errors"].append(entry)
+        if on_error:
+            on_error(entry)
+
+    rows = read_rows(f, fmt)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            stats["rows"] += len(chunk)
+
+            parsed = []
+            for line, row in chunk:
+                if isinstance(row, Exception):
+                    fail(line, None, str(row))
+                    continue
+                try:
+                    request = row_to_request(row)
+                except (ValidationError, ValueError) as e:
+                    fail(line, row.get("userId") if isinstance(row, dict) else None, describe_error(e))
+                    continue
+                bio = request.bioMetrics.model_dump()
+                members = [m.model_dump() for m in request.familyMembers or []]
+                parsed.append((line, request, bio, members))
+
+            # Geocode each distinct location of the chunk once, skipping known failures
+            locations = [holder["birthLocation"] for _, _, bio, members in parsed for holder in [bio] + members
+                         if needs_coordinates(holder) and holder.get("birthLocation")]
+            resolved = geocode_locations([loc for loc in locations if location_key(loc) not in unresolved], limiter)
+            valid = []
+            for line, request, bio, members in parsed:
+                location = resolve_coordinates([bio] + members, resolved)
+                if location is None:
+                    valid.append((line, request, bio, members))
+                    continue
+                key = location_key(location)
+                if key in unresolved:
+                    # Reported with the first row that used it
+                    stats["unresolved_locations"][unresolved[key]] += 1
+                    fail(line, request.userId, f"Could not geocode '{location}'", report=False)
+                    continue
+                if len(unresolved) < MAX_REPORTED_ERRORS:
+                    unresolved[key] = location
+                    stats["unresolved_locations"][location] = 1
+                fail(line, request.userId, f"Could not geocode '{location}'")
+            if valid:
+                results = pool.map(chart_row, [v[2] for v in valid], [v[3] for v in valid],
+                                   chunksize=max(1, len(valid) // (workers * 4)))
+                users = []
+                for (line, request, bio, _), (blob, members, error) in zip(valid, results):
+                    if error:
+                        fail(line, request.userId, f"Chart failed: {error}")
+                        continue
+                    users.append(build_user_data(request, bio, members, blob))
+                writer.write_many(users)
+                stats["imported"] += len(users)
+
+            elapsed = time.perf_counter() - started
+            if on_progress:
+                on_progress({"rows": stats["rows"], "imported": stats["imported"], "failed": stats["failed"],
+                             "rows_per_sec": round(stats["rows"] / elapsed, 2) if elapsed else 0.0})
+            logger.info(f"Imported {stats['imported']} of {stats['rows']} rows ({stats['rows'] / elapsed:.1f} rows/sec), "
+                        f"{stats['failed']} failed")
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["rows"] / elapsed, 2) if elapsed else 0.0
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import users from an NDJSON or CSV file.")
+    parser.add_argument("path", help="NDJSON (one /api/users/init body per line) or CSV file")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="Default: from the file extension")
+    parser.add_argument("--target", default="firestore", help='"firestore" or an NDJSON file to append users to')
+    parser.add_argument("--errors", help="Write failed rows here as NDJSON")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--geocode-rate", type=float, default=GEOCODE_RATE, help="Nominatim requests/second")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    writer = open_user_writer(args.target)
+    errors_fh = open(args.errors, "w", encoding="utf-8") if args.errors else None
+    on_error = (lambda entry: errors_fh.write(json.dumps(entry) + "\n")) if errors_fh else None
+    try:
+        with open(args.path, "r", encoding="utf-8", newline="") as f:
+            stats = run(f, args.format or detect_format(args.path), writer, args.workers, args.chunk_size, on_error,
+                        geocode_rate=args.geocode_rate)
+    finally:
+        writer.close()
+        if errors_fh:
+            errors_fh.close()
+    logger.info(f"User import complete: {dict(stats, errors=len(stats['errors']))}")
+    return stats
+
+if __name__ == "__main__":
+    main()
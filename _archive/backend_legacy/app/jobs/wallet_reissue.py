@@ -0,0 +1,158 @@
+"""
+Bulk Apple Wallet pass reissue.
+
+Regenerates and signs a pass for every user, e.g. after a pass redesign.
+Users are read in chunks from Firestore (or a local JSON/NDJSON export) and
+passes are built in a process pool. Finished user IDs go to a checkpoint file,
+so re-running with the same --checkpoint resumes where an interrupted run stopped.
+
+Usage:
+    python -m app.jobs.wallet_reissue --source firestore --out passes/ --checkpoint reissue.ckpt
+    python -m app.jobs.wallet_reissue --source users.ndjson --out - > passes.tar
+"""
+import argparse
+import io
+import logging
+import os
+import re
+import sys
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from app.core.pass_generator import PassGenerator
+from app.core.user_store import open_user_source, chart_from_record, DEFAULT_CHUNK_SIZE
+from app.jobs.checkpoint import Checkpoint
+
+logger = logging.getLogger(__name__)
+
+# One generator per worker process; its static assets and signer load once
+_generator = PassGenerator()
+
+def _pass_filename(user_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", user_id) + ".pkpass"
+
+def issue_pass(record: Dict) -> Tuple[str, Optional[bytes], Optional[str]]:
+    """
+    Builds one signed pass. Runs in a worker process.
+    Returns (user_id, pkpass bytes, error).
+    """
+    user_id = str(record.get("id"))
+    try:
+        bio = record.get("bioMetrics") or {}
+        bundle = _generator.generate_pass_bundle(
+            user_id, chart=chart_from_record(record), name=record.get("name"), birth_date=bio.get("birthDate")
+        )
+        return user_id, bundle.getvalue(), None
+    except Exception as e:
+        return user_id, None, str(e)
+
+class DirectoryOutput:
+    """
+    Writes <user_id>.pkpass files. Each file is renamed into place once complete,
+    so an interrupted run never leaves a truncated pass behind.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, user_id: str, data: bytes):
+        final = os.path.join(self.path, _pass_filename(user_id))
+        tmp = final + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, final)
+
+    def close(self):
+        pass
+
+class TarOutput:
+    """
+    Streams passes into an uncompressed tar (pkpass files are already zipped).
+    "-" writes to stdout. An existing archive is never overwritten: when resuming,
+    point --out at a new file and the archive will hold the remaining passes.
+    """
+    def __init__(self, target: str):
+        self._own = target != "-"
+        self._fileobj = open(target, "xb") if self._own else sys.stdout.buffer
+        self.tar = tarfile.open(fileobj=self._fileobj, mode="w|")
+
+    def write(self, user_id: str, data: bytes):
+        info = tarfile.TarInfo(_pass_filename(user_id))
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+        if self._own:
+            self._fileobj.close()
+
+def open_output(target: str):
+    if target == "-" or target.endswith(".tar"):
+        return TarOutput(target)
+    return DirectoryOutput(target)
+
+def run(source, output, checkpoint: Checkpoint, workers: int = os.cpu_count() or 1) -> Dict:
+    """
+    Issues passes for every user in source not already in checkpoint.
+    Failed users are logged and left out of the checkpoint so a re-run retries them.
+    """
+    started = time.perf_counter()
+    issued = failed = skipped = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in source.chunks():
+            todo = [record for record in chunk if str(record.get("id")) not in checkpoint]
+            skipped += len(chunk) - len(todo)
+            if not todo:
+                continue
+
+            finished = []
+            for user_id, data, error in pool.map(issue_pass, todo, chunksize=max(1, len(todo) // (workers * 4))):
+                if error:
+                    failed += 1
+                    logger.error(f"Pass issuance failed for {user_id}: {error}")
+                    continue
+                output.write(user_id, data)
+                finished.append(user_id)
+                issued += 1
+            checkpoint.commit(finished)
+
+            elapsed = time.perf_counter() - started
+            logger.info(f"Issued {issued} passes ({issued / elapsed:.1f} passes/sec), {failed} failed, {skipped} skipped")
+
+    elapsed = time.perf_counter() - started
+    return {
+        "issued": issued,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": round(elapsed, 3),
+        "passes_per_sec": round(issued / elapsed, 2) if elapsed else 0.0
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reissue Apple Wallet passes for all users.")
+    parser.add_argument("--source", default="firestore", help='"firestore" or path to a JSON/NDJSON user export')
+    parser.add_argument("--out", required=True, help="Output directory, a .tar path, or - for a tar stream on stdout")
+    parser.add_argument("--checkpoint", help="Checkpoint file; re-run with the same file to resume")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    # Logs go to stderr so a tar stream on stdout stays clean
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    source = open_user_source(args.source, args.chunk_size)
+    output = open_output(args.out)
+    checkpoint = Checkpoint(args.checkpoint)
+    try:
+        stats = run(source, output, checkpoint, args.workers)
+    finally:
+        output.close()
+        checkpoint.close()
+    logger.info(f"Reissue complete: {stats}")
+    return stats
+
+if __name__ == "__main__":
+    main()
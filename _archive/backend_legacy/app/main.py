@@ -1,12 +1,52 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from datetime import datetime
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="DEFRAG API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: build the knowledge retrieval index and the precompiled topic
+    # responses before the first request (milliseconds; heavy dependencies
+    # are left to the warm-up hook below)
+    from app.core.retrieval import get_knowledge_index
+    from app.core.knowledge_serving import get_compiled_topics
+    from app.core.share_sweeper import start_share_sweeper, stop_share_sweeper
+    from app.core.outbox import start_outbox_worker, stop_outbox_worker
+    from app.core.warmup import start_warm_up
+    get_knowledge_index()
+    get_compiled_topics()
+    # Deactivates therapist shares as they expire
+    start_share_sweeper()
+    # Delivers queued contact form messages, including any left from the last run
+    start_outbox_worker()
+    # Imports Firebase, Stripe, matplotlib etc. in the background, so neither
+    # /health nor the first request waits for them
+    start_warm_up()
+    yield
+    # Shutdown: release worker pools so the process exits cleanly
+    from app.core.mandala import shutdown_render_pool
+    from app.core.llm_gateway import close_llm_gateway
+    from app.core.audio import shutdown_audio_jobs
+    from app.core.write_behind import close_write_behind
+    from app.api.endpoints.therapist import shutdown_dashboard_pool
+    from app.api.endpoints.users import shutdown_import_jobs
+    from app.core.checkout import close_checkout_service
+    stop_share_sweeper()
+    stop_outbox_worker()
+    # Commit writes that were acknowledged but not yet flushed
+    close_write_behind()
+    shutdown_render_pool()
+    shutdown_dashboard_pool()
+    shutdown_import_jobs()
+    shutdown_audio_jobs()
+    await close_llm_gateway()
+    await close_checkout_service()
+
+app = FastAPI(title="DEFRAG API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,27 +56,18 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-
-try:
-    # Initialize Firebase Admin
-    # Use explicit credential path or default to GOOGLE_APPLICATION_CREDENTIALS
-    # For local dev without env var, we might skip or warn
-    if not firebase_admin._apps:
-        firebase_admin.initialize_app()
-    logger.info("Firebase Admin initialized successfully")
-except Exception as e:
-    logger.warning(f"Firebase Admin initialization failed: {e}")
+# Firebase Admin is initialized on first Firestore use (app.core.firebase)
+# or by the warm-up hook, not here: its import alone is a noticeable part
+# of a cold start
 
-from app.api.endpoints import analysis, therapist, users, mandala, payment, terminal
+from app.api.endpoints import analysis, therapist, users, mandala, payment, terminal, audio
 app.include_router(analysis.router, prefix="/api", tags=["analysis"])
 app.include_router(therapist.router, prefix="/api/therapist", tags=["therapist"])
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(mandala.router, prefix="/api/mandala", tags=["mandala"])
 app.include_router(payment.router, prefix="/api/payment", tags=["payment"])
-app.include_router(payment.router, prefix="/api/payment", tags=["payment"])
 app.include_router(terminal.router, prefix="/api/terminal", tags=["terminal"])
+app.include_router(audio.router, prefix="/api/audio", tags=["audio"])
 
 # Register Contact Router
 from app.api.endpoints import contact
@@ -0,0 +1,78 @@
+"""
+In-memory stand-in for the slice of the Firestore client the write-behind
+buffer uses: collection()/document() references, batch().set() and commit(),
+plus document get() for reads.
+
+Documents are kept by path. Commits can be made to fail (fail_commits) to
+exercise retries, and every commit is recorded with its size.
+"""
+import threading
+import time
+
+class FakeDocument:
+    def __init__(self, db, path: str):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, timeout=None) -> "FakeSnapshot":
+        with self._db._lock:
+            data = self._db.docs.get(self.path)
+        return FakeSnapshot(self.id, dict(data) if data is not None else None)
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+class FakeCollection:
+    def __init__(self, db, path: str):
+        self._db = db
+        self.path = path
+
+    def document(self, doc_id: str) -> FakeDocument:
+        return FakeDocument(self._db, f"{self.path}/{doc_id}")
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, ref: FakeDocument, data: dict, merge: bool = False):
+        self._writes.append((ref.path, dict(data), merge))
+
+    def commit(self):
+        self._db._commit(self._writes)
+
+class FakeFirestore:
+    def __init__(self, fail_commits: int = 0, latency: float = 0.0):
+        self.docs = {}
+        self.commits = [] # number of writes per successful commit
+        self.fail_commits = fail_commits
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def _commit(self, writes):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.fail_commits:
+                self.fail_commits -= 1
+                raise RuntimeError("Injected commit fault")
+            # All or nothing, like a real batch
+            for path, data, merge in writes:
+                self.docs[path] = dict(self.docs.get(path, {}), **data) if merge else data
+            self.commits.append(len(writes))
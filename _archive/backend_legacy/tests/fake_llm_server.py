@@ -0,0 +1,81 @@
+"""
+Local stand-in for the LLM provider, speaking the HTTPProvider protocol.
+
+Latency and errors are injected through FAULTS (or POST /faults), so the
+gateway's timeouts, concurrency limits and circuit breaker can be exercised
+without a real API key. Run standalone for manual testing:
+    uvicorn tests.fake_llm_server:app --port 8088
+    LLM_PROVIDER_URL=http://localhost:8088 uvicorn app.main:app
+"""
+import asyncio
+import json
+import random
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+app = FastAPI(title="Fake LLM")
+
+FAULTS = {"latency": 0.0, "error_rate": 0.0, "chunk_latency": 0.0}
+CHUNK_SIZE = 16
+STATS = {"requests": 0, "active": 0, "max_active": 0}
+
+FAKE_ANALYSIS = {
+    "system_status": "OPTIMAL",
+    "integrity_score": 77,
+    "headline": "Fake Signal",
+    "narrative": "Synthetic narrative from the fake LLM.",
+    "daily_lesson": {"topic": "Gate 1", "content": "Fake lesson.", "visual_symbol": "LATTICE", "knowledge_key": "MECHANICS"},
+    "protocol": "Fake protocol.",
+    "relational_geometry": {"architecture": "A", "tension_node": "B", "resolution": "C"}
+}
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    json_mode: bool = False
+
+class Faults(BaseModel):
+    latency: float = 0.0
+    error_rate: float = 0.0
+    chunk_latency: float = 0.0
+
+def reset():
+    FAULTS.update(latency=0.0, error_rate=0.0, chunk_latency=0.0)
+    STATS.update(requests=0, active=0, max_active=0)
+
+@app.post("/faults")
+async def set_faults(faults: Faults):
+    FAULTS.update(faults.model_dump())
+    return FAULTS
+
+@app.post("/generate")
+async def generate(request: GenerateRequest):
+    STATS["requests"] += 1
+    STATS["active"] += 1
+    STATS["max_active"] = max(STATS["max_active"], STATS["active"])
+    try:
+        if FAULTS["latency"]:
+            await asyncio.sleep(FAULTS["latency"])
+        if random.random() < FAULTS["error_rate"]:
+            raise HTTPException(status_code=503, detail="Injected fault")
+        text = json.dumps(FAKE_ANALYSIS) if request.json_mode else f"echo: {request.prompt[-40:]}"
+        return {"text": text}
+    finally:
+        STATS["active"] -= 1
+
+@app.post("/stream")
+async def stream(request: GenerateRequest):
+    STATS["requests"] += 1
+    if FAULTS["latency"]:
+        await asyncio.sleep(FAULTS["latency"])
+    if random.random() < FAULTS["error_rate"]:
+        raise HTTPException(status_code=503, detail="Injected fault")
+    text = json.dumps(FAKE_ANALYSIS) if request.json_mode else f"echo: {request.prompt[-40:]}"
+
+    async def chunks():
+        for i in range(0, len(text), CHUNK_SIZE):
+            if FAULTS["chunk_latency"]:
+                await asyncio.sleep(FAULTS["chunk_latency"])
+            yield json.dumps({"text": text[i:i + CHUNK_SIZE]}) + "\n"
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
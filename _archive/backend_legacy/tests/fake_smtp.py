@@ -0,0 +1,98 @@
+"""
+Local SMTP debugging server for the contact outbox.
+
+Speaks enough SMTP for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP,
+QUIT), keeps every accepted message in `messages`, and counts connections
+so tests can check that one connection is reused. Faults are injected per
+recipient through `reject` ({address: "451 ..." or "550 ..."}). Run
+standalone for manual testing:
+    python -m tests.fake_smtp 8025
+    SMTP_HOST=localhost SMTP_PORT=8025 uvicorn app.main:app
+"""
+import socketserver
+import sys
+import threading
+from email import message_from_bytes
+from typing import Dict, List
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 fake-smtp ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.reply("250-fake-smtp")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 fake-smtp")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip(" <>")
+                rejection = server.reject.get(address)
+                if rejection:
+                    self.reply(rejection)
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b".\n", b""):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                with server.lock:
+                    server.messages.append({"from": sender, "to": recipients, "message": message_from_bytes(b"".join(lines))})
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.lock = threading.Lock()
+        self.messages: List[Dict] = []
+        self.reject: Dict[str, str] = {}
+        self.connections = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeSMTPServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    server = FakeSMTPServer(int(sys.argv[1]) if len(sys.argv) > 1 else 8025)
+    print(f"Fake SMTP listening on 127.0.0.1:{server.port}")
+    server.serve_forever()
@@ -0,0 +1,57 @@
+"""
+Local stand-in for the Stripe API: Checkout Session retrieval and signed
+webhook events. Run standalone for manual testing:
+    uvicorn tests.fake_stripe:app --port 8089
+    STRIPE_API_BASE=http://localhost:8089 STRIPE_SECRET_KEY=sk_test_fake uvicorn app.main:app
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+from fastapi import FastAPI, HTTPException
+
+app = FastAPI(title="Fake Stripe")
+
+SESSIONS = {}
+STATS = {"requests": 0}
+FAULTS = {"latency": 0.0, "down": False}
+
+def reset():
+    SESSIONS.clear()
+    STATS.update(requests=0)
+    FAULTS.update(latency=0.0, down=False)
+
+def checkout_session(session_id: str, status: str = "complete", payment_status: str = "paid",
+                     email: str = "buyer@example.com", tier: str = "HELIX_PROTOCOL") -> dict:
+    return {
+        "id": session_id, "object": "checkout.session", "status": status, "payment_status": payment_status,
+        "customer_details": {"email": email}, "metadata": {"tier": tier, "user_id": "user-1"}
+    }
+
+def event(event_id: str, event_type: str, session: dict, created: int = None) -> dict:
+    return {"id": event_id, "object": "event", "type": event_type, "created": created or int(time.time()),
+            "data": {"object": session}}
+
+def sign(payload: bytes, secret: str, timestamp: int = None) -> str:
+    """
+    Stripe-Signature header for a payload, as Stripe computes it.
+    """
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def signed(body: dict, secret: str, timestamp: int = None):
+    payload = json.dumps(body).encode()
+    return payload, {"Stripe-Signature": sign(payload, secret, timestamp), "Content-Type": "application/json"}
+
+@app.get("/v1/checkout/sessions/{session_id}")
+async def retrieve_session(session_id: str):
+    STATS["requests"] += 1
+    if FAULTS["latency"]:
+        await asyncio.sleep(FAULTS["latency"])
+    if FAULTS["down"]:
+        raise HTTPException(status_code=503, detail="Injected fault")
+    if session_id not in SESSIONS:
+        raise HTTPException(status_code=404, detail="No such checkout.session")
+    return SESSIONS[session_id]
@@ -0,0 +1,29 @@
+"""
+Local stand-in for the TTS provider.
+
+Produces deterministic fake MP3 bytes (an ID3 header followed by filler
+derived from the text), with optional latency and injected failures, so the
+audio queue can be exercised without an ElevenLabs key.
+"""
+import hashlib
+import threading
+import time
+
+class FakeTTSProvider:
+    def __init__(self, latency: float = 0.0, fail: bool = False, size: int = 64 * 1024):
+        self.latency = latency
+        self.fail = fail
+        self.size = size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def synthesize(self, text: str) -> bytes:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("Injected TTS fault")
+        seed = hashlib.sha256(text.encode()).digest()
+        body = (seed * (self.size // len(seed) + 1))[:self.size - 10]
+        return b"ID3\x04\x00\x00\x00\x00\x00\x00" + body
@@ -9,7 +9,7 @@ def test_health_check():
     assert response.status_code == 200
     assert response.json()["status"] == "healthy"
 
-@patch("app.api.endpoints.analysis.get_genai_model")
+@patch("app.api.endpoints.analysis.get_llm_gateway")
 def test_analyze_endpoint_mock(mock_get_model):
     # Setup mock to return None, forcing fallback to MOCK_ANALYSIS
     mock_get_model.return_value = None
@@ -44,3 +44,74 @@ def test_analyze_endpoint_structure():
     assert "visual_symbol" in MOCK_ANALYSIS["daily_lesson"]
     # Check if mock uses valid symbol
     assert MOCK_ANALYSIS["daily_lesson"]["visual_symbol"] in ['SPIRAL', 'TUNNEL', 'LATTICE', 'WEB', 'MANDALA']
+
+@patch("app.api.endpoints.analysis.get_llm_gateway")
+def test_analyze_repeat_served_from_cache(mock_get_model):
+    from app.core.analysis_cache import analysis_cache
+    mock_get_model.return_value = None
+    analysis_cache.clear()
+
+    payload = {
+        "name": "Cache User",
+        "birthDate": "1988-08-08",
+        "birthTime": "08:08",
+        "birthLocation": "Berlin",
+        "latitude": 52.52,
+        "longitude": 13.40
+    }
+    before = client.get("/api/analyze/cache/stats").json()
+
+    first = client.post("/api/analyze", json=payload)
+    second = client.post("/api/analyze", json=dict(payload, name="  Cache   User "))
+
+    assert first.json() == second.json()
+    assert "llm;dur=" in first.headers["server-timing"]
+    assert 'cache;desc="hit"' in second.headers["server-timing"]
+    stats = client.get("/api/analyze/cache/stats").json()
+    assert stats["hits"] == before["hits"] + 1
+    assert stats["misses"] == before["misses"] + 1
+
+def test_analysis_cache_coalesces_concurrent_requests():
+    import asyncio
+    from app.core.analysis_cache import AnalysisCache, Computed
+
+    cache = AnalysisCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return Computed({"headline": "x"}, llm_seconds=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert all(r == {"headline": "x"} for r in results)
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["saved_llm_seconds"] > 0
+
+def test_cancelled_first_caller_does_not_fail_coalesced_waiters():
+    import asyncio
+    from app.core.analysis_cache import AnalysisCache, Computed
+
+    cache = AnalysisCache()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return Computed({"headline": "x"})
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0.01)
+        # The first client disconnects while the second is waiting
+        first.cancel()
+        return await second, first.cancelled()
+
+    result, first_cancelled = asyncio.run(scenario())
+    assert first_cancelled and result == {"headline": "x"}
+    assert cache.get("k") == {"headline": "x"}
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+import pytest
+from app.core.audio import AudioJobs, AudioQueueFull, AudioStore, set_audio_jobs
+from tests.fake_tts import FakeTTSProvider
+
+def test_identical_text_is_synthesized_once(tmp_path):
+    provider = FakeTTSProvider(latency=0.05)
+    jobs = AudioJobs(provider, AudioStore(str(tmp_path)), workers=4)
+    with ThreadPoolExecutor(8) as pool:
+        keys = set(pool.map(lambda _: jobs.request("same narrative"), range(16)))
+    key = keys.pop()
+    assert not keys
+    jobs.wait(key)
+    assert jobs.status(key) == "ready"
+    assert provider.calls == 1
+
+    # A fresh queue over the same store finds the file without synthesizing
+    other = AudioJobs(provider, AudioStore(str(tmp_path)))
+    assert other.request("same narrative") == key
+    assert provider.calls == 1
+    jobs.shutdown()
+    other.shutdown()
+
+def test_failed_synthesis_is_retried(tmp_path):
+    provider = FakeTTSProvider(fail=True)
+    jobs = AudioJobs(provider, AudioStore(str(tmp_path)))
+    key = jobs.request("broken")
+    jobs.wait(key)
+    assert jobs.status(key) == "failed"
+    provider.fail = False
+    jobs.request("broken")
+    jobs.wait(key)
+    assert jobs.status(key) == "ready"
+    assert provider.calls == 2
+    jobs.shutdown()
+
+@patch("app.api.endpoints.analysis.get_llm_gateway")
+def test_analysis_audio_is_shared_and_served_with_ranges(mock_gateway, tmp_path):
+    mock_gateway.return_value = None
+    provider = FakeTTSProvider(latency=0.05)
+    jobs = AudioJobs(provider, AudioStore(str(tmp_path)))
+    set_audio_jobs(jobs)
+    client = TestClient(app)
+    payload = {"birthDate": "1977-07-07", "birthTime": "07:07", "birthLocation": "Berlin",
+               "latitude": 52.52, "longitude": 13.40}
+    try:
+        # Same chart, different people: the deterministic narrative and its audio are shared
+        first = client.post("/api/analyze", json=dict(payload, name="Audio One")).json()["audio_url"]
+        second = client.post("/api/analyze", json=dict(payload, name="Audio Two")).json()["audio_url"]
+        assert first == second and first.startswith("/api/audio/")
+
+        key = first.rsplit("/", 1)[1][:-len(".mp3")]
+        jobs.wait(key)
+        assert provider.calls == 1
+
+        full = client.get(first)
+        assert full.status_code == 200 and full.headers["accept-ranges"] == "bytes"
+        partial = client.get(first, headers={"Range": "bytes=0-99"})
+        assert partial.status_code == 206
+        assert partial.content == full.content[:100]
+        assert partial.headers["content-range"] == f"bytes 0-99/{len(full.content)}"
+
+        assert client.get(f"/api/audio/{key}/status").json() == {"status": "ready"}
+        assert client.get("/api/audio/" + "0" * 64 + ".mp3").status_code == 404
+    finally:
+        set_audio_jobs(None)
+        jobs.shutdown()
+
+def test_failures_expire_and_stay_bounded(tmp_path):
+    now = [0.0]
+    provider = FakeTTSProvider(fail=True)
+    jobs = AudioJobs(provider, AudioStore(str(tmp_path)), workers=1, retry_after=60, max_failed=2,
+                     clock=lambda: now[0])
+    keys = [jobs.request(text) for text in ("a", "b", "c")]
+    for key in keys:
+        jobs.wait(key)
+    # Only the two most recent failures are remembered
+    assert jobs.stats()["failed_keys"] == 2
+    assert [jobs.status(key) for key in keys] == ["unknown", "failed", "failed"]
+
+    # Within the retry window refresh() leaves a failed key alone, after it requeues
+    provider.fail = False
+    jobs.refresh("b")
+    assert provider.calls == 3 and jobs.status(keys[1]) == "failed"
+    now[0] = 61
+    jobs.wait(jobs.refresh("b"))
+    assert provider.calls == 4 and jobs.status(keys[1]) == "ready"
+    jobs.shutdown()
+
+@patch("app.api.endpoints.analysis.get_llm_gateway")
+def test_cached_analysis_requeues_failed_audio(mock_gateway, tmp_path):
+    mock_gateway.return_value = None
+    now = [0.0]
+    provider = FakeTTSProvider(fail=True)
+    jobs = AudioJobs(provider, AudioStore(str(tmp_path)), retry_after=60, clock=lambda: now[0])
+    set_audio_jobs(jobs)
+    client = TestClient(app)
+    payload = {"name": "Audio Retry", "birthDate": "1966-06-06", "birthTime": "06:06",
+               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+    try:
+        url = client.post("/api/analyze", json=payload).json()["audio_url"]
+        key = url.rsplit("/", 1)[1][:-len(".mp3")]
+        jobs.wait(key)
+        assert client.get(url).status_code == 404
+
+        provider.fail = False
+        now[0] = 61
+        # The cache hit hands out the same URL and queues the audio again
+        assert client.post("/api/analyze", json=payload).json()["audio_url"] == url
+        jobs.wait(key)
+        assert client.get(url).status_code == 200
+    finally:
+        set_audio_jobs(None)
+        jobs.shutdown()
+
+def test_pending_syntheses_are_capped(tmp_path):
+    provider = FakeTTSProvider(latency=0.1)
+    jobs = AudioJobs(provider, AudioStore(str(tmp_path)), max_pending=1)
+    key = jobs.request("first")
+    # The same text shares the pending synthesis; a new one is turned away
+    assert jobs.request("first") == key
+    with pytest.raises(AudioQueueFull):
+        jobs.request("second")
+    jobs.wait(key)
+    jobs.wait(jobs.request("second"))
+    assert provider.calls == 2
+    jobs.shutdown()
+
+@patch("app.api.endpoints.analysis.get_llm_gateway")
+def test_analysis_answers_503_while_the_audio_queue_is_full(mock_gateway, tmp_path):
+    mock_gateway.return_value = None
+    jobs = AudioJobs(FakeTTSProvider(), AudioStore(str(tmp_path)), max_pending=0)
+    set_audio_jobs(jobs)
+    client = TestClient(app)
+    payload = {"name": "Audio Busy", "birthDate": "1955-05-05", "birthTime": "05:05",
+               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+    try:
+        busy = client.post("/api/analyze", json=payload)
+        assert busy.status_code == 503 and busy.headers["retry-after"] == "5"
+        # Nothing was cached: once the queue has room the analysis carries its audio
+        jobs.max_pending = 10
+        assert client.post("/api/analyze", json=payload).json()["audio_url"].startswith("/api/audio/")
+    finally:
+        set_audio_jobs(None)
+        jobs.shutdown()
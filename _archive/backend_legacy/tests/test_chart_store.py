@@ -0,0 +1,87 @@
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.endpoints import analysis
+from app.core.calculations import get_calculator, CHART_BODIES
+from app.core.chart_store import CHART_VERSION, compute_chart, decode_chart, resolve_birth, stored_chart
+from app.core.daily_reads import LocalDailyStore, set_daily_store
+from app.core.user_store import chart_from_record
+
+client = TestClient(app)
+
+BIO = {"birthDate": "1990-05-15", "birthTime": "14:30", "birthLocation": "New York",
+       "latitude": 40.7128, "longitude": -74.0060}
+
+def test_birth_time_is_converted_from_local_time():
+    birth = resolve_birth(BIO)
+    assert birth.tz == "America/New_York"
+    # EDT in May: UTC-4
+    assert birth.utc.isoformat() == "1990-05-15T18:30:00"
+
+def test_blob_round_trips_to_the_same_chart():
+    chart, blob = compute_chart(BIO)
+    assert blob["v"] == CHART_VERSION and len(blob["lons"]) == len(CHART_BODIES)
+    decoded = decode_chart(blob)
+    for body in CHART_BODIES:
+        original, restored = getattr(chart, body), getattr(decoded, body)
+        assert (original.gate, original.line, original.zodiac_sign, original.name) == \
+            (restored.gate, restored.line, restored.zodiac_sign, restored.name)
+
+def test_stored_chart_is_used_until_birth_data_changes():
+    _, blob = compute_chart(BIO)
+    record = {"id": "u1", "bioMetrics": dict(BIO), "chart": blob}
+    with patch.object(get_calculator(), "calculate", side_effect=AssertionError("recomputed")):
+        assert chart_from_record(record) is not None
+    assert stored_chart(dict(record, bioMetrics=dict(BIO, birthTime="09:00"))) is None
+    assert stored_chart(dict(record, chart=dict(blob, v=CHART_VERSION + 1))) is None
+    assert stored_chart(dict(record, bioMetrics=dict(BIO, latitude=34.05, longitude=-118.24))) is None
+
+def test_every_chart_path_uses_local_birth_time():
+    from datetime import datetime
+    from app.api.endpoints.mandala import MandalaCardInput, natal_point
+    expected = compute_chart(BIO)[0].moon.longitude
+    profile = get_calculator().calculate_from_profile("1990-05-15", "14:30", None, 40.7128, -74.0060)
+    card = natal_point(MandalaCardInput(user_id="u1", dt=datetime(1990, 5, 15, 14, 30), lat=40.7128, lon=-74.0060))
+    aware = natal_point(MandalaCardInput(user_id="u1", dt="1990-05-15T18:30:00+00:00", lat=40.7128, lon=-74.0060))
+    assert profile.moon.longitude == expected
+    assert card[0] == aware[0] == datetime(1990, 5, 15, 18, 30)
+
+def test_missing_chart_is_backfilled_on_read():
+    with patch("app.core.user_store.save_chart") as save:
+        chart = chart_from_record({"id": "u1", "bioMetrics": dict(BIO)}, backfill=True)
+    assert chart is not None
+    user_id, blob = save.call_args.args
+    assert user_id == "u1" and decode_chart(blob).sun.gate == chart.sun.gate
+
+@patch("app.api.endpoints.users.firestore")
+def test_init_stores_charts_for_user_and_family(mock_firestore):
+    mock_firestore.client.return_value = MagicMock()
+    response = client.post("/api/users/init", json={
+        "userId": "u1", "email": "u1@example.com", "name": "U1", "bioMetrics": BIO,
+        "familyMembers": [
+            {"id": "m1", "role": "MOTHER", "birthDate": "1960-01-02", "latitude": 52.52, "longitude": 13.40},
+            {"id": "m2", "role": "FATHER"}
+        ]
+    })
+    user = response.json()["user"]
+    assert user["chart"]["tz"] == "America/New_York"
+    assert user["familyMembers"][0]["chart"]["tz"] == "Europe/Berlin"
+    assert "chart" not in user["familyMembers"][1]
+
+def test_analyze_uses_the_stored_chart_without_geocoding(tmp_path):
+    _, blob = compute_chart(BIO)
+    record = {"id": "u1", "name": "U1", "bioMetrics": dict(BIO), "chart": blob}
+    payload = {"userId": "u1", "name": "U1", "birthDate": BIO["birthDate"], "birthTime": BIO["birthTime"],
+               "birthLocation": BIO["birthLocation"]}
+    with patch.object(analysis, "get_user_records", lambda ids: {"u1": record}), \
+         patch.object(analysis, "resolve_location", side_effect=AssertionError("geocoded")), \
+         patch.object(analysis, "get_llm_gateway", lambda: None):
+        # No precomputed read today
+        set_daily_store(LocalDailyStore(str(tmp_path)))
+        try:
+            response = client.post("/api/analyze", json=payload)
+        finally:
+            set_daily_store(None)
+    assert response.status_code == 200
+    assert "user_chart;dur=" in response.headers["server-timing"]
+    assert response.json()["headline"] == analysis.build_deterministic_analysis(decode_chart(blob))["headline"]
@@ -0,0 +1,61 @@
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.chat_context import (
+    build_chat_prompt, compact_context, CHAT_PROMPT_MAX_TOKENS, CHAT_CONTEXT_TOKENS
+)
+from app.core.llm_gateway import LLMGateway, HTTPProvider, set_llm_gateway
+from app.core.retrieval import KnowledgeIndex, estimate_tokens, get_knowledge_index
+from tests import fake_llm_server
+
+ANALYSIS = {
+    "system_status": "OPTIMAL",
+    "integrity_score": 81,
+    "headline": "The Geometry of Gate 12",
+    "narrative": "Signal " * 2000,
+    "daily_lesson": {"topic": "Gate 12", "content": "Lesson " * 500, "visual_symbol": "WEB"},
+    "protocol": "Observe Gate 12 today.",
+    "relational_geometry": {"architecture": "A", "tension_node": "B", "resolution": "C"},
+    "audio_url": "/api/audio/x.mp3",
+    "forecast": [{"date": f"2025-01-0{i}", "title": f"Event {i}"} for i in range(1, 8)],
+}
+
+def test_search_ranks_relevant_topic_first():
+    index = get_knowledge_index()
+    assert index.search("How do I integrate my shadow on the path to individuation?")[0].snippet.topic == "INDIVIDUATION"
+    assert index.search("when is the right moment, kairos or chronos?")[0].snippet.topic == "KAIROS"
+    assert index.search("zzz qqq") == []
+
+def test_index_accepts_new_topics():
+    index = KnowledgeIndex.from_topics({"SOMATIC": {"title": "Somatic Markers", "short_desc": "Body signals.",
+                                                    "deep_dive": "Damasio describes gut feelings as somatic markers."}})
+    assert index.search("gut feelings")[0].snippet.topic == "SOMATIC"
+
+def test_context_is_compacted_in_priority_order():
+    block = compact_context(ANALYSIS)
+    assert estimate_tokens(block) <= CHAT_CONTEXT_TOKENS
+    lines = block.splitlines()
+    assert lines[0] == "- headline: The Geometry of Gate 12"
+    assert "audio_url" not in block
+    assert any(line.startswith("- narrative: Signal") and line.endswith("…") for line in lines)
+    # The long narrative doesn't crowd out the forecast
+    assert "- forecast: 2025-01-01 Event 1; 2025-01-02 Event 2; 2025-01-03 Event 3" in lines
+
+def test_prompt_is_capped_for_oversized_input():
+    prompt = build_chat_prompt("Explain the spiral form constant. " * 500, dict(ANALYSIS, extra={"blob": "x" * 50000}))
+    assert prompt.tokens <= CHAT_PROMPT_MAX_TOKENS
+    assert "FORM_CONSTANTS" in prompt.topics
+    assert "Bressloff" in prompt.text
+
+def test_chat_reports_prompt_size():
+    fake_llm_server.reset()
+    set_llm_gateway(LLMGateway(HTTPProvider("http://fake-llm", transport=httpx.ASGITransport(app=fake_llm_server.app))))
+    client = TestClient(app)
+    try:
+        response = client.post("/api/terminal/chat", json={"message": "What is a mandala?", "context": ANALYSIS})
+        assert response.status_code == 200
+        assert 0 < int(response.headers["x-prompt-tokens"]) <= CHAT_PROMPT_MAX_TOKENS
+        stats = client.get("/api/terminal/chat/stats").json()
+        assert stats["requests"] >= 1 and stats["max_prompt_tokens"] <= stats["prompt_token_cap"]
+    finally:
+        set_llm_gateway(None)
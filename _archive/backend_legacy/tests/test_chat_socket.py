@@ -0,0 +1,92 @@
+import json
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.chat_sessions import ChatSessions, chat_sessions, CHAT_SESSION_PROMPT_MAX_TOKENS
+from app.core.llm_gateway import LLMGateway, HTTPProvider, set_llm_gateway
+from tests import fake_llm_server
+from tests.test_chat_context import ANALYSIS
+
+def _gateway():
+    return LLMGateway(HTTPProvider("http://fake-llm", transport=httpx.ASGITransport(app=fake_llm_server.app)))
+
+def _turn(ws, text):
+    ws.send_json({"type": "message", "text": text})
+    tokens = []
+    while True:
+        event = ws.receive_json()
+        if event["type"] == "done":
+            return tokens, event
+        tokens.append(event["text"])
+
+def test_session_streams_replies_and_keeps_history():
+    fake_llm_server.reset()
+    set_llm_gateway(_gateway())
+    client = TestClient(app)
+    try:
+        with client.websocket_connect("/api/terminal/chat/ws") as ws:
+            ws.send_json({"type": "start", "context": ANALYSIS})
+            started = ws.receive_json()
+            assert started["type"] == "session" and not started["resumed"]
+
+            tokens, done = _turn(ws, "What is a mandala?")
+            assert done["reply"] == "".join(tokens) and done["reply"].startswith("echo: ")
+            assert done["promptTokens"] <= CHAT_SESSION_PROMPT_MAX_TOKENS
+
+            tokens, second = _turn(ws, "And the shadow?")
+            assert second["reply"] == "".join(tokens)
+
+            session = chat_sessions.get(started["sessionId"])
+            assert [user for user, _ in session.history] == ["What is a mandala?", "And the shadow?"]
+            assert "INDIVIDUATION" in session.topics
+
+        # A new connection resumes the same session
+        with client.websocket_connect("/api/terminal/chat/ws") as ws:
+            ws.send_json({"type": "start", "sessionId": started["sessionId"]})
+            assert ws.receive_json()["resumed"]
+
+        # Per-turn payload is just the message; POST /chat resends the whole context
+        socket_bytes = len(json.dumps({"type": "message", "text": "And the shadow?"}))
+        post_bytes = len(json.dumps({"message": "And the shadow?", "context": ANALYSIS}))
+        assert socket_bytes * 10 < post_bytes
+    finally:
+        set_llm_gateway(None)
+
+def test_offline_and_bad_messages():
+    set_llm_gateway(None)
+    client = TestClient(app)
+    with client.websocket_connect("/api/terminal/chat/ws") as ws:
+        tokens, done = _turn(ws, "hello")
+        assert tokens == [] and done["reply"].startswith("[OFFLINE MODE]")
+        ws.send_json({"type": "bogus"})
+        assert ws.receive_json()["type"] == "error"
+        # Malformed frames are answered, not fatal
+        for frame in ("not json", "[1, 2]"):
+            ws.send_text(frame)
+            assert ws.receive_json()["type"] == "error"
+        ws.send_bytes(b"\x00")
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"type": "start", "sessionId": ["x"]})
+        assert ws.receive_json()["type"] == "session"
+
+def test_sessions_evicted_when_idle_or_over_capacity():
+    now = [0.0]
+    sessions = ChatSessions(max_sessions=2, idle_timeout=60, clock=lambda: now[0])
+    a = sessions.create()
+    b = sessions.create()
+    sessions.get(a.id)  # a is now the most recently used
+    c = sessions.create()
+    assert sessions.get(b.id) is None and sessions.get(a.id) is a and sessions.get(c.id) is c
+
+    now[0] = 120
+    assert sessions.get(a.id) is None and len(sessions) == 0
+    assert sessions.evicted == 3
+
+def test_touch_readds_an_evicted_session_within_capacity():
+    sessions = ChatSessions(max_sessions=2, idle_timeout=60, clock=lambda: 0.0)
+    a = sessions.create()
+    b = sessions.create()
+    c = sessions.create() # evicts a, whose socket is still open
+    sessions.touch(a)
+    assert len(sessions) == 2 and sessions.get(b.id) is None
+    assert sessions.get(a.id) is a and sessions.get(c.id) is c
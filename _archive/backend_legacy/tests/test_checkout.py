@@ -0,0 +1,86 @@
+import asyncio
+import time
+import httpx
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.endpoints import payment
+from app.core.checkout import CheckoutService, CheckoutStore, StripeSessionFetcher, set_checkout_service
+from tests import fake_stripe
+from tests.fake_stripe import FAULTS, SESSIONS, STATS
+
+client = TestClient(app)
+
+SECRET = "whsec_test"
+
+def _service(ttl: float = 5):
+    fetcher = StripeSessionFetcher("sk_test_fake", base_url="http://fake-stripe",
+                                   transport=httpx.ASGITransport(app=fake_stripe.app))
+    return CheckoutService(CheckoutStore(":memory:"), fetcher, ttl=ttl)
+
+def setup_function():
+    fake_stripe.reset()
+
+def teardown_function():
+    set_checkout_service(None)
+
+def test_webhook_state_is_served_without_calling_stripe():
+    set_checkout_service(_service())
+    session = fake_stripe.checkout_session("cs_1", tier="ARCHITECT_NODE")
+    payload, headers = fake_stripe.signed(fake_stripe.event("evt_1", "checkout.session.completed", session), SECRET)
+    with patch.object(payment, "STRIPE_WEBHOOK_SECRET", SECRET):
+        first = client.post("/api/payment/webhook", content=payload, headers=headers)
+        again = client.post("/api/payment/webhook", content=payload, headers=headers)
+        forged = client.post("/api/payment/webhook", content=payload,
+                             headers=dict(headers, **{"Stripe-Signature": fake_stripe.sign(payload, "whsec_other")}))
+        stale = client.post("/api/payment/webhook", content=payload,
+                            headers=dict(headers, **{"Stripe-Signature": fake_stripe.sign(payload, SECRET, int(time.time()) - 3600)}))
+
+    assert first.json() == {"received": True, "handled": True, "duplicate": False}
+    assert again.json()["duplicate"] is True
+    assert forged.status_code == 400 and stale.status_code == 400
+
+    for _ in range(3):
+        status = client.get("/api/payment/checkout-status/cs_1").json()
+    assert status == {"status": "complete", "payment_status": "paid",
+                      "customer_email": "buyer@example.com", "tier": "ARCHITECT_NODE"}
+    assert STATS["requests"] == 0
+
+def test_older_events_do_not_overwrite_newer_state():
+    store = CheckoutStore(":memory:")
+    now = int(time.time())
+    paid = fake_stripe.checkout_session("cs_2", payment_status="paid")
+    pending = fake_stripe.checkout_session("cs_2", payment_status="unpaid")
+    assert store.record_event(fake_stripe.event("evt_b", "checkout.session.async_payment_succeeded", paid, now))
+    assert store.record_event(fake_stripe.event("evt_a", "checkout.session.completed", pending, now - 60))
+    assert store.get("cs_2")["status"]["payment_status"] == "paid"
+
+def test_unknown_session_is_fetched_once_per_ttl():
+    SESSIONS["cs_3"] = fake_stripe.checkout_session("cs_3", status="open", payment_status="unpaid")
+    FAULTS["latency"] = 0.05
+    service = _service(ttl=60)
+
+    async def scenario():
+        polls = await asyncio.gather(*(service.get("cs_3") for _ in range(5)))
+        polls.append(await service.get("cs_3"))
+        return polls
+    polls = asyncio.run(scenario())
+    assert all(p["status"] == "open" for p in polls)
+    # Five concurrent polls shared a fetch; the sixth was served from the store
+    assert STATS["requests"] == 1
+
+    # Stripe down after the TTL: the stored state is still served
+    service.ttl = 0
+    FAULTS.update(latency=0.0, down=True)
+    assert asyncio.run(service.get("cs_3"))["status"] == "open"
+    assert STATS["requests"] == 2
+
+def test_unknown_session_reports_an_error():
+    set_checkout_service(_service())
+    assert "error" in client.get("/api/payment/checkout-status/cs_missing").json()
+
+def test_non_session_ids_never_reach_stripe():
+    set_checkout_service(_service())
+    for bad in ("pi_123", "cs_1..", "cs_1%3Fexpand=x", "cs_"):
+        assert client.get(f"/api/payment/checkout-status/{bad}").status_code == 400
+    assert STATS["requests"] == 0
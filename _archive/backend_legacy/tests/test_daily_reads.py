@@ -0,0 +1,79 @@
+import asyncio
+import json
+from datetime import date
+import httpx
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.daily_reads import LocalDailyStore, set_daily_store
+from app.core.llm_gateway import LLMGateway, HTTPProvider
+from app.core.user_store import LocalUserSource
+from app.jobs import daily_reads
+from app.jobs.checkpoint import Checkpoint
+from tests import fake_llm_server
+
+def _write_users(path, count):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "id": f"user_{i}",
+                "name": f"User {i}",
+                "bioMetrics": {"birthDate": f"19{80 + i}-05-0{i + 1}", "birthTime": "07:15",
+                               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+            }) + "\n")
+        # No birth data: nothing to compute, still checkpointed
+        f.write(json.dumps({"id": "user_empty", "name": "Empty"}) + "\n")
+
+def _run(users, store, ckpt, shard=(0, 1), **kwargs):
+    checkpoint = Checkpoint(str(ckpt))
+    try:
+        return asyncio.run(daily_reads.run(LocalUserSource(str(users), chunk_size=2), store, checkpoint,
+                                           date.today(), shard, workers=1, **kwargs))
+    finally:
+        checkpoint.close()
+
+def test_shards_partition_users_and_resume(tmp_path):
+    users = tmp_path / "users.ndjson"
+    _write_users(users, 4)
+    store = LocalDailyStore(str(tmp_path / "reads"))
+
+    first = _run(users, store, tmp_path / "s0.ckpt", shard=(0, 2))
+    second = _run(users, store, tmp_path / "s1.ckpt", shard=(1, 2))
+
+    assert first["written"] + second["written"] == 4
+    assert first["no_chart"] + second["no_chart"] == 1
+    files = sorted(p.name for p in (tmp_path / "reads" / date.today().isoformat()).iterdir())
+    assert files == [f"user_{i}.json" for i in range(4)]
+
+    # Re-running a shard with its checkpoint does nothing
+    again = _run(users, store, tmp_path / "s0.ckpt", shard=(0, 2))
+    assert again["written"] == 0 and again["skipped"] == first["written"] + first["no_chart"]
+
+def test_analyze_serves_precomputed_read(tmp_path):
+    users = tmp_path / "users.ndjson"
+    _write_users(users, 1)
+    store = LocalDailyStore(str(tmp_path / "reads"))
+    fake_llm_server.reset()
+    gateway = LLMGateway(HTTPProvider("http://fake-llm", transport=httpx.ASGITransport(app=fake_llm_server.app)))
+    stats = _run(users, store, tmp_path / "run.ckpt", gateway=gateway, llm_rate=100)
+    assert stats["llm"] == 1
+
+    client = TestClient(app)
+    payload = {"userId": "user_0", "name": "User 0", "birthDate": "1980-05-01", "birthTime": "07:15",
+               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+    set_daily_store(store)
+    try:
+        response = client.post("/api/analyze", json=payload)
+        assert response.headers["server-timing"] == 'store;desc="hit"'
+        assert response.json()["headline"] == "Fake Signal"
+
+        # A changed profile no longer matches the stored read
+        response = client.post("/api/analyze", json=dict(payload, birthTime="08:00"))
+        assert "store" not in response.headers["server-timing"]
+
+        # Without coordinates the read's own (geocoded) ones are assumed; other coordinates miss
+        no_coords = {k: v for k, v in payload.items() if k not in ("latitude", "longitude")}
+        assert client.post("/api/analyze", json=no_coords).headers["server-timing"] == 'store;desc="hit"'
+        response = client.post("/api/analyze", json=dict(payload, latitude=48.14, longitude=11.58))
+        assert "store" not in response.headers["server-timing"]
+    finally:
+        set_daily_store(None)
@@ -0,0 +1,38 @@
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core import knowledge_base
+from app.core.retrieval import KnowledgeIndex
+
+client = TestClient(app)
+
+def test_topic_served_precompiled_with_etag():
+    response = client.get("/api/terminal/knowledge/KAIROS")
+    assert response.status_code == 200
+    assert response.json() == {k: knowledge_base.TOPICS["KAIROS"][k] for k in ("title", "short_desc", "deep_dive")}
+    assert response.headers["cache-control"].startswith("public")
+    etag = response.headers["etag"]
+
+    repeat = client.get("/api/terminal/knowledge/KAIROS", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304 and repeat.content == b""
+    assert client.get("/api/terminal/knowledge/KAIROS", headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert client.get("/api/terminal/knowledge/NOPE").status_code == 404
+
+def test_search_matches_prefixes_and_ranks():
+    response = client.get("/api/terminal/knowledge/search", params={"q": "individ shadow"})
+    assert response.status_code == 200
+    hits = response.json()
+    assert hits[0]["key"] == "INDIVIDUATION"
+    assert all(a["score"] >= b["score"] for a, b in zip(hits, hits[1:]))
+    assert client.get("/api/terminal/knowledge/search", params={"q": "spir"}).json()[0]["key"] == "FORM_CONSTANTS"
+    assert client.get("/api/terminal/knowledge/search", params={"q": "xyzzy"}).json() == []
+    assert client.get("/api/terminal/knowledge/search").status_code == 422
+
+def test_search_scales_to_many_topics():
+    topics = {f"T{i}": {"title": f"Topic {i}", "short_desc": f"term{i} overview",
+                        "deep_dive": f"Details about term{i} and shared material."} for i in range(500)}
+    topics["TARGET"] = {"title": "Resonance Field", "short_desc": "Coherent resonance.", "deep_dive": "Resonance explained."}
+    index = KnowledgeIndex.from_topics(topics)
+    assert index.search_topics("reson")[0].topic == "TARGET"
+    assert index.prefix_terms("term49") == ["term49", "term490", "term491", "term492", "term493", "term494",
+                                            "term495", "term496", "term497", "term498", "term499"]
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.analysis_cache import analysis_cache
+from app.core.llm_gateway import (
+    LLMGateway, HTTPProvider, CircuitBreaker, LLMTimeout, LLMUnavailable, LLMError, set_llm_gateway,
+    get_llm_gateway, close_llm_gateway
+)
+from tests import fake_llm_server
+from tests.fake_llm_server import FAULTS, STATS
+
+FAKE_NARRATIVE = fake_llm_server.FAKE_ANALYSIS["narrative"]
+
+def _gateway(**kwargs):
+    provider = HTTPProvider("http://fake-llm", transport=httpx.ASGITransport(app=fake_llm_server.app))
+    return LLMGateway(provider, **kwargs)
+
+def setup_function():
+    fake_llm_server.reset()
+
+def test_generate_roundtrip():
+    async def scenario():
+        return await _gateway().generate("hello", route="chat")
+    assert asyncio.run(scenario()) == "echo: hello"
+
+def test_timeout_raises():
+    FAULTS["latency"] = 0.2
+    async def scenario():
+        await _gateway(timeout=0.05).generate("slow")
+    with pytest.raises(LLMTimeout):
+        asyncio.run(scenario())
+
+def test_route_limit_bounds_concurrency():
+    FAULTS["latency"] = 0.05
+    async def scenario():
+        gateway = _gateway(route_limits={"analyze": 2})
+        await asyncio.gather(*(gateway.generate(f"p{i}", route="analyze") for i in range(6)))
+    asyncio.run(scenario())
+    assert STATS["requests"] == 6
+    assert STATS["max_active"] == 2
+
+def test_timeout_covers_slot_wait_and_call():
+    FAULTS["latency"] = 0.15
+    async def scenario():
+        gateway = _gateway(timeout=0.2, route_limits={"analyze": 1})
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await asyncio.gather(gateway.generate("first", route="analyze"),
+                                       gateway.generate("second", route="analyze"), return_exceptions=True)
+        return results, loop.time() - started
+    (first, second), elapsed = asyncio.run(scenario())
+    assert first == "echo: first"
+    # The second call spent most of its budget waiting for the slot
+    assert isinstance(second, LLMTimeout)
+    assert elapsed < 0.3
+
+def test_breaker_opens_and_skips_provider():
+    FAULTS["error_rate"] = 1.0
+    async def scenario():
+        gateway = _gateway(breaker=CircuitBreaker(threshold=2, reset_timeout=60))
+        for _ in range(2):
+            with pytest.raises(LLMError):
+                await gateway.generate("x")
+        with pytest.raises(LLMUnavailable):
+            await gateway.generate("x")
+        return gateway
+    gateway = asyncio.run(scenario())
+    assert gateway.breaker.state == "open"
+    assert STATS["requests"] == 2
+
+def test_breaker_half_open_probe_closes_on_success():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+def test_analyze_uses_gateway_and_falls_back_when_failing():
+    client = TestClient(app)
+    payload = {"name": "Gateway User", "birthDate": "1991-02-03", "birthTime": "04:05",
+               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+    analysis_cache.clear()
+    set_llm_gateway(_gateway())
+    try:
+        assert client.post("/api/analyze", json=payload).json()["headline"] == "Fake Signal"
+
+        analysis_cache.clear()
+        FAULTS["error_rate"] = 1.0
+        data = client.post("/api/analyze", json=payload).json()
+        assert data["headline"].startswith("The Geometry of Gate")
+    finally:
+        set_llm_gateway(None)
+        analysis_cache.clear()
+
+def test_stream_yields_chunks_and_times_out_whole_stream():
+    FAULTS["chunk_latency"] = 0.02
+    async def collect(gateway):
+        return [chunk async for chunk in gateway.stream("hello", route="chat")]
+    assert "".join(asyncio.run(collect(_gateway()))) == "echo: hello"
+
+    # 11 chars in 16-char chunks is one chunk; a JSON answer is many
+    async def slow():
+        return [chunk async for chunk in _gateway(timeout=0.05).stream("x", json_mode=True)]
+    with pytest.raises(LLMTimeout):
+        asyncio.run(slow())
+
+def test_json_field_extractor_handles_split_escapes():
+    from app.core.json_stream import JSONStringFieldExtractor
+    document = '{"headline": "x", "narrative": "Line one\\nsays \\"hi\\" \\u00e9.", "protocol": "y"}'
+    extractor = JSONStringFieldExtractor("narrative")
+    out = "".join(extractor.feed(document[i:i + 3]) for i in range(0, len(document), 3))
+    assert out == 'Line one\nsays "hi" é.'
+    assert extractor.done
+
+def _sse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_analyze_stream_sends_chart_first_and_narrative_deltas():
+    client = TestClient(app)
+    payload = {"name": "Stream User", "birthDate": "1992-03-04", "birthTime": "05:06",
+               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+    analysis_cache.clear()
+    set_llm_gateway(_gateway())
+    try:
+        response = client.post("/api/analyze/stream", json=payload)
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = _sse_events(response.text)
+        names = [name for name, _ in events]
+        assert names[0] == "chart"
+        assert events[0][1]["chart"]["sun"]["gate"] >= 1
+        assert names[-1] == "analysis"
+        assert {"forecast", "audio"} <= set(names)
+        deltas = "".join(data["delta"] for name, data in events if name == "narrative")
+        assert deltas == fake_llm_server.FAKE_ANALYSIS["narrative"]
+        assert events[-1][1]["headline"] == "Fake Signal"
+
+        # Second request is served from the cache, narrative in one piece
+        cached = _sse_events(client.post("/api/analyze/stream", json=payload).text)
+        assert cached[1] == ("narrative", {"text": deltas, "replace": True})
+        assert cached[-1][1] == events[-1][1]
+
+        analysis_cache.clear()
+        FAULTS["error_rate"] = 1.0
+        fallback = _sse_events(client.post("/api/analyze/stream", json=payload).text)
+        narrative = [data for name, data in fallback if name == "narrative"]
+        assert narrative[0]["replace"] and fallback[-1][1]["headline"].startswith("The Geometry of Gate")
+    finally:
+        set_llm_gateway(None)
+        analysis_cache.clear()
+
+def test_concurrent_streams_and_analyze_share_one_llm_call():
+    payload = {"name": "Shared User", "birthDate": "1992-03-04", "birthTime": "05:06",
+               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+    FAULTS["latency"] = 0.2
+    analysis_cache.clear()
+    set_llm_gateway(_gateway())
+    before = analysis_cache.stats()
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            first = asyncio.ensure_future(http.post("/api/analyze/stream", json=payload))
+            await asyncio.sleep(0.1)
+            return await asyncio.gather(first, http.post("/api/analyze/stream", json=payload),
+                                        http.post("/api/analyze", json=payload))
+    try:
+        first, second, plain = asyncio.run(scenario())
+        stats = analysis_cache.stats()
+    finally:
+        set_llm_gateway(None)
+        analysis_cache.clear()
+
+    assert STATS["requests"] == 1
+    assert stats["misses"] - before["misses"] == 1 and stats["coalesced"] - before["coalesced"] == 2
+    streamed, joined = _sse_events(first.text), _sse_events(second.text)
+    assert joined[1] == ("narrative", {"text": FAKE_NARRATIVE, "replace": True})
+    assert streamed[-1][1] == joined[-1][1]
+    assert plain.json()["headline"] == "Fake Signal"
+
+
+def test_first_use_from_several_threads_builds_one_gateway():
+    built = []
+    def slow_provider(url):
+        built.append(url)
+        time.sleep(0.05)
+        return HTTPProvider(url)
+    asyncio.run(close_llm_gateway())
+    try:
+        with patch.dict("os.environ", {"LLM_PROVIDER_URL": "http://fake-llm"}), \
+             patch("app.core.llm_gateway.HTTPProvider", side_effect=slow_provider):
+            with ThreadPoolExecutor(8) as pool:
+                gateways = set(map(id, pool.map(lambda _: get_llm_gateway(), range(8))))
+        assert len(gateways) == 1 and len(built) == 1
+    finally:
+        asyncio.run(close_llm_gateway())
+        set_llm_gateway(None)
@@ -0,0 +1,33 @@
+import io
+import json
+import zipfile
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+def test_card_batch_streams_zip_with_manifest():
+    payload = [
+        {"user_id": "user_a", "dt": "1990-01-01T12:00:00", "lat": 40.71, "lon": -74.0},
+        # Outside the built-in ephemeris range, so the chart calculation fails for this item only
+        {"user_id": "user_b", "dt": "9999-01-01T00:00:00", "lat": 0.0, "lon": 0.0},
+        {"user_id": "user/c", "dt": "1985-06-15T08:30:00", "lat": 51.5, "lon": -0.12},
+    ]
+
+    response = client.post("/api/mandala/cards/batch", json=payload)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    zf = zipfile.ZipFile(io.BytesIO(response.content))
+    manifest = json.loads(zf.read("manifest.json"))
+    assert manifest["count"] == 3
+    statuses = {item["user_id"]: item for item in manifest["items"]}
+    assert statuses["user_a"]["status"] == "ok"
+    assert statuses["user_b"]["status"] == "error"
+    assert statuses["user/c"]["file"] == "0002_user_c.png"
+    assert zf.read(statuses["user_a"]["file"]).startswith(b"\x89PNG")
+
+def test_card_batch_rejects_empty():
+    response = client.post("/api/mandala/cards/batch", json=[])
+    assert response.status_code == 400
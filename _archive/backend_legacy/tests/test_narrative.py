@@ -0,0 +1,29 @@
+import json
+import os
+from app.core.calculations import ChartData, get_calculator
+from app.core.narrative import render_analysis, render_many, CLOSING, SHADOW, SOLAR
+from datetime import datetime
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "golden", "deterministic_analysis.json")
+
+def _cases():
+    with open(GOLDEN, encoding="utf-8") as f:
+        return json.load(f)
+
+def test_matches_golden_output_byte_for_byte():
+    # Golden file was produced by the original f-string fallback in analysis.py
+    for case in _cases():
+        chart = ChartData(**case["chart"]) if case["chart"] else None
+        rendered = render_analysis(chart)
+        assert json.dumps(rendered, ensure_ascii=False) == json.dumps(case["expected"], ensure_ascii=False)
+
+def test_render_many_matches_single_renders():
+    charts = [ChartData(**c["chart"]) if c["chart"] else None for c in _cases()]
+    assert render_many(charts) == [render_analysis(c) for c in charts]
+
+def test_solar_table_is_precompiled():
+    assert len(SOLAR) == 64 and len(CLOSING) == 6 and len(SHADOW) == 64 * 64
+    chart = get_calculator().calculate(datetime(2001, 9, 9, 9, 9), 52.52, 13.40)
+    sizes = [len(SOLAR), len(CLOSING), len(SHADOW)]
+    render_analysis(chart)
+    assert [len(SOLAR), len(CLOSING), len(SHADOW)] == sizes
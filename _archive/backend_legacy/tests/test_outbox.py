@@ -0,0 +1,130 @@
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.outbox import Outbox, OutboxWorker, SMTPConnection, set_outbox, set_outbox_worker
+from tests.fake_smtp import FakeSMTPServer
+
+client = TestClient(app)
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+def _worker(outbox, server, **kwargs):
+    return OutboxWorker(outbox, SMTPConnection("127.0.0.1", server.port, user=None, starttls=False), **kwargs)
+
+def test_submission_is_persisted_and_delivered(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    server = FakeSMTPServer().start()
+    worker = _worker(Outbox(path), server)
+    set_outbox(worker.outbox)
+    set_outbox_worker(worker)
+    try:
+        response = client.post("/api/contact/send", json={"name": "Ada", "email": "ada@example.com", "message": "Hello"})
+        assert response.json()["status"] == "success"
+        # Durable before the worker has run
+        assert Outbox(path).depth()["pending"] == 1
+
+        worker.start()
+        deadline = time.time() + 5
+        while not server.messages and time.time() < deadline:
+            time.sleep(0.02)
+        stats = client.get("/api/contact/outbox/stats").json()
+    finally:
+        worker.stop()
+        set_outbox_worker(None)
+        set_outbox(None)
+        server.stop()
+
+    [delivered] = server.messages
+    assert delivered["message"]["Reply-To"] == "ada@example.com"
+    assert "Hello" in delivered["message"].get_payload()
+    assert stats["pending"] == 0 and stats["sent"] == 1
+    assert stats["latency_seconds"]["max"] >= 0
+
+def test_batch_reuses_one_connection_with_retries_and_dead_letters():
+    server = FakeSMTPServer().start()
+    server.reject = {"later@example.com": "451 Try again later", "nobody@example.com": "550 No such user"}
+    clock = Clock()
+    outbox = Outbox(":memory:")
+    worker = _worker(outbox, server, backoff=10, max_attempts=3, clock=clock)
+    try:
+        for recipient in ["a@example.com", "later@example.com", "nobody@example.com", "b@example.com"]:
+            outbox.enqueue(recipient, "Subject", "Body")
+        clock.now = time.time()
+        assert worker.deliver_batch() == 2
+        assert outbox.depth()["pending"] == 1 and outbox.depth()["dead"] == 1
+        assert outbox.dead_letters()[0]["last_error"].startswith("SMTPRecipientsRefused")
+
+        # Not due until the backoff has passed, then 20s after the second failure
+        assert worker.deliver_batch() == 0
+        clock.now += 10
+        assert worker.deliver_batch() == 0
+        assert outbox.next_due() == clock.now + 20
+
+        server.reject.clear()
+        clock.now += 20
+        assert worker.deliver_batch() == 1
+        stats = worker.stats()
+    finally:
+        worker.connection.close()
+        server.stop()
+
+    assert sorted(m["to"][0] for m in server.messages) == ["a@example.com", "b@example.com", "later@example.com"]
+    assert stats["sent"] == 3 and stats["retried"] == 2 and stats["dead_lettered"] == 1
+    # Rejections are answered on the open session, so everything went over one connection
+    assert server.connections == 1 and stats["smtp_connections_opened"] == 1
+
+def test_unreachable_server_backs_off():
+    server = FakeSMTPServer().start()
+    port = server.port
+    server.stop()
+    clock = Clock()
+    outbox = Outbox(":memory:")
+    worker = OutboxWorker(outbox, SMTPConnection("127.0.0.1", port, user=None, starttls=False, timeout=1),
+                          backoff=5, clock=clock)
+    outbox.enqueue("a@example.com", "Subject", "Body")
+    outbox.enqueue("b@example.com", "Subject", "Body")
+    clock.now = time.time()
+    assert worker.deliver_batch() == 0
+    # Only the first message was tried; the second stays due for the next round
+    assert worker.retried == 1 and [m["recipient"] for m in outbox.claim(10, clock.now)] == ["b@example.com"]
+
+def test_claims_are_exclusive_until_the_lease_expires(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    first, second = Outbox(path), Outbox(path)
+    for i in range(4):
+        first.enqueue(f"{i}@example.com", "Subject", "Body")
+    now = time.time()
+    mine = first.claim(3, now, lease=60)
+    theirs = second.claim(3, now, lease=60)
+    assert len(mine) == 3 and len(theirs) == 1
+    assert not {m["id"] for m in mine} & {m["id"] for m in theirs}
+    assert second.claim(10, now + 59, lease=60) == []
+    second.delivered([theirs[0]["id"]])
+    # The first worker died: its leases expire and are claimed again
+    assert len(second.claim(10, now + 60, lease=60)) == 3
+
+def test_header_injection_is_stripped_and_unbuildable_messages_die_at_once():
+    server = FakeSMTPServer().start()
+    outbox = Outbox(":memory:")
+    worker = _worker(outbox, server)
+    set_outbox(outbox)
+    try:
+        response = client.post("/api/contact/send",
+                               json={"name": "Ada\r\nBcc: all@example.com", "email": "ada@example.com", "message": "Hi"})
+        assert response.json()["status"] == "success"
+        outbox.enqueue("a@example.com", "Bad\nSubject", "Body")
+        assert worker.deliver_batch() == 1
+    finally:
+        worker.connection.close()
+        set_outbox(None)
+        server.stop()
+
+    [delivered] = server.messages
+    assert delivered["message"]["Subject"] == "Contact form: Ada Bcc: all@example.com"
+    assert worker.dead == 1 and worker.retried == 0
+    assert outbox.dead_letters()[0]["attempts"] == 1
@@ -0,0 +1,72 @@
+import datetime
+import hashlib
+import io
+import json
+import zipfile
+import pytest
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs7
+from app.core import pass_generator
+from app.core.calculations import get_calculator
+from app.core.pass_generator import PassGenerator, PassSigner
+
+def _write_test_key_pair(directory):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Defrag Test Pass")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    (directory / "signerCert.pem").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    (directory / "signerKey.pem").write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()
+    ))
+
+@pytest.fixture
+def signer(tmp_path, monkeypatch):
+    # monkeypatch puts the shared signer and its loaded flag back afterwards
+    monkeypatch.setattr(pass_generator, "_signer", None)
+    monkeypatch.setattr(pass_generator, "_signer_loaded", False)
+    _write_test_key_pair(tmp_path)
+    signer = PassSigner(certs_dir=str(tmp_path))
+    pass_generator.set_pass_signer(signer)
+    return signer
+
+def test_signed_bundle_manifest_matches_contents(signer):
+    bundle = PassGenerator().generate_pass_bundle("user_123456789")
+
+    zf = zipfile.ZipFile(bundle)
+    manifest = json.loads(zf.read("manifest.json"))
+
+    for scale_suffix in ("", "@2x", "@3x"):
+        assert f"strip{scale_suffix}.png" in manifest
+    for name, digest in manifest.items():
+        assert hashlib.sha1(zf.read(name)).hexdigest() == digest
+    assert zf.getinfo("strip@3x.png").compress_type == zipfile.ZIP_STORED
+
+    certs = pkcs7.load_der_pkcs7_certificates(zf.read("signature"))
+    assert certs[0].subject.rfc4514_string() == "CN=Defrag Test Pass"
+
+def test_static_assets_encoded_once():
+    generator = PassGenerator()
+    assert generator.static_assets() is PassGenerator().static_assets()
+
+def test_personalized_pass_uses_chart():
+    chart = get_calculator().calculate(datetime.datetime(1990, 1, 1, 12, 0), 40.71, -74.0)
+    bundle = PassGenerator().generate_pass_bundle("user_123456789", chart=chart, name="Ada", birth_date="1990-01-01")
+
+    zf = zipfile.ZipFile(bundle)
+    pass_json = json.loads(zf.read("pass.json"))
+    fields = {f["key"]: f["value"] for f in pass_json["storeCard"]["secondaryFields"]}
+    assert fields["sun"] == f"{chart.sun.gate}.{chart.sun.line} {chart.sun.zodiac_sign}"
+    # Personalized strip replaces the generic one, and is cached by chart hash
+    assert zf.read("strip.png") != PassGenerator().static_assets()["strip.png"].data
+    assert PassGenerator().chart_strip_assets(chart) is PassGenerator().chart_strip_assets(chart)
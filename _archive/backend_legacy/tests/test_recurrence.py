@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.recurrence import RecurrenceEngine, score_stream, set_recurrence_engine, timeline_loader
+from app.core.timeline_store import SQLiteTimelineStore, TimelineQuery, set_timeline_store
+from app.jobs import recurrence_backfill
+
+BASE = datetime(2025, 3, 1, 9, 0)
+
+def _event(day, labels=("Projection",), type="RELATIONAL", user="u1"):
+    return {"userId": user, "type": type, "labels": list(labels), "narrative": f"day {day}",
+            "timestamp": (BASE + timedelta(days=day)).isoformat()}
+
+def test_scores_grow_with_repetition_and_name_the_shadow():
+    engine = RecurrenceEngine(window_days=30)
+    scored = [engine.observe("u1", _event(day)) for day in range(5)]
+    scores = [e["recurrenceScore"] for e in scored]
+    assert scores[0] == 0
+    assert scores == sorted(scores) and scores[-1] > scores[1]
+    assert scored[1]["shadowId"] is None
+    assert scored[4]["shadowId"] == "label:projection"
+    # A new label under the same transit is scored lower than a repeated one
+    fresh = engine.observe("u1", dict(_event(4), labels=["Joy"], type="SYNC"))
+    assert fresh["recurrenceScore"] < scores[-1]
+
+def test_window_expires_old_events():
+    engine = RecurrenceEngine(window_days=7)
+    for day in range(3):
+        engine.observe("u1", _event(day))
+    late = engine.observe("u1", _event(40))
+    assert late["recurrenceScore"] == 0 and late["shadowId"] is None
+
+def test_incremental_matches_single_pass_backfill():
+    events = [_event(d, labels=["Projection"] if d % 2 else ["Tension"]) for d in range(20)]
+    engine = RecurrenceEngine(window_days=10)
+    live = [(e["recurrenceScore"], e["shadowId"]) for e in (engine.observe("u1", ev) for ev in events)]
+    assert [(s, sh) for _, s, sh in score_stream(events, window_days=10)] == live
+
+def test_cold_user_is_warmed_from_the_timeline():
+    store = SQLiteTimelineStore()
+    store.add_many("u1", [_event(d) for d in range(4)])
+    set_timeline_store(store)
+    try:
+        engine = RecurrenceEngine(window_days=3650, loader=timeline_loader)
+        warm = engine.observe("u1", _event(5))
+        cold = RecurrenceEngine(window_days=3650).observe("u1", _event(5))
+        assert warm["recurrenceScore"] > cold["recurrenceScore"] == 0
+    finally:
+        set_timeline_store(None)
+
+def test_log_endpoint_scores_and_backfill_rescores():
+    store = SQLiteTimelineStore()
+    set_timeline_store(store)
+    set_recurrence_engine(RecurrenceEngine(window_days=3650))
+    try:
+        client = TestClient(app)
+        for day in range(4):
+            logged = client.post("/api/terminal/timeline/log", json=dict(_event(day), userId="api_user")).json()
+        assert logged["event"]["recurrenceScore"] > 0
+        assert logged["event"]["shadowId"] == "label:projection"
+
+        # Imported history arrives unscored; the backfill scores it in one pass
+        store.add_many("imported", [_event(d, user="imported") for d in range(6)])
+        stats = recurrence_backfill.run(store, window_days=3650)
+        assert stats["users"] == 2 and stats["events"] == 10
+        assert stats["updated"] == 5 # the API-logged events were already right
+        imported = store.query("imported", TimelineQuery()).events
+        assert imported[0]["shadowId"] == "label:projection" and imported[0]["recurrenceScore"] > 0
+        assert recurrence_backfill.run(store, window_days=3650)["updated"] == 0
+    finally:
+        set_timeline_store(None)
+        set_recurrence_engine(None)
+
+def test_rejected_event_is_not_counted_twice_on_retry():
+    from unittest.mock import patch
+    from app.core.write_behind import WriteBufferFull
+    store = SQLiteTimelineStore()
+    set_timeline_store(store)
+    set_recurrence_engine(RecurrenceEngine(window_days=3650))
+    try:
+        client = TestClient(app)
+        for day in range(2):
+            client.post("/api/terminal/timeline/log", json=dict(_event(day), userId="u1"))
+        with patch.object(store, "add", side_effect=WriteBufferFull()):
+            busy = client.post("/api/terminal/timeline/log", json=dict(_event(2), userId="u1"))
+        assert busy.status_code == 503
+        retried = client.post("/api/terminal/timeline/log", json=dict(_event(2), userId="u1")).json()["event"]
+    finally:
+        set_timeline_store(None)
+        set_recurrence_engine(None)
+    expected = RecurrenceEngine(window_days=3650)
+    for day in range(2):
+        expected.observe("u1", _event(day))
+    assert retried["recurrenceScore"] == expected.observe("u1", _event(2))["recurrenceScore"]
+
+def test_backfill_waits_for_a_full_write_buffer():
+    from unittest.mock import patch
+    from app.core.timeline_store import FirestoreTimelineStore
+    from app.core.write_behind import WriteBehind, set_write_behind
+    from tests.fake_firestore import FakeFirestore
+    db = FakeFirestore()
+    buffer = WriteBehind(batch_size=5, flush_interval=60, max_queue=10)
+    set_write_behind(buffer)
+    try:
+        with patch("app.core.firebase.firestore") as mock_firestore:
+            mock_firestore.client.return_value = db
+            FirestoreTimelineStore().set_scores("u1", [(f"e{i}", 3, None) for i in range(23)])
+        assert buffer.flush(timeout=5)
+    finally:
+        set_write_behind(None)
+        buffer.close()
+    assert len([path for path in db.docs if path.startswith("users/u1/timeline/")]) == 23
@@ -0,0 +1,64 @@
+import time
+from app.core.share_sweeper import ShareSweeper
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_sweeps_only_due_shares_and_reports_lag():
+    clock = Clock(1000.0)
+    store = [(990.0, "overdue", "u1"), (1010.0, "soon", "u2"), (1030.0, "later", "u3"), (9000.0, "far", "u4")]
+    queries, deactivated = [], []
+
+    def loader(until):
+        queries.append(until)
+        return [s for s in store if s[0] <= until]
+
+    sweeper = ShareSweeper(loader=loader, deactivate=lambda due, now: deactivated.append([s[1] for s in due]),
+                           horizon=60, clock=clock)
+    sweeper.refill()
+    assert sweeper.stats()["pending"] == 3 # "far" is outside the horizon
+
+    assert sweeper.sweep() == 1
+    assert deactivated == [["overdue"]] and sweeper.stats()["last_lag_seconds"] == 10.0
+    assert sweeper.sweep() == 0
+
+    clock.now = 1031.0
+    sweeper.schedule("new", "u5", 1020.0)
+    sweeper.schedule("beyond", "u6", 5000.0) # left for a later refill
+    assert sweeper.sweep() == 3
+    assert deactivated[-1] == ["soon", "new", "later"]
+    assert sweeper.stats()["pending"] == 0 and sweeper.stats()["swept"] == 4
+
+def test_failed_deactivation_is_retried():
+    clock = Clock(100.0)
+    calls = []
+
+    def deactivate(due, now):
+        calls.append(len(due))
+        if len(calls) == 1:
+            raise RuntimeError("firestore down")
+
+    sweeper = ShareSweeper(loader=lambda until: [(50.0, "s1", "u1")], deactivate=deactivate, clock=clock)
+    sweeper.refill()
+    assert sweeper.sweep() == 0
+    assert sweeper.sweep() == 1
+    assert calls == [1, 1]
+
+def test_background_thread_wakes_at_expiry():
+    deactivated = []
+    sweeper = ShareSweeper(loader=lambda until: [], deactivate=lambda due, now: deactivated.extend(due), horizon=60)
+    sweeper.start()
+    try:
+        deadline = time.monotonic() + 5
+        while sweeper._covered_until == float("-inf") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sweeper.schedule("s1", "u1", time.time() + 0.1)
+        while not deactivated and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [s[1] for s in deactivated] == ["s1"]
+    finally:
+        sweeper.stop()
@@ -0,0 +1,50 @@
+import asyncio
+import time
+import pytest
+from app.core.stage_graph import Stage, StageGraph, server_timing
+
+def test_independent_stages_overlap():
+    async def slow(**_):
+        await asyncio.sleep(0.1)
+        return 1
+
+    async def total(a, b):
+        return a + b
+
+    graph = StageGraph([
+        Stage("a", slow),
+        Stage("b", slow),
+        Stage("sum", total, deps=["a", "b"]),
+    ])
+    started = time.perf_counter()
+    results = asyncio.run(graph.run())
+
+    assert results["sum"].value == 2
+    assert time.perf_counter() - started < 0.18
+
+def test_timeout_and_error_use_fallback():
+    async def hang():
+        await asyncio.sleep(1)
+
+    async def boom():
+        raise RuntimeError("nope")
+
+    async def downstream(slow, broken):
+        return (slow, broken)
+
+    results = asyncio.run(StageGraph([
+        Stage("slow", hang, timeout=0.01, fallback="late"),
+        Stage("broken", boom, fallback="fixed"),
+        Stage("downstream", downstream, deps=["slow", "broken"]),
+    ]).run())
+
+    assert results["downstream"].value == ("late", "fixed")
+    assert results["slow"].status == "timeout"
+    assert results["broken"].status == "error"
+    assert 'slow;dur=' in server_timing(results) and 'desc="timeout"' in server_timing(results)
+
+def test_cycle_rejected():
+    async def noop(**_):
+        return None
+    with pytest.raises(ValueError):
+        StageGraph([Stage("a", noop, deps=["b"]), Stage("b", noop, deps=["a"])])
@@ -0,0 +1,34 @@
+from app.core.lazy import LazyModule
+from app.core.warmup import warm_up
+from app.jobs.startup_benchmark import import_profile, parse_importtime
+
+def test_app_import_leaves_heavy_dependencies_for_later():
+    profile = import_profile("app.main", top=5)
+    assert profile["heavy_loaded"] == []
+    assert profile["slowest_modules"][0]["cumulative_ms"] >= profile["slowest_modules"][-1]["cumulative_ms"]
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     json.decoder\n"
+        "import time:       300 |        420 |   json\n"
+        "Traceback noise\n"
+    )
+    assert parse_importtime(stderr) == [
+        {"module": "json.decoder", "self_ms": 0.12, "cumulative_ms": 0.12},
+        {"module": "json", "self_ms": 0.3, "cumulative_ms": 0.42},
+    ]
+
+def test_lazy_module_loads_once_on_first_use():
+    loads = []
+    lazy = LazyModule("colorsys", on_load=loads.append)
+    assert not lazy.loaded and loads == []
+    assert lazy.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1)
+    lazy.ONE_THIRD
+    assert lazy.loaded and [m.__name__ for m in loads] == ["colorsys"]
+
+def test_warm_up_skips_failed_steps():
+    def broken():
+        raise ImportError("missing optional dependency")
+    timings = warm_up([("broken", broken), ("fine", lambda: None)])
+    assert "broken" not in timings and "fine" in timings
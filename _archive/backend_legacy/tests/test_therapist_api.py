@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 from app.main import app
 from unittest.mock import patch, MagicMock
+from tests.fake_firestore import FakeFirestore
 
 client = TestClient(app)
 
@@ -29,8 +30,11 @@ def test_share_endpoint(mock_firestore):
 
 @patch("app.api.endpoints.therapist.firestore")
 def test_revoke_endpoint(mock_firestore):
-    mock_db = MagicMock()
-    mock_firestore.client.return_value = mock_db
+    from app.core.write_behind import get_write_behind
+    db = FakeFirestore()
+    db.docs["therapist_shares/share_123"] = {"user_id": "test_user_123", "active": True}
+    db.docs["users/test_user_123/shares/share_123"] = {"user_id": "test_user_123", "active": True}
+    mock_firestore.client.return_value = db
 
     payload = {
         "user_id": "test_user_123",
@@ -41,3 +45,33 @@ def test_revoke_endpoint(mock_firestore):
 
     assert response.status_code == 200
     assert response.json()["status"] == "success"
+
+    # Unknown shares, or someone else's, are not written
+    assert client.post("/api/therapist/revoke", json={"user_id": "test_user_123", "share_id": "nope"}).status_code == 404
+    assert client.post("/api/therapist/revoke", json={"user_id": "someone_else", "share_id": "share_123"}).status_code == 404
+    assert get_write_behind().flush(timeout=5)
+    assert sorted(db.docs) == ["therapist_shares/share_123", "users/test_user_123/shares/share_123"]
+    assert db.docs["therapist_shares/share_123"]["active"] is False
+
+def test_share_token_grants_access_until_revoked():
+    from app.core.share_tokens import RevocationCache, set_revocations
+    set_revocations(RevocationCache())
+    try:
+        with patch("app.api.endpoints.therapist.firestore") as mock_firestore:
+            mock_firestore.client.return_value = FakeFirestore()
+            share = client.post("/api/therapist/share", json={
+                "user_id": "test_user_123", "therapist_email": "doctor@example.com", "access_type": "read_write"
+            }).json()
+            access = client.get("/api/therapist/access", headers={"X-Share-Token": share["token"]})
+            assert access.status_code == 200
+            assert access.json()["user_id"] == "test_user_123"
+            assert access.json()["access_type"] == "read_write"
+
+            tampered = share["token"][:-2] + ("AA" if not share["token"].endswith("AA") else "BB")
+            assert client.get("/api/therapist/access", params={"token": tampered}).status_code == 401
+            assert client.get("/api/therapist/access").status_code == 401
+
+            client.post("/api/therapist/revoke", json={"user_id": "test_user_123", "share_id": share["share_id"]})
+            assert client.get("/api/therapist/access", params={"token": share["token"]}).status_code == 403
+    finally:
+        set_revocations(None)
@@ -0,0 +1,127 @@
+import time
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock, patch
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.endpoints import therapist
+from app.core.daily_reads import LocalDailyStore, set_daily_store
+from app.core.timeline_store import SQLiteTimelineStore, set_timeline_store
+
+client = TestClient(app)
+
+FETCH_LATENCY = 0.2
+AUTH = {"Authorization": "Bearer id-token"}
+
+@pytest.fixture(autouse=True)
+def firebase_auth():
+    auth = MagicMock()
+    auth.verify_id_token.return_value = {"email": "doctor@example.com", "email_verified": True}
+    with patch.object(therapist, "auth", auth):
+        yield auth
+
+def _shares(count):
+    expires = datetime.utcnow() + timedelta(days=30)
+    return [{"user_id": f"client{i}", "share_id": f"share{i}", "access_type": "read_only", "expires_at": expires}
+            for i in range(count)]
+
+def _records(user_ids, timeout=None):
+    time.sleep(FETCH_LATENCY)
+    return {uid: {"id": uid, "name": uid.title(), "bioMetrics": {
+        "birthDate": "1990-05-15", "birthTime": "14:30", "latitude": 40.7, "longitude": -74.0
+    }} for uid in user_ids}
+
+class SlowTimeline(SQLiteTimelineStore):
+    def query(self, user_id, q, timeout=None):
+        if user_id == "client3":
+            # Like a Firestore call past its deadline: gives up after `timeout`
+            time.sleep(timeout)
+            raise TimeoutError("Deadline Exceeded")
+        time.sleep(FETCH_LATENCY)
+        return super().query(user_id, q)
+
+def test_dashboard_fans_out_in_parallel_and_returns_partial_results(tmp_path):
+    reads = LocalDailyStore(str(tmp_path))
+    reads.put_many(date.today().isoformat(), {"client0": {"analysis": {"headline": "today"}, "chart": {"sun": {"gate": 1}}}})
+    reads.put_many((date.today() - timedelta(days=1)).isoformat(), {"client1": {"analysis": {"headline": "yesterday"}}})
+    timeline = SlowTimeline()
+    timeline.add("client2", {"type": "SYNC", "narrative": "hello"})
+    set_daily_store(reads)
+    set_timeline_store(timeline)
+    try:
+        with patch.object(therapist, "load_active_shares", lambda email, timeout=None: _shares(50)), \
+             patch.object(therapist, "get_user_records", _records), \
+             patch.object(therapist, "DASHBOARD_FETCH_TIMEOUT", 1.0), \
+             patch("app.core.user_store.save_chart"):
+            started = time.perf_counter()
+            response = client.get("/api/therapist/dashboard", headers=AUTH)
+            elapsed = time.perf_counter() - started
+        assert response.status_code == 200
+        body = response.json()
+        clients = {c["user_id"]: c for c in body["clients"]}
+        assert len(clients) == 50
+
+        # 50 timeline reads at 0.2s each, in about the time of one timeout
+        assert elapsed < 3.0
+        assert body["partial"] and clients["client3"]["errors"] == ["timeline"]
+        assert clients["client3"]["name"] == "Client3"
+
+        assert clients["client0"]["analysis"]["headline"] == "today"
+        assert clients["client0"]["chart"] == {"sun": {"gate": 1}}
+        assert clients["client1"]["analysis_date"] == (date.today() - timedelta(days=1)).isoformat()
+        # No stored read: the chart summary is calculated from the profile
+        assert clients["client1"]["chart"]["sun"]["gate"] > 0
+        assert clients["client4"]["analysis"] is None and clients["client4"]["errors"] == []
+        assert [e["narrative"] for e in clients["client2"]["timeline"]] == ["hello"]
+    finally:
+        set_daily_store(None)
+        set_timeline_store(None)
+
+def test_slow_chart_is_bounded_and_starts_with_the_batched_reads(tmp_path):
+    set_daily_store(LocalDailyStore(str(tmp_path)))
+    set_timeline_store(SlowTimeline())
+    real_load_chart = therapist.load_chart
+
+    def load_chart(record):
+        if record["id"] == "client1":
+            time.sleep(1.5) # e.g. a geocode that hangs
+            return None
+        return real_load_chart(record)
+    try:
+        with patch.object(therapist, "load_active_shares", lambda email, timeout=None: _shares(3)), \
+             patch.object(therapist, "get_user_records", _records), \
+             patch.object(therapist, "load_chart", load_chart), \
+             patch.object(therapist, "DASHBOARD_FETCH_TIMEOUT", 0.5), \
+             patch("app.core.user_store.save_chart"):
+            started = time.perf_counter()
+            body = client.get("/api/therapist/dashboard", headers=AUTH).json()
+            elapsed = time.perf_counter() - started
+        clients = {c["user_id"]: c for c in body["clients"]}
+        # Profiles (0.2s) then charts (capped at 0.5s), alongside the 0.2s timelines
+        assert elapsed < 1.2
+        assert body["partial"] and clients["client1"]["errors"] == ["chart"]
+        assert clients["client0"]["chart"]["sun"]["gate"] > 0 and clients["client0"]["errors"] == []
+    finally:
+        set_daily_store(None)
+        set_timeline_store(None)
+
+def test_dashboard_without_shares_store_is_unavailable():
+    def fail(email, timeout=None):
+        raise RuntimeError("firestore down")
+    with patch.object(therapist, "load_active_shares", fail):
+        response = client.get("/api/therapist/dashboard", headers=AUTH)
+    assert response.status_code == 503
+
+def test_dashboard_requires_a_verified_clinician(firebase_auth):
+    shares = MagicMock(return_value=[])
+    with patch.object(therapist, "load_active_shares", shares):
+        assert client.get("/api/therapist/dashboard", params={"therapist_email": "doctor@example.com"}).status_code == 401
+        firebase_auth.verify_id_token.side_effect = ValueError("expired")
+        assert client.get("/api/therapist/dashboard", headers=AUTH).status_code == 401
+        firebase_auth.verify_id_token.side_effect = None
+        firebase_auth.verify_id_token.return_value = {"email": "doctor@example.com", "email_verified": False}
+        assert client.get("/api/therapist/dashboard", headers=AUTH).status_code == 403
+        firebase_auth.verify_id_token.return_value = {"email": "doctor@example.com", "email_verified": True}
+        assert client.get("/api/therapist/dashboard", headers=AUTH).json()["therapist_email"] == "doctor@example.com"
+    # Shares are looked up for the verified email only
+    assert shares.call_args.args == ("doctor@example.com",)
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.timeline_store import SQLiteTimelineStore, TimelineQuery, set_timeline_store
+
+BASE = datetime(2025, 1, 1, 12, 0)
+
+def _seed(store, user="u1", count=25):
+    store.add_many(user, [{
+        "type": ["SYNC", "SOMATIC", "RELATIONAL"][i % 3],
+        "narrative": f"event {i}",
+        "labels": ["Shadow"] if i % 5 == 0 else [],
+        "timestamp": (BASE + timedelta(hours=i)).isoformat()
+    } for i in range(count)])
+
+def test_cursor_pages_cover_everything_once_newest_first():
+    store = SQLiteTimelineStore()
+    _seed(store)
+    _seed(store, user="other", count=3)
+    seen, cursor = [], None
+    while True:
+        page = store.query("u1", TimelineQuery(limit=10, cursor=cursor))
+        assert len(page.events) <= 10
+        seen.extend(page.events)
+        cursor = page.next_cursor
+        if not cursor:
+            break
+    assert [e["narrative"] for e in seen] == [f"event {i}" for i in reversed(range(25))]
+
+def test_range_type_and_label_filters():
+    store = SQLiteTimelineStore()
+    _seed(store)
+    q = TimelineQuery(start=(BASE + timedelta(hours=5)).isoformat() + "Z",
+                      end=(BASE + timedelta(hours=10)).isoformat() + "+00:00")
+    assert [e["narrative"] for e in store.query("u1", q).events] == [f"event {i}" for i in (9, 8, 7, 6, 5)]
+    assert {e["type"] for e in store.query("u1", TimelineQuery(types=["SYNC"])).events} == {"SYNC"}
+    assert [e["narrative"] for e in store.query("u1", TimelineQuery(label="Shadow")).events] == \
+        ["event 20", "event 15", "event 10", "event 5", "event 0"]
+    with pytest.raises(ValueError):
+        store.query("u1", TimelineQuery(cursor="garbage"))
+
+def test_timeline_endpoints_use_store():
+    store = SQLiteTimelineStore()
+    set_timeline_store(store)
+    client = TestClient(app)
+    try:
+        for i in range(3):
+            logged = client.post("/api/terminal/timeline/log", json={
+                "userId": "api_user", "type": "SYNC", "narrative": f"n{i}", "labels": ["Gate 51"],
+                "timestamp": (BASE + timedelta(minutes=i)).isoformat()
+            }).json()
+            assert logged["status"] == "success"
+
+        first = client.get("/api/terminal/timeline/api_user", params={"limit": 2})
+        assert [e["narrative"] for e in first.json()] == ["n2", "n1"]
+        cursor = first.headers["x-next-cursor"]
+        rest = client.get("/api/terminal/timeline/api_user", params={"limit": 2, "cursor": cursor})
+        assert [e["narrative"] for e in rest.json()] == ["n0"]
+        assert "x-next-cursor" not in rest.headers
+        assert client.get("/api/terminal/timeline/api_user", params={"cursor": "bad"}).status_code == 400
+        assert client.get("/api/terminal/timeline/api_user", params={"limit": 1000}).status_code == 422
+    finally:
+        set_timeline_store(None)
@@ -0,0 +1,179 @@
+import asyncio
+import io
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.endpoints import users as users_api
+from app.api.endpoints.users import set_import_jobs
+from app.core.background_jobs import BackgroundJobs
+from app.core.calculations import get_calculator
+from app.core.chart_store import CHART_VERSION
+from app.core.geocode_cache import GeocodeCache, set_geocode_cache
+from app.jobs import user_import
+from app.jobs.user_import import NdjsonUserWriter, run
+
+def user(user_id, **bio):
+    return {"userId": user_id, "email": f"{user_id}@example.com", "name": user_id,
+            "bioMetrics": dict({"birthDate": "1990-05-15", "birthTime": "14:30"}, **bio)}
+
+def read_users(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_ndjson_import_reports_bad_rows_and_keeps_going(tmp_path):
+    cache = GeocodeCache()
+    cache.put("New York", 40.7128, -74.0060)
+    set_geocode_cache(cache)
+    lines = [
+        json.dumps(user("u1", birthLocation="Berlin", latitude=52.52, longitude=13.40)),
+        json.dumps(user("u2", birthLocation="new york")), # cached, no network
+        "{not json",
+        json.dumps(user("u3", birthDate="15/05/1990", birthLocation="Berlin", latitude=1.0, longitude=1.0)),
+        json.dumps({"userId": "u4"}),
+        "",
+        json.dumps(user("u5", birthLocation="Nowhere at all")),
+    ]
+    out = tmp_path / "users.ndjson"
+    writer = NdjsonUserWriter(str(out))
+    try:
+        with patch.object(get_calculator().geolocator, "geocode", return_value=None) as geocode:
+            stats = run(io.StringIO("\n".join(lines)), "ndjson", writer, workers=1, chunk_size=3)
+    finally:
+        writer.close()
+        set_geocode_cache(None)
+
+    # Only the uncached location went to the geocoder
+    geocode.assert_called_once_with("Nowhere at all")
+    assert stats["rows"] == 6 and stats["imported"] == 2 and stats["failed"] == 4
+    assert [e["line"] for e in stats["errors"]] == [3, 4, 5, 7]
+    assert stats["errors"][1]["userId"] == "u3"
+    assert "bioMetrics" in stats["errors"][2]["error"]
+    assert stats["rows_per_sec"] > 0
+
+    users = read_users(out)
+    assert [u["id"] for u in users] == ["u1", "u2"]
+    assert all(u["chart"]["v"] == CHART_VERSION for u in users)
+    assert users[1]["bioMetrics"]["latitude"] == 40.7128
+    assert users[1]["chart"]["tz"] == "America/New_York"
+
+def test_unresolved_locations_are_looked_up_and_reported_once(tmp_path):
+    set_geocode_cache(GeocodeCache())
+    lines = [json.dumps(user(f"n{i}", birthLocation="Nowhere at all")) for i in range(5)]
+    lines += [json.dumps(user(f"b{i}", birthLocation="Berlin")) for i in range(3)]
+    out = tmp_path / "users.ndjson"
+    writer = NdjsonUserWriter(str(out))
+    found = type("Location", (), {"latitude": 52.52, "longitude": 13.40})()
+    try:
+        with patch.object(get_calculator().geolocator, "geocode",
+                          side_effect=lambda loc: found if loc == "Berlin" else None) as geocode:
+            stats = run(io.StringIO("\n".join(lines)), "ndjson", writer, workers=1, chunk_size=3, geocode_rate=1000)
+    finally:
+        writer.close()
+        set_geocode_cache(None)
+
+    # One lookup per distinct location: the failure isn't retried in later chunks, Berlin is then cached
+    assert sorted(c.args[0] for c in geocode.call_args_list) == ["Berlin", "Nowhere at all"]
+    assert stats["imported"] == 3 and stats["failed"] == 5
+    assert [e["line"] for e in stats["errors"]] == [1]
+    assert stats["unresolved_locations"] == {"Nowhere at all": 5}
+
+def test_csv_rows_are_flat(tmp_path):
+    text = (
+        "userId,email,name,birthDate,birthTime,birthLocation,latitude,longitude,humanDesignType,enneagram\n"
+        "c1,c1@example.com,C One,1985-01-02,,Berlin,52.52,13.40,Generator,\n"
+        "c2,c2@example.com,C Two,1985-01-02,25:99,Berlin,52.52,13.40,,\n"
+    )
+    out = tmp_path / "users.ndjson"
+    writer = NdjsonUserWriter(str(out))
+    try:
+        stats = run(io.StringIO(text), "csv", writer, workers=1)
+    finally:
+        writer.close()
+
+    assert stats["imported"] == 1 and stats["errors"][0]["line"] == 3
+    imported = read_users(out)[0]
+    assert imported["bioMetrics"]["humanDesignType"] == "Generator"
+    assert imported["bioMetrics"]["birthTime"] is None
+    assert imported["chart"]["tz"] == "Europe/Berlin"
+
+def test_geocode_cache_persists_in_sqlite(tmp_path):
+    path = str(tmp_path / "geocode.db")
+    GeocodeCache(path).put("Berlin,  Germany", 52.52, 13.40)
+    cache = GeocodeCache(path)
+    assert cache.get("berlin, germany") == (52.52, 13.40)
+    assert cache.get("Paris") is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+def test_geocode_memory_is_an_lru_over_sqlite(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geocode.db"), max_entries=2)
+    cache.put("Berlin", 52.52, 13.40)
+    cache.put("Paris", 48.85, 2.35)
+    cache.get("Berlin")
+    cache.put("Rome", 41.90, 12.50)
+    # Paris was least recently used; SQLite still has it
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+    assert "paris" not in cache._memory
+    assert cache.get("Paris") == (48.85, 2.35)
+    assert cache.stats()["evictions"] == 2
+
+def test_api_import_runs_as_a_background_job(tmp_path):
+    jobs = BackgroundJobs()
+    set_import_jobs(jobs)
+    writer = NdjsonUserWriter(str(tmp_path / "users.ndjson"))
+    body = "\n".join(json.dumps(user(f"api{i}", birthLocation="Berlin", latitude=52.52, longitude=13.40))
+                     for i in range(3)) + "\n{not json"
+    auth = MagicMock()
+    auth.verify_id_token.side_effect = lambda token: {"admin": token == "admin-token", "email": "x@example.com"}
+    admin = {"Authorization": "Bearer admin-token"}
+    client = TestClient(app)
+    try:
+        with patch.object(user_import, "FirestoreUserWriter", lambda: writer), patch.object(users_api, "auth", auth):
+            assert client.post("/api/users/import", content=body).status_code == 401
+            assert client.post("/api/users/import", content=body,
+                               headers={"Authorization": "Bearer user-token"}).status_code == 403
+            with patch.object(users_api, "IMPORT_MAX_BYTES", 10):
+                assert client.post("/api/users/import", content=body, headers=admin).status_code == 413
+
+            response = client.post("/api/users/import?format=ndjson", content=body, headers=admin)
+            assert response.status_code == 202
+            jobs.wait(response.json()["jobId"])
+            job = client.get(response.json()["statusUrl"], headers=admin).json()
+            assert client.get("/api/users/import/unknown", headers=admin).status_code == 404
+        assert job["status"] == "done"
+        assert job["progress"]["rows"] == 4
+        assert job["result"]["imported"] == 3 and job["result"]["failed"] == 1
+    finally:
+        set_import_jobs(None)
+        jobs.shutdown()
+        writer.close()
+
+def test_spooling_counts_bytes_without_a_content_length(tmp_path):
+    async def body():
+        for _ in range(4):
+            yield b"x" * 10
+    request = MagicMock()
+    request.stream = body
+    path = str(tmp_path / "spool")
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(users_api.spool_body(request, path, limit=25))
+    assert e.value.status_code == 413
+    asyncio.run(users_api.spool_body(request, path, limit=40))
+    assert (tmp_path / "spool").read_bytes() == b"x" * 40
+
+def test_finished_jobs_expire_and_the_table_is_bounded():
+    now = [0.0]
+    jobs = BackgroundJobs(max_jobs=2, ttl=60, clock=lambda: now[0])
+    first = jobs.submit(lambda progress: {"n": 1})
+    jobs.wait(first)
+    second = jobs.submit(lambda progress: {"n": 2})
+    jobs.wait(second)
+    # Full: the oldest finished job makes room
+    third = jobs.submit(lambda progress: {"n": 3})
+    jobs.wait(third)
+    assert jobs.get(first) is None and jobs.get(second)["result"] == {"n": 2}
+    now[0] = 61
+    assert jobs.get(third) is None
+    jobs.shutdown()
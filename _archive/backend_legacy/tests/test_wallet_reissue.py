@@ -0,0 +1,46 @@
+import json
+import tarfile
+from app.jobs import wallet_reissue
+from app.jobs.checkpoint import Checkpoint
+from app.core.user_store import LocalUserSource
+
+def _write_users(path, count):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "id": f"user_{i}",
+                "name": f"User {i}",
+                "bioMetrics": {"birthDate": f"19{80 + i}-03-0{i + 1}", "birthTime": "09:30",
+                               "birthLocation": "Berlin", "latitude": 52.52, "longitude": 13.40}
+            }) + "\n")
+
+def test_reissue_resumes_from_checkpoint(tmp_path):
+    users = tmp_path / "users.ndjson"
+    _write_users(users, 3)
+    ckpt = tmp_path / "reissue.ckpt"
+    # Simulate an interrupted run that already finished user_0
+    ckpt.write_text("user_0\n")
+
+    out = tmp_path / "passes"
+    checkpoint = Checkpoint(str(ckpt))
+    stats = wallet_reissue.run(LocalUserSource(str(users), chunk_size=2), wallet_reissue.DirectoryOutput(str(out)), checkpoint, workers=2)
+    checkpoint.close()
+
+    assert stats["issued"] == 2 and stats["skipped"] == 1 and stats["failed"] == 0
+    assert sorted(p.name for p in out.iterdir()) == ["user_1.pkpass", "user_2.pkpass"]
+    assert set(ckpt.read_text().split()) == {"user_0", "user_1", "user_2"}
+
+    # A second run has nothing left to do
+    stats = wallet_reissue.run(LocalUserSource(str(users)), wallet_reissue.DirectoryOutput(str(out)), Checkpoint(str(ckpt)), workers=1)
+    assert stats["issued"] == 0 and stats["skipped"] == 3
+
+def test_reissue_to_tar(tmp_path):
+    users = tmp_path / "users.ndjson"
+    _write_users(users, 2)
+    archive = tmp_path / "passes.tar"
+
+    stats = wallet_reissue.main(["--source", str(users), "--out", str(archive), "--workers", "1"])
+
+    assert stats["issued"] == 2
+    with tarfile.open(archive) as tar:
+        assert sorted(tar.getnames()) == ["user_0.pkpass", "user_1.pkpass"]
@@ -0,0 +1,89 @@
+import time
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.write_behind import Write, WriteBehind, WriteBufferFull, set_write_behind
+from tests.fake_firestore import FakeFirestore
+
+def writes(db, n, prefix="e"):
+    return [Write(db.collection("events").document(f"{prefix}{i}"), {"n": i}) for i in range(n)]
+
+def test_flushes_full_batches_and_keeps_groups_together():
+    db = FakeFirestore()
+    buffer = WriteBehind(batch_size=10, flush_interval=60)
+    try:
+        for g in range(6):
+            buffer.enqueue(db, writes(db, 3, prefix=f"g{g}-"))
+        # 18 writes, 10 per batch, groups of 3 never split: 9 + 9
+        assert buffer.flush(timeout=5)
+        assert db.commits == [9, 9]
+        assert len(db.docs) == 18
+    finally:
+        buffer.close()
+
+def test_flushes_on_interval():
+    db = FakeFirestore()
+    buffer = WriteBehind(batch_size=500, flush_interval=0.05)
+    try:
+        buffer.enqueue(db, writes(db, 2))
+        deadline = time.monotonic() + 5
+        while not db.commits and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert db.commits == [2]
+    finally:
+        buffer.close()
+
+def test_retries_are_idempotent():
+    db = FakeFirestore(fail_commits=2)
+    buffer = WriteBehind(batch_size=500, flush_interval=0, retry_backoff=0.001)
+    try:
+        buffer.enqueue(db, writes(db, 5))
+        assert buffer.flush(timeout=5)
+        stats = buffer.stats()
+        assert stats["retries"] == 2 and stats["committed"] == 5 and stats["dropped"] == 0
+        assert len(db.docs) == 5
+    finally:
+        buffer.close()
+
+def test_drops_after_max_retries():
+    db = FakeFirestore(fail_commits=10)
+    buffer = WriteBehind(flush_interval=0, max_retries=1, retry_backoff=0.001)
+    try:
+        buffer.enqueue(db, writes(db, 3))
+        assert buffer.flush(timeout=5)
+        assert buffer.stats()["dropped"] == 3 and not db.docs
+    finally:
+        buffer.close()
+
+def test_bounded_queue_and_flush_on_close():
+    db = FakeFirestore(latency=0.2)
+    buffer = WriteBehind(batch_size=5, flush_interval=0, max_queue=10)
+    buffer.enqueue(db, writes(db, 5, prefix="a"))
+    buffer.enqueue(db, writes(db, 5, prefix="b"))
+    with pytest.raises(WriteBufferFull):
+        buffer.enqueue(db, writes(db, 1, prefix="c"))
+    buffer.close()
+    assert len(db.docs) == 10
+
+def test_share_and_revoke_are_acknowledged_then_flushed():
+    db = FakeFirestore()
+    buffer = WriteBehind(flush_interval=60)
+    set_write_behind(buffer)
+    try:
+        with patch("app.api.endpoints.therapist.firestore") as mock_firestore:
+            mock_firestore.client.return_value = db
+            client = TestClient(app)
+            share = client.post("/api/therapist/share", json={
+                "user_id": "u1", "therapist_email": "doctor@example.com"
+            }).json()
+            # Acknowledged before anything reached Firestore
+            assert not db.docs
+            assert client.post("/api/therapist/revoke", json={"user_id": "u1", "share_id": share["share_id"]}).json()["status"] == "success"
+        assert buffer.flush(timeout=5)
+        root = db.docs[f"therapist_shares/{share['share_id']}"]
+        assert root["user_id"] == "u1" and root["active"] is False
+        assert db.docs[f"users/u1/shares/{share['share_id']}"]["revoked_at"] is not None
+    finally:
+        set_write_behind(None)
+        buffer.close()